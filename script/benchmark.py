@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the decoder hot path.
+
+Packets are synthesised in memory (no SDR or ZMQ needed), so results only
+reflect CPU cost on this machine.
+
+Usage:
+    python3 benchmark.py decrypt [--keys 1,8,32,128] [--packets 2000]
+    python3 benchmark.py parse [--packets 100000]
+
+Example:
+    python3 benchmark.py decrypt --keys 1,16,64
+"""
+
+import argparse
+import base64
+import os
+import struct
+import time
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from meshtastic import mesh_pb2
+
+from keystore import KeyStore
+from message import Message
+from packet import Packet
+from util import b64_to_hex, msb2lsb, hex_to_binary
+
+
+def make_packet(key_raw, channel_hash, text=b"benchmark", src=0x1234abcd, packet_id=None):
+    """Build an on-air frame (header + AES-CTR payload) the way firmware does."""
+    if packet_id is None:
+        packet_id = struct.unpack("<I", os.urandom(4))[0]
+
+    data = mesh_pb2.Data()
+    data.portnum = 1
+    data.payload = text
+    plaintext = data.SerializeToString()
+
+    nonce = struct.pack("<QQ", packet_id, src)
+    encryptor = Cipher(algorithms.AES(key_raw), modes.CTR(nonce)).encryptor()
+    payload = encryptor.update(plaintext) + encryptor.finalize()
+
+    header = struct.pack("<IIIBBH", 0xffffffff, src, packet_id, 0x63, int(channel_hash, 16), 0)
+    return header + payload
+
+
+def legacy_decrypt(packet, key):
+    """Packet.decrypt() before keys were pre-built, kept for comparison: decodes the
+    base64 key and builds a cipher per attempt, then decrypts and parses in full."""
+    for nonce, payload in ((struct.pack("<QQ", packet.packet_id, packet.src), packet.data),
+                           (struct.pack("<I", packet.packet_id) + bytes(packet.data[-4:]) + struct.pack("<Q", packet.src),
+                            packet.data[:-4])):
+        try:
+            decryptor = Cipher(algorithms.AES(b64_to_hex(key)), modes.CTR(nonce)).decryptor()
+            protobuf = decryptor.update(payload) + decryptor.finalize()
+            data = mesh_pb2.Data()
+            data.ParseFromString(protobuf)
+            packet.message = Message(packet.get_source(), packet.get_dest(), data)
+            return True
+        except Exception:
+            pass
+    raise Exception("Unable to decrypt!")
+
+
+def timed(fn, frames):
+    start = time.perf_counter()
+    for frame in frames:
+        fn(frame)
+    return (time.perf_counter() - start) / len(frames) * 1e6
+
+
+def bench_decrypt(key_counts, packet_count):
+    print(f"Per-packet decrypt cost, {packet_count} packets, matching key loaded last (us/packet)")
+    print(f"{'keys':>6} {'b64 per attempt':>16} {'pre-built':>10} {'indexed':>10}")
+
+    for count in key_counts:
+        b64_keys = [base64.b64encode(os.urandom(16)).decode("ascii") for _ in range(count)]
+
+        # Every key on its own channel name, so the index has one key per hash
+        indexed = KeyStore(fallback=True)
+        flat = KeyStore(fallback=True)
+        for i, b64 in enumerate(b64_keys):
+            indexed.add(b64, [f"ch{i}"])
+            flat.add(b64, [])
+
+        target = indexed.keys[-1]
+        channel_hash = indexed.add(target.b64, [f"ch{count - 1}"])[0]
+        frames = [make_packet(target.raw, channel_hash) for _ in range(packet_count)]
+
+        def legacy(frame):
+            packet = Packet(frame)
+            for b64 in b64_keys:
+                try:
+                    legacy_decrypt(packet, b64)
+                    return
+                except Exception:
+                    continue
+
+        legacy_us = timed(legacy, frames)
+        flat_us = timed(lambda frame: flat.decrypt(Packet(frame)), frames)
+        indexed_us = timed(lambda frame: indexed.decrypt(Packet(frame)), frames)
+
+        print(f"{count:>6} {legacy_us:>16.1f} {flat_us:>10.1f} {indexed_us:>10.1f}")
+
+
+def legacy_parse(frame):
+    """The hex-string header parser Packet used before struct unpacking, kept for comparison."""
+    h = frame.hex()
+    fields = {
+        'dest': h[0:8], 'src': h[8:16], 'packet_id': h[16:24], 'flags': h[24:26],
+        'channel_hash': h[26:28], 'reserved': h[28:32], 'data': h[32:],
+    }
+    return {name: hex_to_binary(value) for name, value in fields.items()}
+
+
+def bench_parse(packet_count, reads=4):
+    """Header parse plus the ID getter calls a decoded packet makes (each ID read `reads` times)."""
+    key = KeyStore().add(base64.b64encode(os.urandom(16)).decode("ascii"), ["bench"])[0]
+    frames = [make_packet(os.urandom(16), key, text=os.urandom(64)) for _ in range(packet_count)]
+
+    def legacy(frame):
+        parsed = legacy_parse(frame)
+        for _ in range(reads):
+            msb2lsb(parsed["src"].hex())
+            msb2lsb(parsed["dest"].hex())
+            msb2lsb(parsed["packet_id"].hex())
+            parsed["channel_hash"].hex()
+            int(parsed["flags"].hex(), 16)
+
+    def current(frame):
+        packet = Packet(frame)
+        for _ in range(reads):
+            packet.get_source()
+            packet.get_dest()
+            packet.get_packet_id()
+            packet.get_channel_hash()
+            packet.flags
+
+    legacy_us = timed(legacy, frames)
+    current_us = timed(current, frames)
+
+    print(f"Header parse + {reads}x ID reads, {packet_count} packets (us/packet)")
+    print(f"{'hex strings':>12} {'struct':>10} {'speedup':>8}")
+    print(f"{legacy_us:>12.2f} {current_us:>10.2f} {legacy_us / current_us:>7.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decoder micro-benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("decrypt", help="Per-packet decrypt cost against loaded key count")
+    p.add_argument("--keys", default="1,8,32,128", help="Comma separated key counts (default 1,8,32,128)")
+    p.add_argument("--packets", type=int, default=2000, help="Packets per run (default 2000)")
+
+    p = sub.add_parser("parse", help="Header parse and ID getter cost")
+    p.add_argument("--packets", type=int, default=100000, help="Packets per run (default 100000)")
+
+    args = parser.parse_args()
+
+    if args.bench == "decrypt":
+        bench_decrypt([int(k) for k in args.keys.split(",")], args.packets)
+    elif args.bench == "parse":
+        bench_parse(args.packets)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,119 @@
+import json
 import os
+import re
 import sqlite3
+import time
 from datetime import datetime, timezone
 
 _conn = None
 
-def init_db(debug=False):
-    global _conn
+# Group commit: packets_raw/traffic rows are queued and written with executemany in one
+# transaction once COMMIT_ROWS rows are queued or the oldest pending write is COMMIT_MS old.
+COMMIT_ROWS = 100
+COMMIT_MS = 1000
+
+_commit_rows = COMMIT_ROWS
+_commit_ms = COMMIT_MS
+_raw_rows = []
+_traffic_rows = []
+_pending_since = None
+
+# Write-through cache of node names, seeded from nodes in init_db, so resolving names
+# never queries SQLite. last_seen bumps for known nodes are coalesced and written at
+# most once per LAST_SEEN_INTERVAL seconds per node.
+LAST_SEEN_INTERVAL = 60
+
+_last_seen_interval = LAST_SEEN_INTERVAL
+_node_names = {}
+_last_seen_pending = {}
+_last_seen_written = {}
+
+# Optional retention.Retention, stepped one batch at a time when no writes are queued
+_retention = None
+
+# Compact row encoding (schema version 3): node and packet ids are stored as their uint32
+# values, ts as epoch milliseconds UTC, msg_type as an id from msg_types and key_used as
+# one of KEY_USED. The traffic_text view shows traffic the old way for ad-hoc queries.
+KEY_USED = {"public": 1, "private": 2}
+
+_msg_type_ids = {}
+
+_RAW_INSERT = """
+    INSERT INTO packets_raw (ts, source_id, dest_id, packet_id,
+                             channel_hash, flags, hop_limit, hop_start,
+                             want_ack, via_mqtt, packet_size, decrypted,
+                             key_used, port, preset)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_TRAFFIC_INSERT = """
+    INSERT INTO traffic (ts, source_id, source_name, dest_id, dest_name,
+                         packet_id, channel_hash, channel_name, port_num,
+                         msg_type, data, key_used, via_mqtt, hop_start, hop_limit,
+                         port, preset)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def init_db(debug=False, commit_rows=COMMIT_ROWS, commit_ms=COMMIT_MS, last_seen_interval=LAST_SEEN_INTERVAL,
+            retention=None):
+    global _conn, _commit_rows, _commit_ms, _last_seen_interval, _retention
     db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "mesh.db")
 
     if debug:
         print(f"[DEBUG] Opening database: {db_path}")
 
+    _commit_rows = max(1, commit_rows)
+    _commit_ms = max(0, commit_ms)
+    _last_seen_interval = last_seen_interval
+    _retention = retention if retention is not None and retention.enabled() else None
+
     _conn = sqlite3.connect(db_path, timeout=5)
     _conn.execute("PRAGMA journal_mode=WAL")
     _conn.execute("PRAGMA busy_timeout=5000")
 
-    _conn.executescript("""
+    migrate(debug)
+
+    _node_names.clear()
+    _last_seen_pending.clear()
+    _last_seen_written.clear()
+    for node_id, long_name, short_name in _conn.execute("SELECT node_id, long_name, short_name FROM nodes"):
+        _node_names[node_id] = (long_name, short_name)
+
+    _msg_type_ids.clear()
+    for type_id, name in _conn.execute("SELECT id, name FROM msg_types"):
+        _msg_type_ids[name] = type_id
+
+    if debug:
+        print(f"[DEBUG] Cached {len(_node_names)} node names")
+
+
+# Schema migrations. Each runs once, in its own transaction, and is recorded in
+# schema_version. Schema changes go in a new migration at the end of MIGRATIONS;
+# never edit one that has shipped.
+
+def _add_missing_columns(conn, table, columns, debug=False):
+    existing = [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+    for column, ddl in columns:
+        if column not in existing:
+            if debug:
+                print(f"[DEBUG] Migrating: {ddl}")
+            conn.execute(ddl)
+
+def _run_script(conn, sql):
+    """Execute a multi-statement script in the current transaction.
+
+    Unlike executescript() this doesn't COMMIT first, so a migration stays atomic."""
+    statement = ""
+    for line in sql.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ""
+    if statement.strip():
+        conn.execute(statement)
+
+def _migration_1_baseline(conn, debug=False):
+    _run_script(conn, """
         CREATE TABLE IF NOT EXISTS nodes (
             node_id     TEXT PRIMARY KEY,
             long_name   TEXT,
@@ -43,7 +141,9 @@ def init_db(debug=False):
             key_used     TEXT,
             via_mqtt     INTEGER DEFAULT 0,
             hop_start    INTEGER,
-            hop_limit    INTEGER
+            hop_limit    INTEGER,
+            port         INTEGER,
+            preset       TEXT
         );
 
         CREATE TABLE IF NOT EXISTS packets_raw (
@@ -60,26 +160,707 @@ def init_db(debug=False):
             via_mqtt     INTEGER,
             packet_size  INTEGER,
             decrypted    INTEGER NOT NULL DEFAULT 0,
-            key_used     TEXT
+            key_used     TEXT,
+            port         INTEGER,
+            preset       TEXT
         );
     """)
 
-    # Auto-migrate existing databases: add columns if missing
-    _migrations = [
-        ("traffic", "via_mqtt", "ALTER TABLE traffic ADD COLUMN via_mqtt INTEGER DEFAULT 0"),
-        ("traffic", "hop_start", "ALTER TABLE traffic ADD COLUMN hop_start INTEGER"),
-        ("traffic", "hop_limit", "ALTER TABLE traffic ADD COLUMN hop_limit INTEGER"),
-        ("packets_raw", "hop_start", "ALTER TABLE packets_raw ADD COLUMN hop_start INTEGER"),
-    ]
-    for table, column, ddl in _migrations:
-        cols = [row[1] for row in _conn.execute(f"PRAGMA table_info({table})").fetchall()]
-        if column not in cols:
-            if debug:
-                print(f"[DEBUG] Migrating: {ddl}")
-            _conn.execute(ddl)
+    # Databases from before schema_version existed may be missing later columns
+    _add_missing_columns(conn, "traffic", [
+        ("via_mqtt", "ALTER TABLE traffic ADD COLUMN via_mqtt INTEGER DEFAULT 0"),
+        ("hop_start", "ALTER TABLE traffic ADD COLUMN hop_start INTEGER"),
+        ("hop_limit", "ALTER TABLE traffic ADD COLUMN hop_limit INTEGER"),
+        ("port", "ALTER TABLE traffic ADD COLUMN port INTEGER"),
+        ("preset", "ALTER TABLE traffic ADD COLUMN preset TEXT"),
+    ], debug)
+    _add_missing_columns(conn, "packets_raw", [
+        ("hop_start", "ALTER TABLE packets_raw ADD COLUMN hop_start INTEGER"),
+        ("port", "ALTER TABLE packets_raw ADD COLUMN port INTEGER"),
+        ("preset", "ALTER TABLE packets_raw ADD COLUMN preset TEXT"),
+    ], debug)
+
+def _migration_2_webui_indexes(conn, debug=False):
+    # One index per webui access path (webui/query_plans.py checks they are used):
+    #   24h windows                          -> (timestamp)
+    #   latest row of a msg_type per node    -> (msg_type, source_id, id)
+    #   per-node history and last activity   -> (source_id, timestamp)
+    #   traffic addressed to a watched node  -> (dest_id, id)
+    #   rebroadcast/duplicate counts         -> packets_raw(packet_id)
+    _run_script(conn, """
+        CREATE INDEX IF NOT EXISTS idx_traffic_timestamp ON traffic(timestamp);
+        CREATE INDEX IF NOT EXISTS idx_traffic_type_source_id ON traffic(msg_type, source_id, id);
+        CREATE INDEX IF NOT EXISTS idx_traffic_source_timestamp ON traffic(source_id, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_traffic_dest_id ON traffic(dest_id, id);
+        CREATE INDEX IF NOT EXISTS idx_packets_raw_timestamp ON packets_raw(timestamp);
+        CREATE INDEX IF NOT EXISTS idx_packets_raw_packet_id ON packets_raw(packet_id);
+    """)
+
+def _legacy_epoch_ms(timestamp):
+    """Epoch ms for a version 1 timestamp: str(datetime.now()) local time, or ISO 8601 with offset."""
+    try:
+        return _epoch_ms(datetime.fromisoformat(timestamp))
+    except (TypeError, ValueError):
+        return 0
+
+def _legacy_uint32(hex_id):
+    try:
+        return int(hex_id, 16)
+    except (TypeError, ValueError):
+        return None
+
+def _migration_3_compact_rows(conn, debug=False):
+    # Rebuild traffic and packets_raw with the compact encoding, converting rows in place.
+    conn.create_function("legacy_epoch_ms", 1, _legacy_epoch_ms, deterministic=True)
+    conn.create_function("legacy_uint32", 1, _legacy_uint32, deterministic=True)
+
+    _run_script(conn, """
+        CREATE TABLE msg_types (
+            id   INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        );
+        INSERT INTO msg_types (name) SELECT DISTINCT msg_type FROM traffic ORDER BY msg_type;
+
+        CREATE TABLE traffic_compact (
+            id           INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts           INTEGER NOT NULL,
+            source_id    INTEGER,
+            source_name  TEXT,
+            dest_id      INTEGER,
+            dest_name    TEXT,
+            packet_id    INTEGER,
+            channel_hash TEXT,
+            channel_name TEXT,
+            port_num     INTEGER,
+            msg_type     INTEGER NOT NULL REFERENCES msg_types(id),
+            data         TEXT,
+            key_used     INTEGER,
+            via_mqtt     INTEGER DEFAULT 0,
+            hop_start    INTEGER,
+            hop_limit    INTEGER,
+            port         INTEGER,
+            preset       TEXT
+        );
+        INSERT INTO traffic_compact
+        SELECT t.id, legacy_epoch_ms(t.timestamp), legacy_uint32(t.source_id), t.source_name,
+               legacy_uint32(t.dest_id), t.dest_name, legacy_uint32(t.packet_id),
+               t.channel_hash, t.channel_name, t.port_num, m.id, t.data,
+               CASE t.key_used WHEN 'public' THEN 1 WHEN 'private' THEN 2 END,
+               t.via_mqtt, t.hop_start, t.hop_limit, t.port, t.preset
+        FROM traffic t JOIN msg_types m ON m.name = t.msg_type;
+        DROP TABLE traffic;
+        ALTER TABLE traffic_compact RENAME TO traffic;
+
+        CREATE TABLE packets_raw_compact (
+            id           INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts           INTEGER NOT NULL,
+            source_id    INTEGER,
+            dest_id      INTEGER,
+            packet_id    INTEGER,
+            channel_hash TEXT,
+            flags        TEXT,
+            hop_limit    INTEGER,
+            hop_start    INTEGER,
+            want_ack     INTEGER,
+            via_mqtt     INTEGER,
+            packet_size  INTEGER,
+            decrypted    INTEGER NOT NULL DEFAULT 0,
+            key_used     INTEGER,
+            port         INTEGER,
+            preset       TEXT
+        );
+        INSERT INTO packets_raw_compact
+        SELECT id, legacy_epoch_ms(timestamp), legacy_uint32(source_id), legacy_uint32(dest_id),
+               legacy_uint32(packet_id), channel_hash, flags, hop_limit, hop_start,
+               want_ack, via_mqtt, packet_size, decrypted,
+               CASE key_used WHEN 'public' THEN 1 WHEN 'private' THEN 2 END,
+               port, preset
+        FROM packets_raw;
+        DROP TABLE packets_raw;
+        ALTER TABLE packets_raw_compact RENAME TO packets_raw;
+
+        CREATE INDEX idx_traffic_ts ON traffic(ts);
+        CREATE INDEX idx_traffic_type_source_id ON traffic(msg_type, source_id, id);
+        CREATE INDEX idx_traffic_source_ts ON traffic(source_id, ts);
+        CREATE INDEX idx_traffic_dest_id ON traffic(dest_id, id);
+        CREATE INDEX idx_packets_raw_ts ON packets_raw(ts);
+        CREATE INDEX idx_packets_raw_packet_id ON packets_raw(packet_id);
+
+        CREATE VIEW traffic_text AS
+        SELECT t.id,
+               strftime('%Y-%m-%d %H:%M:%f', t.ts / 1000.0, 'unixepoch', 'localtime') AS timestamp,
+               printf('%08x', t.source_id) AS source_id, t.source_name,
+               printf('%08x', t.dest_id) AS dest_id, t.dest_name,
+               printf('%08x', t.packet_id) AS packet_id,
+               t.channel_hash, t.channel_name, t.port_num, m.name AS msg_type, t.data,
+               CASE t.key_used WHEN 1 THEN 'public' WHEN 2 THEN 'private' END AS key_used,
+               t.via_mqtt, t.hop_start, t.hop_limit, t.port, t.preset
+        FROM traffic t LEFT JOIN msg_types m ON m.id = t.msg_type;
+    """)
+
+# node_summary keeps the per-node facts the dashboard polls for, so reading them is one
+# row per node however long the history is. AFTER INSERT triggers on traffic keep it
+# current inside the inserting transaction. Each trigger upserts, so their firing order
+# doesn't matter. *_id columns point at the node's latest traffic row of that kind.
+_TELEMETRY_TYPES = ("device", "environment", "power", "air_quality", "local_stats", "health")
+
+def _migration_4_node_summary(conn, debug=False):
+    for name in ("NODEINFO_APP", "POSITION_APP", "TELEMETRY_APP"):
+        conn.execute("INSERT OR IGNORE INTO msg_types (name) VALUES (?)", (name,))
+    ids = dict(conn.execute("SELECT name, id FROM msg_types").fetchall())
+    nodeinfo, position, telemetry = ids["NODEINFO_APP"], ids["POSITION_APP"], ids["TELEMETRY_APP"]
+
+    rf = "(CASE WHEN {0}via_mqtt = 0 THEN 1 ELSE 0 END)"
+    mqtt = "(CASE WHEN {0}via_mqtt = 1 THEN 1 ELSE 0 END)"
+    direct_rf = "(CASE WHEN {0}via_mqtt = 0 AND {0}hop_start > 0 AND {0}hop_start = {0}hop_limit THEN 1 ELSE 0 END)"
+
+    telemetry_columns = "".join(f"            {t}_id INTEGER,\n" for t in _TELEMETRY_TYPES)
+    telemetry_names = ", ".join(f"{t}_id" for t in _TELEMETRY_TYPES)
+    telemetry_values = "".join(
+        f"                    CASE WHEN json_extract(NEW.data, '$.telemetry_type') = '{t}' THEN NEW.id END,\n"
+        for t in _TELEMETRY_TYPES)
+    telemetry_sets = "".join(
+        f"                {t}_id = COALESCE(excluded.{t}_id, {t}_id),\n" for t in _TELEMETRY_TYPES)
+    telemetry_backfill = "".join(
+        f"               MAX(CASE WHEN msg_type = {telemetry} AND json_valid(data) "
+        f"AND json_extract(data, '$.telemetry_type') = '{t}' THEN id END),\n"
+        for t in _TELEMETRY_TYPES)
+
+    _run_script(conn, f"""
+        CREATE TABLE node_summary (
+            node_id             INTEGER PRIMARY KEY,
+            packets             INTEGER NOT NULL DEFAULT 0,
+            rf_count            INTEGER NOT NULL DEFAULT 0,
+            mqtt_count          INTEGER NOT NULL DEFAULT 0,
+            direct_rf_count     INTEGER NOT NULL DEFAULT 0,
+            last_ts             INTEGER,
+            last_rf             INTEGER,
+            last_mqtt           INTEGER,
+            last_nodeinfo_rf    INTEGER,
+            last_nodeinfo_mqtt  INTEGER,
+            position_id         INTEGER,
+{telemetry_columns}            utilization_id      INTEGER
+        );
+        CREATE INDEX idx_node_summary_last_rf ON node_summary(last_rf);
+        CREATE INDEX idx_node_summary_last_mqtt ON node_summary(last_mqtt);
+
+        INSERT INTO node_summary
+        SELECT source_id, COUNT(*),
+               SUM({rf.format("")}), SUM({mqtt.format("")}), SUM({direct_rf.format("")}),
+               MAX(ts), MAX(CASE WHEN via_mqtt = 0 THEN ts END), MAX(CASE WHEN via_mqtt = 1 THEN ts END),
+               MAX(CASE WHEN msg_type = {nodeinfo} AND via_mqtt = 0 THEN ts END),
+               MAX(CASE WHEN msg_type = {nodeinfo} AND via_mqtt = 1 THEN ts END),
+               MAX(CASE WHEN msg_type = {position} THEN id END),
+{telemetry_backfill}               MAX(CASE WHEN msg_type = {telemetry} AND json_valid(data)
+                        AND json_extract(data, '$.channel_utilization') IS NOT NULL THEN id END)
+        FROM traffic WHERE source_id IS NOT NULL GROUP BY source_id;
+
+        CREATE TRIGGER traffic_node_summary AFTER INSERT ON traffic
+        WHEN NEW.source_id IS NOT NULL
+        BEGIN
+            INSERT INTO node_summary (node_id, packets, rf_count, mqtt_count, direct_rf_count,
+                                      last_ts, last_rf, last_mqtt)
+            VALUES (NEW.source_id, 1, {rf.format("NEW.")}, {mqtt.format("NEW.")}, {direct_rf.format("NEW.")},
+                    NEW.ts,
+                    CASE WHEN NEW.via_mqtt = 0 THEN NEW.ts END,
+                    CASE WHEN NEW.via_mqtt = 1 THEN NEW.ts END)
+            ON CONFLICT(node_id) DO UPDATE SET
+                packets         = packets + 1,
+                rf_count        = rf_count + excluded.rf_count,
+                mqtt_count      = mqtt_count + excluded.mqtt_count,
+                direct_rf_count = direct_rf_count + excluded.direct_rf_count,
+                last_ts         = excluded.last_ts,
+                last_rf         = COALESCE(excluded.last_rf, last_rf),
+                last_mqtt       = COALESCE(excluded.last_mqtt, last_mqtt);
+        END;
+
+        CREATE TRIGGER traffic_node_summary_nodeinfo AFTER INSERT ON traffic
+        WHEN NEW.source_id IS NOT NULL AND NEW.msg_type = {nodeinfo}
+        BEGIN
+            INSERT INTO node_summary (node_id, last_nodeinfo_rf, last_nodeinfo_mqtt)
+            VALUES (NEW.source_id,
+                    CASE WHEN NEW.via_mqtt = 0 THEN NEW.ts END,
+                    CASE WHEN NEW.via_mqtt = 1 THEN NEW.ts END)
+            ON CONFLICT(node_id) DO UPDATE SET
+                last_nodeinfo_rf   = COALESCE(excluded.last_nodeinfo_rf, last_nodeinfo_rf),
+                last_nodeinfo_mqtt = COALESCE(excluded.last_nodeinfo_mqtt, last_nodeinfo_mqtt);
+        END;
+
+        CREATE TRIGGER traffic_node_summary_position AFTER INSERT ON traffic
+        WHEN NEW.source_id IS NOT NULL AND NEW.msg_type = {position}
+        BEGIN
+            INSERT INTO node_summary (node_id, position_id) VALUES (NEW.source_id, NEW.id)
+            ON CONFLICT(node_id) DO UPDATE SET position_id = excluded.position_id;
+        END;
+
+        CREATE TRIGGER traffic_node_summary_telemetry AFTER INSERT ON traffic
+        WHEN NEW.source_id IS NOT NULL AND NEW.msg_type = {telemetry} AND json_valid(NEW.data)
+        BEGIN
+            INSERT INTO node_summary (node_id, {telemetry_names}, utilization_id)
+            VALUES (NEW.source_id,
+{telemetry_values}                    CASE WHEN json_extract(NEW.data, '$.channel_utilization') IS NOT NULL THEN NEW.id END)
+            ON CONFLICT(node_id) DO UPDATE SET
+{telemetry_sets}                utilization_id = COALESCE(excluded.utilization_id, utilization_id);
+        END;
+    """)
+
+def _migration_5_rollups(conn, debug=False):
+    # Aggregates of rows retention.py has pruned, and views that add them back to the
+    # live rows. Rollup keys are NOT NULL (key_used 0 and hop_limit -1 mean unknown).
+    _run_script(conn, """
+        CREATE TABLE traffic_hourly (
+            bucket     INTEGER NOT NULL,
+            source_id  INTEGER NOT NULL,
+            msg_type   INTEGER NOT NULL,
+            via_mqtt   INTEGER NOT NULL,
+            packets    INTEGER NOT NULL,
+            PRIMARY KEY (bucket, source_id, msg_type, via_mqtt)
+        ) WITHOUT ROWID;
+        CREATE TABLE traffic_daily (
+            bucket     INTEGER NOT NULL,
+            source_id  INTEGER NOT NULL,
+            msg_type   INTEGER NOT NULL,
+            via_mqtt   INTEGER NOT NULL,
+            packets    INTEGER NOT NULL,
+            PRIMARY KEY (bucket, source_id, msg_type, via_mqtt)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE packets_raw_hourly (
+            bucket     INTEGER NOT NULL,
+            decrypted  INTEGER NOT NULL,
+            key_used   INTEGER NOT NULL,
+            hop_limit  INTEGER NOT NULL,
+            via_mqtt   INTEGER NOT NULL,
+            packets    INTEGER NOT NULL,
+            sized      INTEGER NOT NULL,
+            size_sum   INTEGER,
+            size_min   INTEGER,
+            size_max   INTEGER,
+            PRIMARY KEY (bucket, decrypted, key_used, hop_limit, via_mqtt)
+        ) WITHOUT ROWID;
+        CREATE TABLE packets_raw_daily (
+            bucket     INTEGER NOT NULL,
+            decrypted  INTEGER NOT NULL,
+            key_used   INTEGER NOT NULL,
+            hop_limit  INTEGER NOT NULL,
+            via_mqtt   INTEGER NOT NULL,
+            packets    INTEGER NOT NULL,
+            sized      INTEGER NOT NULL,
+            size_sum   INTEGER,
+            size_min   INTEGER,
+            size_max   INTEGER,
+            PRIMARY KEY (bucket, decrypted, key_used, hop_limit, via_mqtt)
+        ) WITHOUT ROWID;
+
+        CREATE VIEW traffic_counts AS
+        SELECT ts, source_id, msg_type, via_mqtt, 1 AS packets FROM traffic
+        UNION ALL
+        SELECT bucket, source_id, msg_type, via_mqtt, packets FROM traffic_hourly
+        UNION ALL
+        SELECT bucket, source_id, msg_type, via_mqtt, packets FROM traffic_daily;
+
+        CREATE VIEW packets_raw_counts AS
+        SELECT ts, decrypted, key_used, hop_limit, via_mqtt, 1 AS packets,
+               CASE WHEN packet_size > 0 THEN 1 ELSE 0 END AS sized,
+               CASE WHEN packet_size > 0 THEN packet_size END AS size_sum,
+               CASE WHEN packet_size > 0 THEN packet_size END AS size_min,
+               CASE WHEN packet_size > 0 THEN packet_size END AS size_max
+        FROM packets_raw
+        UNION ALL
+        SELECT bucket, decrypted, NULLIF(key_used, 0), NULLIF(hop_limit, -1), via_mqtt,
+               packets, sized, size_sum, size_min, size_max
+        FROM packets_raw_hourly
+        UNION ALL
+        SELECT bucket, decrypted, NULLIF(key_used, 0), NULLIF(hop_limit, -1), via_mqtt,
+               packets, sized, size_sum, size_min, size_max
+        FROM packets_raw_daily;
+    """)
+# Typed telemetry, one table per variant with the fields message.py decodes, so
+# telemetry is read as numbers rather than parsed from traffic.data. traffic_id is
+# the traffic row a reading came from (and the id node_summary's *_id columns hold);
+# the JSON "time" field is stored as device_time. Rows are written by AFTER INSERT
+# triggers, like node_summary, and aren't removed when retention prunes traffic.
+_TELEMETRY_FIELDS = {
+    "device": [("battery_level", "INTEGER"), ("voltage", "REAL"), ("channel_utilization", "REAL"),
+               ("air_util_tx", "REAL"), ("uptime_seconds", "INTEGER")],
+    "environment": [(f, "REAL") for f in ("temperature", "relative_humidity", "barometric_pressure",
+                                          "gas_resistance", "voltage", "current")] +
+                   [("iaq", "INTEGER")] +
+                   [(f, "REAL") for f in ("distance", "lux", "white_lux", "ir_lux", "uv_lux")] +
+                   [("wind_direction", "INTEGER")] +
+                   [(f, "REAL") for f in ("wind_speed", "wind_gust", "wind_lull", "radiation",
+                                          "rainfall_1h", "rainfall_24h")] +
+                   [("soil_moisture", "INTEGER"), ("soil_temperature", "REAL")],
+    "power": [(f"ch{i}_{f}", "REAL") for i in range(1, 9) for f in ("voltage", "current")],
+    "air_quality": [(f, "INTEGER") for f in ("pm10_standard", "pm25_standard", "pm100_standard",
+                                             "pm10_environmental", "pm25_environmental",
+                                             "pm100_environmental", "co2", "particles_03um",
+                                             "particles_05um", "particles_10um", "particles_25um",
+                                             "particles_50um", "particles_100um")],
+    "local_stats": [("uptime_seconds", "INTEGER"), ("channel_utilization", "REAL"), ("air_util_tx", "REAL")] +
+                   [(f, "INTEGER") for f in ("num_packets_tx", "num_packets_rx", "num_packets_rx_bad",
+                                             "num_online_nodes", "num_total_nodes", "num_rx_dupe",
+                                             "num_tx_relay", "num_tx_relay_canceled", "num_tx_dropped",
+                                             "noise_floor")],
+}
+
+def _telemetry_field_sql(column, data):
+    """SQL extracting one _TELEMETRY_FIELDS column from a telemetry JSON document."""
+    channel = re.fullmatch(r"ch(\d)_(voltage|current)", column)
+    if channel:
+        return (f"(SELECT json_extract(value, '$.{channel.group(2)}') FROM json_each({data}, '$.channels') "
+                f"WHERE json_extract(value, '$.ch') = {channel.group(1)})")
+    if column == "device_time":
+        return f"json_extract({data}, '$.time')"
+    return f"json_extract({data}, '$.{column}')"
+
+def _migration_6_typed_telemetry(conn, debug=False):
+    conn.execute("INSERT OR IGNORE INTO msg_types (name) VALUES ('TELEMETRY_APP')")
+    telemetry = conn.execute("SELECT id FROM msg_types WHERE name = 'TELEMETRY_APP'").fetchone()[0]
+
+    for ttype, fields in _TELEMETRY_FIELDS.items():
+        columns = [("device_time", "INTEGER")] + fields
+        ddl = "".join(f"            {column} {kind},\n" for column, kind in columns)
+        names = ", ".join(column for column, _ in columns)
+        backfill = ", ".join(_telemetry_field_sql(column, "data") for column, _ in columns)
+        values = ", ".join(_telemetry_field_sql(column, "NEW.data") for column, _ in columns)
+
+        _run_script(conn, f"""
+            CREATE TABLE telemetry_{ttype} (
+                traffic_id  INTEGER PRIMARY KEY,
+                node_id     INTEGER NOT NULL,
+                ts          INTEGER NOT NULL,
+{ddl.rstrip().rstrip(",")}
+            );
+            CREATE INDEX idx_telemetry_{ttype}_node_ts ON telemetry_{ttype}(node_id, ts);
+
+            INSERT INTO telemetry_{ttype} (traffic_id, node_id, ts, {names})
+            SELECT id, source_id, ts, {backfill}
+            FROM traffic
+            WHERE msg_type = {telemetry} AND source_id IS NOT NULL AND ts IS NOT NULL AND json_valid(data)
+              AND json_extract(data, '$.telemetry_type') = '{ttype}';
+
+            CREATE TRIGGER traffic_telemetry_{ttype} AFTER INSERT ON traffic
+            WHEN NEW.msg_type = {telemetry} AND NEW.source_id IS NOT NULL AND NEW.ts IS NOT NULL
+                 AND json_valid(NEW.data) AND json_extract(NEW.data, '$.telemetry_type') = '{ttype}'
+            BEGIN
+                INSERT INTO telemetry_{ttype} (traffic_id, node_id, ts, {names})
+                VALUES (NEW.id, NEW.source_id, NEW.ts, {values});
+            END;
+        """)
 
+# Position history and a spatial index of each node's latest position. positions
+# holds every POSITION_APP fix that isn't 0,0, keyed by its traffic row id.
+# node_positions is an R*Tree with one entry per node (its latest fix, as a point
+# box), so map viewport and cluster queries only touch nodes inside the viewport;
+# a node whose latest report is 0,0 has no entry, like before. Filled by an AFTER
+# INSERT trigger on traffic, like node_summary.
+def _migration_7_positions(conn, debug=False):
+    conn.execute("INSERT OR IGNORE INTO msg_types (name) VALUES ('POSITION_APP')")
+    position = conn.execute("SELECT id FROM msg_types WHERE name = 'POSITION_APP'").fetchone()[0]
+
+    fields = ("altitude", "precision_bits", "sats_in_view", "ground_speed", "ground_track")
+    names = ", ".join(fields)
+    lat, lon = "COALESCE(json_extract({0}, '$.latitude'), 0)", "COALESCE(json_extract({0}, '$.longitude'), 0)"
+
+    def extract(data):
+        return ", ".join([lat.format(data) + " AS latitude", lon.format(data) + " AS longitude"] +
+                         [f"json_extract({data}, '$.{f}')" for f in fields])
+
+    _run_script(conn, f"""
+        CREATE TABLE positions (
+            id              INTEGER PRIMARY KEY,
+            node_id         INTEGER NOT NULL,
+            ts              INTEGER NOT NULL,
+            latitude        REAL NOT NULL,
+            longitude       REAL NOT NULL,
+            altitude        INTEGER,
+            precision_bits  INTEGER,
+            sats_in_view    INTEGER,
+            ground_speed    INTEGER,
+            ground_track    INTEGER
+        );
+        CREATE INDEX idx_positions_node_ts ON positions(node_id, ts);
+
+        CREATE VIRTUAL TABLE node_positions USING rtree(
+            id, min_lat, max_lat, min_lon, max_lon, +position_id
+        );
+
+        INSERT INTO positions (id, node_id, ts, latitude, longitude, {names})
+        SELECT * FROM (
+            SELECT id, source_id, ts, {extract("data")}
+            FROM traffic
+            WHERE msg_type = {position} AND source_id IS NOT NULL AND ts IS NOT NULL AND json_valid(data)
+        ) WHERE latitude != 0 OR longitude != 0;
+
+        INSERT INTO node_positions
+        SELECT s.node_id, p.latitude, p.latitude, p.longitude, p.longitude, p.id
+        FROM node_summary s JOIN positions p ON p.id = s.position_id;
+
+        CREATE TRIGGER traffic_positions AFTER INSERT ON traffic
+        WHEN NEW.msg_type = {position} AND NEW.source_id IS NOT NULL AND NEW.ts IS NOT NULL
+             AND json_valid(NEW.data)
+        BEGIN
+            INSERT INTO positions (id, node_id, ts, latitude, longitude, {names})
+            SELECT * FROM (SELECT NEW.id, NEW.source_id, NEW.ts, {extract("NEW.data")})
+            WHERE latitude != 0 OR longitude != 0;
+
+            DELETE FROM node_positions WHERE id = NEW.source_id;
+            INSERT INTO node_positions
+            SELECT node_id, latitude, latitude, longitude, longitude, id FROM positions WHERE id = NEW.id;
+        END;
+    """)
+
+# Full-text indexes for the dashboard's node filter and /api/search, kept in step
+# by triggers. traffic_fts is contentless (the rows live in traffic, keyed by id) and
+# indexes each row's source and dest as "<hex id> <name>" plus the body of text
+# messages; deleting from it has to repeat the indexed values, which the trigger
+# rebuilds from OLD. nodes is small and its rowid isn't stable across VACUUM, so
+# nodes_fts keeps its own copy of the node id and names.
+def _migration_8_search(conn, debug=False):
+    conn.execute("INSERT OR IGNORE INTO msg_types (name) VALUES ('TEXT_MESSAGE_APP')")
+    text = conn.execute("SELECT id FROM msg_types WHERE name = 'TEXT_MESSAGE_APP'").fetchone()[0]
+
+    def traffic_values(row):
+        return (f"{row}id, "
+                f"CASE WHEN {row}source_id IS NOT NULL THEN printf('%08x', {row}source_id) END "
+                f"|| ' ' || COALESCE({row}source_name, ''), "
+                f"CASE WHEN {row}dest_id IS NOT NULL THEN printf('%08x', {row}dest_id) END "
+                f"|| ' ' || COALESCE({row}dest_name, ''), "
+                f"CASE WHEN {row}msg_type = {text} THEN {row}data END")
+
+    def node_values(row):
+        return f"{row}node_id, {row}long_name, {row}short_name"
+
+    _run_script(conn, f"""
+        CREATE VIRTUAL TABLE traffic_fts USING fts5(
+            source, dest, text, content='', prefix='2 3 4'
+        );
+        CREATE VIRTUAL TABLE nodes_fts USING fts5(
+            node_id, long_name, short_name, prefix='2 3 4'
+        );
+
+        INSERT INTO traffic_fts (rowid, source, dest, text) SELECT {traffic_values("")} FROM traffic;
+        INSERT INTO nodes_fts (node_id, long_name, short_name) SELECT {node_values("")} FROM nodes;
+
+        CREATE TRIGGER traffic_fts_insert AFTER INSERT ON traffic
+        BEGIN
+            INSERT INTO traffic_fts (rowid, source, dest, text) VALUES ({traffic_values("NEW.")});
+        END;
+        CREATE TRIGGER traffic_fts_delete AFTER DELETE ON traffic
+        BEGIN
+            INSERT INTO traffic_fts (traffic_fts, rowid, source, dest, text)
+            VALUES ('delete', {traffic_values("OLD.")});
+        END;
+
+        CREATE TRIGGER nodes_fts_insert AFTER INSERT ON nodes
+        BEGIN
+            INSERT INTO nodes_fts (node_id, long_name, short_name) VALUES ({node_values("NEW.")});
+        END;
+        CREATE TRIGGER nodes_fts_update AFTER UPDATE OF node_id, long_name, short_name ON nodes
+        WHEN OLD.node_id IS NOT NEW.node_id OR OLD.long_name IS NOT NEW.long_name
+             OR OLD.short_name IS NOT NEW.short_name
+        BEGIN
+            DELETE FROM nodes_fts WHERE node_id = OLD.node_id;
+            INSERT INTO nodes_fts (node_id, long_name, short_name) VALUES ({node_values("NEW.")});
+        END;
+        CREATE TRIGGER nodes_fts_delete AFTER DELETE ON nodes
+        BEGIN
+            DELETE FROM nodes_fts WHERE node_id = OLD.node_id;
+        END;
+    """)
+
+
+# Counters behind the webui's /api/metrics, kept by triggers on packets_raw so the
+# endpoint reads a few small tables instead of scanning every packet:
+#   packets_raw_totals      all-time counts per rollup key. Only inserts count, so
+#                           rows retention prunes stay counted, like packets_raw_counts.
+#   packets_raw_live        hourly counts of the rows still in packets_raw; deletes
+#                           count down, pruned hours are in packets_raw_hourly instead.
+#   packets_raw_copies      live rows per packet id, for rebroadcast detection.
+#   packets_raw_rebroadcasts
+#                           live rows, distinct packet ids, ids seen more than once and
+#                           their copies, kept in step with packets_raw_copies.
+# The last two are per transport: via_mqtt 0 (RF) and 1 (MQTT), and -1 for all rows.
+def _migration_9_metrics_counters(conn, debug=False):
+    def totals_values(row):
+        size = f"CASE WHEN {row}packet_size > 0 THEN {row}packet_size END"
+        return (f"{row}decrypted, COALESCE({row}key_used, 0), COALESCE({row}hop_limit, -1), "
+                f"COALESCE({row}via_mqtt, 0), 1, CASE WHEN {row}packet_size > 0 THEN 1 ELSE 0 END, "
+                f"{size}, {size}, {size}")
+
+    def live_key(row):
+        return (f"bucket = {row}ts / 3600000 * 3600000 AND decrypted = {row}decrypted "
+                f"AND key_used = COALESCE({row}key_used, 0) AND via_mqtt = COALESCE({row}via_mqtt, 0)")
+
+    # Copies of the row's packet id for the transport of the packets_raw_rebroadcasts row
+    copies = ("(SELECT copies FROM packets_raw_copies c "
+              " WHERE c.packet_id = {0}packet_id AND c.via_mqtt = packets_raw_rebroadcasts.via_mqtt)")
+    dup_copies = "CASE WHEN {0} = 2 THEN 2 WHEN {0} > 2 THEN 1 ELSE 0 END"
+    new_copies, old_copies = copies.format("NEW."), copies.format("OLD.")
+
+    _run_script(conn, f"""
+        CREATE TABLE packets_raw_totals (
+            decrypted  INTEGER NOT NULL,
+            key_used   INTEGER NOT NULL,
+            hop_limit  INTEGER NOT NULL,
+            via_mqtt   INTEGER NOT NULL,
+            packets    INTEGER NOT NULL,
+            sized      INTEGER NOT NULL,
+            size_sum   INTEGER,
+            size_min   INTEGER,
+            size_max   INTEGER,
+            PRIMARY KEY (decrypted, key_used, hop_limit, via_mqtt)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE packets_raw_live (
+            bucket     INTEGER NOT NULL,
+            decrypted  INTEGER NOT NULL,
+            key_used   INTEGER NOT NULL,
+            via_mqtt   INTEGER NOT NULL,
+            packets    INTEGER NOT NULL,
+            PRIMARY KEY (bucket, decrypted, key_used, via_mqtt)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE packets_raw_copies (
+            packet_id  INTEGER NOT NULL,
+            via_mqtt   INTEGER NOT NULL,
+            copies     INTEGER NOT NULL,
+            PRIMARY KEY (packet_id, via_mqtt)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE packets_raw_rebroadcasts (
+            via_mqtt    INTEGER PRIMARY KEY,
+            packets     INTEGER NOT NULL,
+            unique_ids  INTEGER NOT NULL,
+            dup_ids     INTEGER NOT NULL,
+            dup_copies  INTEGER NOT NULL
+        );
+
+        INSERT INTO packets_raw_totals
+        SELECT decrypted, COALESCE(key_used, 0), COALESCE(hop_limit, -1), COALESCE(via_mqtt, 0),
+               SUM(packets), SUM(sized), SUM(size_sum), MIN(size_min), MAX(size_max)
+        FROM packets_raw_counts GROUP BY 1, 2, 3, 4;
+
+        INSERT INTO packets_raw_live
+        SELECT ts / 3600000 * 3600000, decrypted, COALESCE(key_used, 0), COALESCE(via_mqtt, 0), COUNT(*)
+        FROM packets_raw GROUP BY 1, 2, 3, 4;
+
+        INSERT INTO packets_raw_copies
+        SELECT packet_id, -1, COUNT(*) FROM packets_raw WHERE packet_id IS NOT NULL GROUP BY packet_id;
+        INSERT INTO packets_raw_copies
+        SELECT packet_id, via_mqtt, COUNT(*) FROM packets_raw
+        WHERE packet_id IS NOT NULL AND via_mqtt IN (0, 1) GROUP BY packet_id, via_mqtt;
+
+        INSERT INTO packets_raw_rebroadcasts
+        SELECT t.via_mqtt,
+               (SELECT COUNT(*) FROM packets_raw WHERE t.via_mqtt = -1 OR via_mqtt = t.via_mqtt),
+               (SELECT COUNT(*) FROM packets_raw_copies WHERE via_mqtt = t.via_mqtt),
+               (SELECT COUNT(*) FROM packets_raw_copies WHERE via_mqtt = t.via_mqtt AND copies > 1),
+               (SELECT COALESCE(SUM(copies), 0) FROM packets_raw_copies WHERE via_mqtt = t.via_mqtt AND copies > 1)
+        FROM (SELECT -1 AS via_mqtt UNION ALL SELECT 0 UNION ALL SELECT 1) t;
+
+        CREATE TRIGGER packets_raw_totals_insert AFTER INSERT ON packets_raw
+        BEGIN
+            INSERT INTO packets_raw_totals (decrypted, key_used, hop_limit, via_mqtt,
+                                            packets, sized, size_sum, size_min, size_max)
+            VALUES ({totals_values("NEW.")})
+            ON CONFLICT (decrypted, key_used, hop_limit, via_mqtt) DO UPDATE SET
+                packets  = packets + 1,
+                sized    = sized + excluded.sized,
+                size_sum = COALESCE(size_sum + excluded.size_sum, size_sum, excluded.size_sum),
+                size_min = COALESCE(MIN(size_min, excluded.size_min), size_min, excluded.size_min),
+                size_max = COALESCE(MAX(size_max, excluded.size_max), size_max, excluded.size_max);
+        END;
+
+        CREATE TRIGGER packets_raw_live_insert AFTER INSERT ON packets_raw
+        BEGIN
+            INSERT INTO packets_raw_live (bucket, decrypted, key_used, via_mqtt, packets)
+            VALUES (NEW.ts / 3600000 * 3600000, NEW.decrypted, COALESCE(NEW.key_used, 0),
+                    COALESCE(NEW.via_mqtt, 0), 1)
+            ON CONFLICT (bucket, decrypted, key_used, via_mqtt) DO UPDATE SET packets = packets + 1;
+        END;
+        CREATE TRIGGER packets_raw_live_delete AFTER DELETE ON packets_raw
+        BEGIN
+            UPDATE packets_raw_live SET packets = packets - 1 WHERE {live_key("OLD.")};
+            DELETE FROM packets_raw_live WHERE {live_key("OLD.")} AND packets = 0;
+        END;
+
+        CREATE TRIGGER packets_raw_copies_insert AFTER INSERT ON packets_raw
+        BEGIN
+            UPDATE packets_raw_rebroadcasts SET packets = packets + 1 WHERE via_mqtt IN (-1, NEW.via_mqtt);
+            INSERT INTO packets_raw_copies (packet_id, via_mqtt, copies)
+            SELECT NEW.packet_id, via_mqtt, 1 FROM packets_raw_rebroadcasts
+            WHERE NEW.packet_id IS NOT NULL AND via_mqtt IN (-1, NEW.via_mqtt)
+            ON CONFLICT (packet_id, via_mqtt) DO UPDATE SET copies = copies + 1;
+            UPDATE packets_raw_rebroadcasts SET
+                unique_ids = unique_ids + ({new_copies} = 1),
+                dup_ids    = dup_ids + ({new_copies} = 2),
+                dup_copies = dup_copies + {dup_copies.format(new_copies)}
+            WHERE NEW.packet_id IS NOT NULL AND via_mqtt IN (-1, NEW.via_mqtt);
+        END;
+        CREATE TRIGGER packets_raw_copies_delete AFTER DELETE ON packets_raw
+        BEGIN
+            UPDATE packets_raw_rebroadcasts SET packets = packets - 1 WHERE via_mqtt IN (-1, OLD.via_mqtt);
+            UPDATE packets_raw_rebroadcasts SET
+                unique_ids = unique_ids - ({old_copies} = 1),
+                dup_ids    = dup_ids - ({old_copies} = 2),
+                dup_copies = dup_copies - {dup_copies.format(old_copies)}
+            WHERE OLD.packet_id IS NOT NULL AND via_mqtt IN (-1, OLD.via_mqtt);
+            UPDATE packets_raw_copies SET copies = copies - 1
+            WHERE packet_id = OLD.packet_id AND via_mqtt IN (-1, OLD.via_mqtt);
+            DELETE FROM packets_raw_copies WHERE packet_id = OLD.packet_id AND copies = 0;
+        END;
+    """)
+
+
+MIGRATIONS = [
+    (1, "baseline tables", _migration_1_baseline),
+    (2, "indexes for webui queries", _migration_2_webui_indexes),
+    (3, "compact ids, timestamps and enums", _migration_3_compact_rows),
+    (4, "per-node summary maintained on insert", _migration_4_node_summary),
+    (5, "hourly and daily rollups for retention", _migration_5_rollups),
+    (6, "typed telemetry tables", _migration_6_typed_telemetry),
+    (7, "position history and spatial index", _migration_7_positions),
+    (8, "full-text search", _migration_8_search),
+    (9, "metrics counters maintained on insert and delete", _migration_9_metrics_counters),
+]
+
+def schema_version(conn=None):
+    conn = conn or _conn
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+def migrate(debug=False):
+    """Apply any migrations newer than the database's schema version."""
+    _conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version     INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at  TEXT NOT NULL
+        )
+    """)
     _conn.commit()
 
+    current = schema_version()
+    for version, description, migration in MIGRATIONS:
+        if version <= current:
+            continue
+
+        if debug:
+            print(f"[DEBUG] Applying schema migration {version}: {description}")
+
+        _conn.execute("BEGIN")
+        try:
+            migration(_conn, debug)
+            _conn.execute("INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                          (version, description, datetime.now(timezone.utc).isoformat()))
+            _conn.execute("COMMIT")
+        except Exception:
+            _conn.execute("ROLLBACK")
+            raise
+
+        print(f"[INFO] Database schema migrated to version {version} ({description})")
+
 
 def upsert_node(node_id, long_name=None, short_name=None, hw_model=None, role=None, public_key=None, timestamp=None):
     if _conn is None:
@@ -107,17 +888,19 @@ def upsert_node(node_id, long_name=None, short_name=None, hw_model=None, role=No
             public_key = COALESCE(excluded.public_key,  nodes.public_key),
             last_seen  = excluded.last_seen
     """, (node_id, long_name, short_name, hw_model, role, pk_blob, timestamp, timestamp))
-    _conn.commit()
+    _mark_pending()
+
+    # Mirror the COALESCE above in the cache
+    old_long, old_short = _node_names.get(node_id, (None, None))
+    _node_names[node_id] = (
+        long_name if long_name is not None else old_long,
+        short_name if short_name is not None else old_short,
+    )
+    _last_seen_pending.pop(node_id, None)
+    _last_seen_written[node_id] = time.monotonic()
 
 def get_node_name(node_id):
-    if _conn is None:
-        return (None, None)
-    row = _conn.execute(
-        "SELECT long_name, short_name FROM nodes WHERE node_id = ?", (node_id,)
-    ).fetchone()
-    if row:
-        return row
-    return (None, None)
+    return _node_names.get(node_id, (None, None))
 
 def resolve_name(node_id):
     if node_id is None:
@@ -134,27 +917,55 @@ def resolve_name(node_id):
     return node_id
 
 def ensure_node(node_id, timestamp=None):
-    """Create a minimal nodes row if this node_id has never been seen."""
+    """Create a minimal nodes row if this node_id has never been seen, else bump last_seen."""
     if _conn is None or not node_id or node_id == "ffffffff":
         return
     if timestamp is None:
         timestamp = datetime.now(timezone.utc).isoformat()
     else:
         timestamp = str(timestamp)
+
+    # Known node: coalesce last_seen, _write_last_seen() persists it on a later flush
+    if node_id in _node_names:
+        _last_seen_pending[node_id] = timestamp
+        return
+
+    _node_names[node_id] = (None, None)
+    _last_seen_written[node_id] = time.monotonic()
     _conn.execute("""
         INSERT INTO nodes (node_id, first_seen, last_seen)
         VALUES (?, ?, ?)
         ON CONFLICT(node_id) DO UPDATE SET
             last_seen = excluded.last_seen
     """, (node_id, timestamp, timestamp))
+    _mark_pending()
+
+
+def _epoch_ms(timestamp):
+    """Epoch milliseconds UTC for a datetime (naive means local time) or None (now)."""
+    if timestamp is None:
+        return int(time.time() * 1000)
+    return int(timestamp.timestamp() * 1000)
+
+def _uint32(hex_id):
+    return int(hex_id, 16) if hex_id else None
+
+def _msg_type_id(name):
+    """Id of msg_type name in msg_types, added on first use."""
+    type_id = _msg_type_ids.get(name)
+    if type_id is None:
+        _conn.execute("INSERT OR IGNORE INTO msg_types (name) VALUES (?)", (name,))
+        type_id = _conn.execute("SELECT id FROM msg_types WHERE name = ?", (name,)).fetchone()[0]
+        _msg_type_ids[name] = type_id
+        _mark_pending()
+    return type_id
 
 
 def log_traffic(timestamp, source_id, dest_id, packet_id=None, channel_hash=None,
                 channel_name=None, port_num=None, msg_type="UNKNOWN", data=None, key_used=None,
-                via_mqtt=False, hop_start=None, hop_limit=None):
+                via_mqtt=False, hop_start=None, hop_limit=None, port=None, preset=None):
     if _conn is None:
         return
-    import json as _json
     ensure_node(source_id, timestamp)
     ensure_node(dest_id, timestamp)
     source_name = resolve_name(source_id)
@@ -163,42 +974,110 @@ def log_traffic(timestamp, source_id, dest_id, packet_id=None, channel_hash=None
     data_str = None
     if data is not None:
         if isinstance(data, (dict, list)):
-            data_str = _json.dumps(data)
+            data_str = json.dumps(data)
         else:
             data_str = str(data)
 
-    _conn.execute("""
-        INSERT INTO traffic (timestamp, source_id, source_name, dest_id, dest_name,
-                             packet_id, channel_hash, channel_name, port_num,
-                             msg_type, data, key_used, via_mqtt, hop_start, hop_limit)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (str(timestamp), source_id, source_name, dest_id, dest_name,
-          packet_id, channel_hash, channel_name, port_num,
-          msg_type, data_str, key_used,
-          1 if via_mqtt else 0, hop_start, hop_limit))
-    _conn.commit()
+    _traffic_rows.append((
+        _epoch_ms(timestamp), _uint32(source_id), source_name, _uint32(dest_id), dest_name,
+        _uint32(packet_id), channel_hash, channel_name, port_num,
+        _msg_type_id(msg_type), data_str, KEY_USED.get(key_used),
+        1 if via_mqtt else 0, hop_start, hop_limit,
+        port, preset))
+    _mark_pending()
+    _flush_if_full()
 
 def log_raw_packet(timestamp, source_id, dest_id, packet_id=None,
                    channel_hash=None, flags=None, hop_limit=None,
                    hop_start=None, want_ack=None, via_mqtt=None,
-                   packet_size=None, decrypted=False, key_used=None):
+                   packet_size=None, decrypted=False, key_used=None,
+                   port=None, preset=None):
     if _conn is None:
         return
-    _conn.execute("""
-        INSERT INTO packets_raw (timestamp, source_id, dest_id, packet_id,
-                                 channel_hash, flags, hop_limit, hop_start,
-                                 want_ack, via_mqtt, packet_size, decrypted,
-                                 key_used)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (str(timestamp), source_id, dest_id, packet_id,
-          channel_hash, flags, hop_limit, hop_start,
-          1 if want_ack else 0, 1 if via_mqtt else 0,
-          packet_size, 1 if decrypted else 0, key_used))
+    _raw_rows.append((
+        _epoch_ms(timestamp), _uint32(source_id), _uint32(dest_id), _uint32(packet_id),
+        channel_hash, flags, hop_limit, hop_start,
+        1 if want_ack else 0, 1 if via_mqtt else 0,
+        packet_size, 1 if decrypted else 0, KEY_USED.get(key_used),
+        port, preset))
+    _mark_pending()
+    _flush_if_full()
+
+
+def _mark_pending():
+    global _pending_since
+    if _pending_since is None:
+        _pending_since = time.monotonic()
+
+def _flush_if_full():
+    if len(_raw_rows) + len(_traffic_rows) >= _commit_rows:
+        flush()
+        prune_if_due()
+    else:
+        flush_if_due()
+
+def flush_if_due():
+    """Commit pending writes if the oldest is older than the commit interval.
+
+    Called on every write, and by the ingest loop when it's idle so a quiet
+    mesh still sees its last packets committed on time."""
+    if _pending_since is not None and (time.monotonic() - _pending_since) * 1000 >= _commit_ms:
+        flush()
+    prune_if_due()
+
+def prune_if_due():
+    """Run one retention batch (at most retention.BATCH_ROWS expired rows) if one is due.
+
+    Only runs with nothing queued, between group commits, so ingest never waits
+    on a long delete; a backlog is worked through one batch per call."""
+    if _conn is None or _retention is None or _pending_since is not None:
+        return
+    if _conn.in_transaction or not _retention.due():
+        return
+    _retention.step(_conn)
+
+def _write_last_seen(force=False):
+    now = time.monotonic()
+    due = [node_id for node_id in _last_seen_pending
+           if force or now - _last_seen_written.get(node_id, float("-inf")) >= _last_seen_interval]
+    if not due:
+        return
+
+    _conn.executemany("UPDATE nodes SET last_seen = ? WHERE node_id = ?",
+                      [(_last_seen_pending.pop(node_id), node_id) for node_id in due])
+    for node_id in due:
+        _last_seen_written[node_id] = now
+
+def flush(force=False):
+    """Write all queued rows and commit them in a single transaction.
+
+    force also writes every coalesced last_seen update, due or not."""
+    global _pending_since
+    if _conn is None:
+        return
+    if _pending_since is None and not (force and _last_seen_pending):
+        return
+
+    _write_last_seen(force)
+
+    if _raw_rows:
+        _conn.executemany(_RAW_INSERT, _raw_rows)
+        _raw_rows.clear()
+    if _traffic_rows:
+        _conn.executemany(_TRAFFIC_INSERT, _traffic_rows)
+        _traffic_rows.clear()
+
     _conn.commit()
+    _pending_since = None
 
 
 def close_db():
     global _conn
     if _conn is not None:
+        flush(force=True)
+        if _retention is not None:
+            _retention.report()
+        # Refresh planner statistics when SQLite thinks they're stale
+        _conn.execute("PRAGMA optimize")
         _conn.close()
         _conn = None
@@ -0,0 +1,56 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+class DecodeCache(object):
+    """Bounded, time-windowed LRU of decode results for rebroadcast copies.
+
+    Relaying nodes retransmit the same encrypted payload under the same source
+    and packet id, with only the header flags changed. Keying on
+    (source, packet_id, payload digest) lets every copy after the first reuse
+    the earlier decrypt and decode result, including "no key matched".
+    """
+
+    def __init__(self, max_entries=4096, ttl=600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+        self.stats = {"hits": 0, "misses": 0, "expired": 0}
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def key(source, packet_id, payload):
+        return (source, packet_id, hashlib.blake2b(payload, digest_size=8).digest())
+
+    def get(self, key):
+        """Return the cached result for key, or None."""
+        entry = self.entries.get(key)
+        if entry is not None:
+            stored, result = entry
+            if time.monotonic() - stored <= self.ttl:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return result
+
+            del self.entries[key]
+            self.stats["expired"] += 1
+
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, key, result):
+        self.entries[key] = (time.monotonic(), result)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def report(self):
+        s = self.stats
+        lookups = s["hits"] + s["misses"]
+        rate = (100.0 * s["hits"] / lookups) if lookups else 0.0
+        print(f"[INFO] Decode cache: {s['hits']} hits, {s['misses']} misses ({rate:.1f}% hit rate), "
+              f"{s['expired']} expired, {len(self.entries)} entries")
@@ -0,0 +1,115 @@
+import base64
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+from util import compute_channel_hash
+
+# The default Meshtastic public key bytes (AQ== expanded)
+DEFAULT_KEY_BYTES = base64.b64decode("1PG7OiApB1nwvP+rz05pAQ==")
+
+class ChannelKey(object):
+    """A channel key decoded and validated once, ready for Packet.decrypt_with()."""
+
+    __slots__ = ("b64", "raw", "aes", "ecb", "public")
+
+    def __init__(self, b64):
+        self.b64 = b64
+        self.raw = base64.b64decode(b64)
+
+        ## Raises ValueError for lengths AES can't use
+        self.aes = algorithms.AES(self.raw)
+
+        ## Reusable single-block encryptor for the plaintext pre-check
+        self.ecb = Cipher(self.aes, modes.ECB()).encryptor()
+        self.public = self.raw == DEFAULT_KEY_BYTES
+
+    def __repr__(self):
+        return f"ChannelKey({self.b64!r})"
+
+class KeyStore(object):
+    """Loaded channel keys, indexed by the channel hash byte found in packet headers.
+
+    A packet only tries the keys registered for its channel hash. When none of
+    them decrypts it (or the hash is unknown) the remaining keys are tried as a
+    fallback, unless the fallback is disabled.
+    """
+
+    def __init__(self, fallback=True):
+        self.fallback = fallback
+
+        ## All ChannelKeys in load order, and by base64 key
+        self.keys = []
+        self.by_b64 = {}
+
+        ## channel hash -> [ChannelKeys], channel hash -> channel name
+        self.by_hash = {}
+        self.channels = {}
+
+        self.stats = {
+            "packets": 0,
+            "indexed_hits": 0,
+            "fallback_used": 0,
+            "fallback_hits": 0,
+            "misses": 0,
+        }
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, b64, channel_names):
+        """Register a base64 key under the hash of each channel name.
+
+        The key is decoded and validated here, once; raises ValueError if it's not a usable AES key."""
+        key = self.by_b64.get(b64)
+        if key is None:
+            key = ChannelKey(b64)
+            self.keys.append(key)
+            self.by_b64[b64] = key
+
+        hashes = []
+        for channel_name in channel_names:
+            h = compute_channel_hash(channel_name, b64)
+            self.channels[h] = channel_name
+
+            indexed = self.by_hash.setdefault(h, [])
+            if key not in indexed:
+                indexed.append(key)
+            hashes.append(h)
+
+        return hashes
+
+    def channel_name(self, channel_hash):
+        return self.channels.get(channel_hash)
+
+    def decrypt(self, packet):
+        """Decrypt packet with the first key that works. Returns the ChannelKey, or None."""
+        self.stats["packets"] += 1
+
+        indexed = self.by_hash.get(packet.get_channel_hash(), [])
+        for key in indexed:
+            if self._try(packet, key):
+                self.stats["indexed_hits"] += 1
+                return key
+
+        if self.fallback and len(indexed) < len(self.keys):
+            self.stats["fallback_used"] += 1
+            for key in self.keys:
+                if key in indexed:
+                    continue
+                if self._try(packet, key):
+                    self.stats["fallback_hits"] += 1
+                    return key
+
+        self.stats["misses"] += 1
+        return None
+
+    def _try(self, packet, key):
+        try:
+            return packet.decrypt_with(key.aes, key.ecb)
+        except Exception:
+            return False
+
+    def report(self):
+        s = self.stats
+        print(f"[INFO] Key index: {s['packets']} packets, {s['indexed_hits']} indexed hits, "
+              f"fallback used {s['fallback_used']} times ({s['fallback_hits']} hits), {s['misses']} misses")
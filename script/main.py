@@ -2,22 +2,42 @@ import argparse
 import base64
 import json
 import zmq
-import time
 
 from packet import Packet
-from util import compute_channel_hash
-from db import init_db, upsert_node, log_traffic, log_raw_packet, resolve_name, close_db
-
-# The default Meshtastic public key bytes (AQ== expanded)
-DEFAULT_KEY_BYTES = base64.b64decode("1PG7OiApB1nwvP+rz05pAQ==")
+from keystore import KeyStore
+from decodecache import DecodeCache
+from retention import Retention
+from db import init_db, upsert_node, log_traffic, log_raw_packet, resolve_name, close_db, flush_if_due, COMMIT_ROWS, COMMIT_MS
+from pipeline import DecodePipeline
+
+# ZMQ PUB ports used by the flowgraphs, one per modem preset
+PRESET_PORTS = {
+    20000: "ShortFast",
+    20001: "ShortSlow",
+    20002: "MediumFast",
+    20003: "MediumSlow",
+    20004: "LongFast",
+    20005: "LongModerate",
+    20006: "LongSlow",
+    20007: "VeryLongSlow",
+}
 
 #reads keys from file called 'keys'
 parser = argparse.ArgumentParser(description = "Process incoming command parmeters")
 parser.add_argument("ip", action = "store", help = "IP Address.")
-parser.add_argument("port", action = "store", help = "Port")
+parser.add_argument("port", action = "store", help = "Port, comma separated ports or port range (eg. 20004, 20002,20004 or 20000-20007)")
 parser.add_argument("-d", "--debug", action = "store_true", dest = "debug", help = "Print more debug messages")
 parser.add_argument("-s", "--save", action = "store_true", dest = "save", help = "Save packets to disk")
-parser.add_argument("-p", "--preset", action = "store", dest = "preset", default = "LongFast", help = "Modem preset name, used as default channel name (default: LongFast)")
+parser.add_argument("-w", "--workers", action = "store", dest = "workers", type = int, default = 0, help = "Decode in N worker processes with a separate DB writer process (default: 0, decode in-process)")
+parser.add_argument("--no-key-fallback", action = "store_false", dest = "key_fallback", help = "Only try keys whose channel hash matches the packet header")
+parser.add_argument("--cache-size", action = "store", dest = "cache_size", type = int, default = 4096, help = "Decode results kept for rebroadcast copies, 0 disables (default: 4096)")
+parser.add_argument("--cache-ttl", action = "store", dest = "cache_ttl", type = int, default = 600, help = "Seconds a cached decode result stays valid (default: 600)")
+parser.add_argument("--commit-rows", action = "store", dest = "commit_rows", type = int, default = COMMIT_ROWS, help = f"Commit queued database rows once N are pending (default: {COMMIT_ROWS})")
+parser.add_argument("--commit-ms", action = "store", dest = "commit_ms", type = int, default = COMMIT_MS, help = f"Commit queued database rows at least every N ms (default: {COMMIT_MS})")
+parser.add_argument("--keep-raw-days", action = "store", dest = "keep_raw_days", type = int, default = 0, help = "Roll up and delete packets_raw rows older than N days, 0 keeps them (default: 0)")
+parser.add_argument("--keep-traffic-days", action = "store", dest = "keep_traffic_days", type = int, default = 0, help = "Roll up and delete traffic rows older than N days, 0 keeps them (default: 0)")
+parser.add_argument("--keep-hourly-days", action = "store", dest = "keep_hourly_days", type = int, default = 0, help = "Fold hourly rollups older than N days into daily ones, 0 keeps them (default: 0)")
+parser.add_argument("-p", "--preset", action = "store", dest = "preset", default = None, help = "Modem preset name, used as default channel name (default: derived from port, LongFast if unknown)")
 args = parser.parse_args()
 
 debug = False
@@ -56,88 +76,141 @@ def validate_aes_key(key = None):
     except Exception as e:
         return False
 
-def handle_packet(pkt = None):
-    packet = Packet(pkt)
+def parse_ports(spec = None):
+    ports = []
 
-    print("-" * 20, " PACKET ", "-" * 20)
-    print(f"[INFO] timestamp: {packet.get_timestamp()}")
+    for part in str(spec).split(","):
+        part = part.strip()
+        if not part:
+            continue
+
+        if "-" in part:
+            first, last = part.split("-", 1)
+            ports.extend(range(int(first), int(last) + 1))
+        else:
+            ports.append(int(part))
+
+    # Keep order but drop duplicates
+    return list(dict.fromkeys(ports))
+
+def preset_for_port(port = None):
+    if args.preset:
+        return args.preset
+    return PRESET_PORTS.get(port, "LongFast")
+
+def decode_packet(pkt = None, port = None, preset = None, timestamp = None):
+    """Parse, decrypt and decode one raw frame into a record for store_packet().
+
+    Does no database work, so it can run in a pipeline worker process."""
+    packet = Packet(pkt, timestamp)
 
     if save:
-        print(f"[INFO] Saving, as requested...")
         packet.save()
-    
-    if debug:
-        print(f"[DEBUG] Src: {packet.get_source()}")
-        print(f"[DEBUG] Dest: {packet.get_dest()}")
-        print(f"[DEBUG] PacketId: {packet.get_packet_id()}")
-        print(f"[DEBUG] Flags: {packet.get_flags()}")
-        print(f"[DEBUG] ChannelHash: {packet.get_channel_hash()}")
-        print(f"[DEBUG] Data: {packet.get_data()}")
-    
-    decrypted = False
-    matched_key = None
-
-    for key in keys:
-        try:
-            decrypted = packet.decrypt(key)
-            matched_key = key
-            break
-        except Exception as e:
-            continue
 
-    # Determine encryption type for the matched key
+    # Relayed copies carry the same payload, reuse the first copy's result
+    cache_key = None
+    cached = None
+    if decode_cache is not None:
+        cache_key = DecodeCache.key(packet.src, packet.packet_id, packet.data)
+        cached = decode_cache.get(cache_key)
+
+    if cached is not None:
+        matched_key, message = cached
+    else:
+        matched_key = keystore.decrypt(packet)
+        message = packet.get_message() if matched_key is not None else None
+        if decode_cache is not None:
+            decode_cache.put(cache_key, (matched_key, message))
+
+    decrypted = matched_key is not None
     encryption_type = None
-    if decrypted and matched_key:
-        try:
-            is_public = base64.b64decode(matched_key) == DEFAULT_KEY_BYTES
-        except Exception:
-            is_public = False
-        encryption_type = "public" if is_public else "private"
+    if decrypted:
+        encryption_type = "public" if matched_key.public else "private"
+
+    if debug and cached is not None:
+        print(f"[DEBUG] Decode cache hit for {packet.get_source()}/{packet.get_packet_id()}")
+    elif debug and decrypted and matched_key not in keystore.by_hash.get(packet.get_channel_hash(), []):
+        print(f"[DEBUG] Decrypted via key fallback, channel hash {packet.get_channel_hash()} is not indexed")
 
     # Parse flags byte: bits 0-2 = hop_limit, bit 3 = want_ack, bit 4 = via_mqtt,
     # bits 5-7 = hop_start (firmware 2.1+)
-    flags_raw = packet.get_flags()
-    hop_limit = None
-    hop_start = None
-    want_ack = False
-    via_mqtt = False
-    if flags_raw:
-        try:
-            flags_int = int(flags_raw, 16)
-            hop_limit = flags_int & 0x07
-            want_ack = bool(flags_int & 0x08)
-            via_mqtt = bool(flags_int & 0x10)
-            hop_start = (flags_int >> 5) & 0x07
-        except (ValueError, TypeError):
-            pass
+    flags = packet.flags
+    hop_limit = flags & 0x07
+    want_ack = bool(flags & 0x08)
+    via_mqtt = bool(flags & 0x10)
+    hop_start = (flags >> 5) & 0x07
+
+    pkt_hash = packet.get_channel_hash()
+
+    return {
+        "timestamp": packet.get_timestamp(),
+        "port": port,
+        "preset": preset,
+        "source_id": packet.get_source(),
+        "dest_id": packet.get_dest(),
+        "packet_id": packet.get_packet_id(),
+        "flags": packet.get_flags(),
+        "channel_hash": pkt_hash,
+        "channel_name": keystore.channel_name(pkt_hash) if decrypted else None,
+        "data": packet.get_data() if debug else None,
+        "hop_limit": hop_limit,
+        "hop_start": hop_start,
+        "want_ack": want_ack,
+        "via_mqtt": via_mqtt,
+        "packet_size": len(pkt) if pkt else 0,
+        "decrypted": decrypted,
+        "key_used": encryption_type,
+        "message": message,
+    }
+
+def store_packet(record = None):
+    """Log a decoded record to the database and console, in arrival order."""
+    print("-" * 20, " PACKET ", "-" * 20)
+    print(f"[INFO] timestamp: {record['timestamp']}")
+    if record["port"] is not None:
+        print(f"[INFO] preset: {record['preset']} (port {record['port']})")
+
+    if save:
+        print(f"[INFO] Saved, as requested")
+
+    if debug:
+        print(f"[DEBUG] Src: {record['source_id']}")
+        print(f"[DEBUG] Dest: {record['dest_id']}")
+        print(f"[DEBUG] PacketId: {record['packet_id']}")
+        print(f"[DEBUG] Flags: {record['flags']}")
+        print(f"[DEBUG] ChannelHash: {record['channel_hash']}")
+        print(f"[DEBUG] Data: {record['data']}")
+
+    decrypted = record["decrypted"]
 
     # Log every packet to packets_raw (decrypted or not)
-    raw_size = len(pkt) if pkt else 0
     log_raw_packet(
-        timestamp=packet.get_timestamp(),
-        source_id=packet.get_source(),
-        dest_id=packet.get_dest(),
-        packet_id=packet.get_packet_id(),
-        channel_hash=packet.get_channel_hash(),
-        flags=flags_raw,
-        hop_limit=hop_limit,
-        hop_start=hop_start,
-        want_ack=want_ack,
-        via_mqtt=via_mqtt,
-        packet_size=raw_size,
+        timestamp=record["timestamp"],
+        source_id=record["source_id"],
+        dest_id=record["dest_id"],
+        packet_id=record["packet_id"],
+        channel_hash=record["channel_hash"],
+        flags=record["flags"],
+        hop_limit=record["hop_limit"],
+        hop_start=record["hop_start"],
+        want_ack=record["want_ack"],
+        via_mqtt=record["via_mqtt"],
+        packet_size=record["packet_size"],
         decrypted=decrypted,
-        key_used=encryption_type,
+        key_used=record["key_used"],
+        port=record["port"],
+        preset=record["preset"],
     )
 
     if decrypted:
-        pkt_hash = packet.get_channel_hash()
-        channel_name = channel_map.get(pkt_hash)
+        pkt_hash = record["channel_hash"]
+        channel_name = record["channel_name"]
         if channel_name:
             print(f"[INFO] channel: {channel_name}")
         else:
             print(f"[INFO] channel: unknown (hash: {pkt_hash})")
 
-        message = packet.get_message()
+        message = record["message"]
 
         # Handle cases where message parsing fails or returns incomplete data
         if message is None:
@@ -151,35 +224,37 @@ def handle_packet(pkt = None):
         # Upsert node info before resolving names so the name is immediately available
         if msg_type == "NODEINFO_APP" and isinstance(msg_data, dict):
             upsert_node(
-                node_id=packet.get_source(),
+                node_id=record["source_id"],
                 long_name=msg_data.get("long_name"),
                 short_name=msg_data.get("short_name"),
                 hw_model=msg_data.get("hw_model"),
                 role=msg_data.get("role"),
                 public_key=msg_data.get("public_key"),
-                timestamp=packet.get_timestamp(),
+                timestamp=record["timestamp"],
             )
 
         # Display resolved names
-        src_name = resolve_name(packet.get_source())
-        dst_name = resolve_name(packet.get_dest())
+        src_name = resolve_name(record["source_id"])
+        dst_name = resolve_name(record["dest_id"])
         print(f"[INFO] from: {src_name}")
         print(f"[INFO] to:   {dst_name}")
 
         log_traffic(
-            timestamp=packet.get_timestamp(),
-            source_id=packet.get_source(),
-            dest_id=packet.get_dest(),
-            packet_id=packet.get_packet_id(),
+            timestamp=record["timestamp"],
+            source_id=record["source_id"],
+            dest_id=record["dest_id"],
+            packet_id=record["packet_id"],
             channel_hash=pkt_hash,
             channel_name=channel_name,
             port_num=getattr(message, 'portnum', None),
             msg_type=msg_type,
             data=msg_data,
-            key_used=encryption_type,
-            via_mqtt=via_mqtt,
-            hop_start=hop_start,
-            hop_limit=hop_limit,
+            key_used=record["key_used"],
+            via_mqtt=record["via_mqtt"],
+            hop_start=record["hop_start"],
+            hop_limit=record["hop_limit"],
+            port=record["port"],
+            preset=record["preset"],
         )
 
         try:
@@ -195,31 +270,64 @@ def handle_packet(pkt = None):
 
     print("-" * 50)
 
-def listen_on_network(ip = None, port = None, keys = []):
-    if not ip or not port:
+def handle_packet(pkt = None, port = None, preset = None):
+    store_packet(decode_packet(pkt, port, preset))
+
+def report_stats():
+    keystore.report()
+    if decode_cache is not None:
+        decode_cache.report()
+
+def listen_on_network(ip = None, ports = None, keystore = None, handler = None, idle = None, idle_ms = None):
+    if not ip or not ports:
         raise Exception("Missing IP or Port!")
-    if not keys:
+    if not keystore:
         raise Exception("Missing keys- check 'key' file and add one or more entries!")
+    if handler is None:
+        handler = handle_packet
 
     context = zmq.Context()
-    socket = context.socket(zmq.SUB)
-    socket.connect("tcp://" + ip + ":" + port)
-    socket.setsockopt(zmq.SUBSCRIBE, b'')
+    poller = zmq.Poller()
+    sockets = {}
 
-    print(f"Socket <tcp://{ip}:{port}> listening...")
+    # One SUB socket per flowgraph port, all serviced by a single poller
+    for port in ports:
+        socket = context.socket(zmq.SUB)
+        socket.connect(f"tcp://{ip}:{port}")
+        socket.setsockopt(zmq.SUBSCRIBE, b'')
+        poller.register(socket, zmq.POLLIN)
+        sockets[socket] = (port, preset_for_port(port))
 
-    while True:
-        if socket.poll(10) != 0:
-            pkt = socket.recv()
-            try:
-                handle_packet(pkt)
-            except Exception as e:
-                print(f"[ERROR] Failed to process packet: {e}")
-                if debug:
-                    import traceback
-                    traceback.print_exc()
-        else:
-            time.sleep(0.1)
+        print(f"Socket <tcp://{ip}:{port}> ({sockets[socket][1]}) listening...")
+
+    try:
+        while True:
+            # Block until at least one socket has a packet, then drain everything queued.
+            # With an idle hook, wake up every idle_ms to run it when nothing arrives.
+            ready = poller.poll(idle_ms if idle else None)
+            if not ready and idle:
+                idle()
+
+            for socket, _ in ready:
+                port, preset = sockets[socket]
+
+                while True:
+                    try:
+                        pkt = socket.recv(zmq.NOBLOCK)
+                    except zmq.Again:
+                        break
+
+                    try:
+                        handler(pkt, port, preset)
+                    except Exception as e:
+                        print(f"[ERROR] Failed to process packet: {e}")
+                        if debug:
+                            import traceback
+                            traceback.print_exc()
+    finally:
+        for socket in sockets:
+            socket.close(linger = 0)
+        context.term()
 
 if __name__ == "__main__":
     if args.debug:
@@ -228,17 +336,16 @@ if __name__ == "__main__":
     if args.save:
         save = True
 
-    init_db(debug=debug)
-
     try:
         with open("keys", "r") as file:
             temp_keys = [line.strip() for line in file]
     except Exception as e:
         temp_keys = ["1PG7OiApB1nwvP+rz05pAQ=="]
 
-    keys = []
-    channel_map = {}
-    preset = args.preset
+    keystore = KeyStore(fallback=args.key_fallback)
+    decode_cache = DecodeCache(args.cache_size, args.cache_ttl) if args.cache_size > 0 else None
+    ports = parse_ports(args.port)
+    presets = list(dict.fromkeys(preset_for_port(port) for port in ports))
 
     for entry in temp_keys:
         if not entry or entry.startswith("#"):
@@ -256,25 +363,52 @@ if __name__ == "__main__":
         if not valid_key:
             print(f"[WARN] Key '{raw_key}' is not a valid AES 128/256 key!")
         else:
-            keys.append(valid_key)
-
-            # Build channel hash mapping using the expanded key (firmware hashes the full key)
-            channel_name = name if name else preset
-            h = compute_channel_hash(channel_name, valid_key)
-            channel_map[h] = channel_name
+            # Index the key by channel hash using the expanded key (firmware hashes the full key).
+            # Unnamed keys default to the preset name, so register one per preset listened on.
+            channel_names = [name] if name else presets
+            try:
+                hashes = keystore.add(valid_key, channel_names)
+            except ValueError as e:
+                print(f"[WARN] Key '{raw_key}' rejected: {e}")
+                continue
 
             if debug:
-                print(f"[DEBUG] Registered channel hash '{h}' -> '{channel_name}' (key: {raw_key})")
+                for h, channel_name in zip(hashes, channel_names):
+                    print(f"[DEBUG] Registered channel hash '{h}' -> '{channel_name}' (key: {raw_key})")
 
-    if len(keys) > 0:
-        print(f"[INFO] Loaded {len(keys)} keys")
+    if len(keystore) > 0:
+        print(f"[INFO] Loaded {len(keystore)} keys")
     else:
         print(f"[WARN] No keys loaded.")
 
+    pipeline = None
+    handler = handle_packet
+    idle = None
+    # Wake often enough to honour the commit interval on a quiet mesh
+    idle_ms = max(args.commit_ms, 50)
+    retention = Retention(args.keep_raw_days, args.keep_traffic_days, args.keep_hourly_days)
+
+    if args.workers > 0:
+        # The DB connection lives only in the writer process
+        pipeline = DecodePipeline(args.workers, decode_packet, store_packet,
+                                  setup=lambda: init_db(debug, args.commit_rows, args.commit_ms, retention=retention),
+                                  teardown=close_db, worker_teardown=report_stats,
+                                  writer_idle=flush_if_due, idle_timeout=idle_ms / 1000.0,
+                                  debug=debug)
+        handler = pipeline.submit
+        print(f"[INFO] Decoding with {args.workers} worker processes")
+    else:
+        init_db(debug, args.commit_rows, args.commit_ms, retention=retention)
+        idle = flush_if_due
+
     try:
-        listen_on_network(args.ip, args.port, keys)
+        listen_on_network(args.ip, ports, keystore, handler, idle, idle_ms)
     except KeyboardInterrupt:
         print("\n[INFO] Shutting down...")
     finally:
+        if pipeline is not None:
+            pipeline.close()
+        else:
+            report_stats()
         close_db()
 
@@ -1,3 +1,4 @@
+import struct
 from datetime import datetime
 
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
@@ -7,104 +8,122 @@ from meshtastic import mesh_pb2
 
 from packetdata import PacketData
 from message import Message
-from util import msb2lsb, hex_to_binary, b64_to_hex
+from util import b64_to_hex
+
+## PortNum values are defined up to MAX (511)
+MAX_PORTNUM = 511
+
+def plausible_data_prefix(head):
+    """Cheap check that decrypted bytes start like a serialized mesh_pb2.Data.
+
+    Firmware encodes fields in order, so a valid Data begins with the field 1
+    (portnum) varint tag 0x08 followed by a portnum of 1-2 bytes. A wrong key
+    yields random bytes here and is rejected without a protobuf parse."""
+    if len(head) < 2 or head[0] != 0x08:
+        return False
+
+    if head[1] < 0x80:
+        portnum = head[1]
+    elif len(head) > 2 and head[2] < 0x80:
+        portnum = (head[1] & 0x7f) | (head[2] << 7)
+    else:
+        return False
+
+    return 0 < portnum <= MAX_PORTNUM
 
 class Packet(object):
-    def __init__(self, packet):
-        ## Timestamp of the packet
-        self.timestamp = datetime.now()
+    __slots__ = ("timestamp", "raw", "packet", "src", "dest", "packet_id", "flags",
+                 "channel_hash", "reserved", "data", "message",
+                 "_source_hex", "_dest_hex", "_packet_id_hex", "_channel_hash_hex")
+
+    def __init__(self, packet, timestamp=None):
+        ## Timestamp of the packet (arrival time when received by a pipeline)
+        self.timestamp = timestamp if timestamp else datetime.now()
 
         ## Set raw
         self.raw = packet
 
-        ## Parse raw into data structure
+        ## Parse raw header once; IDs are uint32, data is a memoryview into raw
         self.packet = PacketData(self.raw)
-        self.src = self.packet.get_source()
-        self.dest = self.packet.get_dest()
-        self.packet_id = self.packet.get_packet_id()
-        self.flags = self.packet.get_flags()
-        self.channel_hash = self.packet.get_channel_hash()
-        self.reserved = self.packet.get_reserved()
-        self.data = self.packet.get_data()
+        self.src = self.packet.src
+        self.dest = self.packet.dest
+        self.packet_id = self.packet.packet_id
+        self.flags = self.packet.flags
+        self.channel_hash = self.packet.channel_hash
+        self.reserved = self.packet.reserved
+        self.data = self.packet.data
+        self.message = None
+
+        ## Hex strings are built on first use only
+        self._source_hex = None
+        self._dest_hex = None
+        self._packet_id_hex = None
+        self._channel_hash_hex = None
 
     def get_raw(self):
-        if hasattr(self, "raw"):
-            return self.raw
-        else:
-            return None
-        
+        return self.raw
+
     def get_timestamp(self):
-        if hasattr(self, "timestamp"):
-            return self.timestamp
-        else:
-            return datetime.now()
+        return self.timestamp
 
     def get_source(self):
-        if hasattr(self, "src"):
-            return msb2lsb(str(self.src.hex()))
-        else:
-            return None
-        
+        if self._source_hex is None:
+            self._source_hex = format(self.src, '08x')
+        return self._source_hex
+
     def get_dest(self):
-        if hasattr(self, "dest"):
-            return msb2lsb(str(self.dest.hex()))
-        else:
-            return None
-        
+        if self._dest_hex is None:
+            self._dest_hex = format(self.dest, '08x')
+        return self._dest_hex
+
     def get_packet_id(self):
-        if hasattr(self, "packet_id"):
-            return msb2lsb(str(self.packet_id.hex()))
-        else:
-            return None
-        
+        if self._packet_id_hex is None:
+            self._packet_id_hex = format(self.packet_id, '08x')
+        return self._packet_id_hex
+
     def get_flags(self):
-        if hasattr(self, "flags"):
-            return str(self.flags.hex())
-        else:
-            return None
-        
+        return format(self.flags, '02x')
+
     def get_channel_hash(self):
-        if hasattr(self, "channel_hash"):
-            return str(self.channel_hash.hex())
-        else:
-            return None
-        
+        if self._channel_hash_hex is None:
+            self._channel_hash_hex = format(self.channel_hash, '02x')
+        return self._channel_hash_hex
+
     def get_reserved(self):
-        if hasattr(self, "reserved"):
-            return str(self.reserved.hex())
-        else:
-            return None
-        
+        return bytes(self.raw[14:16]).hex()
+
     def get_data(self):
-        if hasattr(self, "data"):
-            return str(self.data.hex())
-        else:
-            return None
-        
+        return self.data.hex()
+
     def get_message(self):
-        if hasattr(self, "message"):
-            return self.message
-        else:
-            return None
+        return self.message
 
     def save(self):
-        with open(f"{self.get_source()}-{self.get_dest()}-{self.timestamp.strftime("%Y%m%d-%H%M%S")}.txt", "wb") as f:
+        with open(f"{self.get_source()}-{self.get_dest()}-{self.timestamp.strftime('%Y%m%d-%H%M%S')}.txt", "wb") as f:
             f.write(self.raw)
 
     def decrypt(self, key):
+        """Decrypt with a base64 key. Builds the AES key on every call, prefer decrypt_with()."""
+        return self.decrypt_with(algorithms.AES(b64_to_hex(key)))
+
+    def decrypt_with(self, aes, ecb=None):
+        """Decrypt with a pre-built cryptography AES key object (see KeyStore).
+
+        ecb is an optional reusable AES-ECB encryptor for the same key. With it the
+        plaintext pre-check costs one block encryption instead of a CTR cipher setup."""
         ## Try with PSK method
         try:
-            aes_nonce = self.packet_id + b'\x00\x00\x00\x00' + self.src + b'\x00\x00\x00\x00'
-            cipher = Cipher(algorithms.AES(b64_to_hex(key)), modes.CTR(aes_nonce), backend=default_backend())
-            decryptor = cipher.decryptor()
-            protobuf = decryptor.update(self.data) + decryptor.finalize()
+            ## packet_id (uint64le) + source (uint64le)
+            aes_nonce = struct.pack('<QQ', self.packet_id, self.src)
+            protobuf = self._decrypt_ctr(aes, ecb, aes_nonce, self.data)
 
-            ## Try decode
-            data = mesh_pb2.Data()
-            data.ParseFromString(protobuf)
-            self.message = Message(self.get_source(), self.get_dest(), data)
+            ## Try decode, unless the pre-check already ruled this key out
+            if protobuf is not None:
+                data = mesh_pb2.Data()
+                data.ParseFromString(protobuf)
+                self.message = Message(self.get_source(), self.get_dest(), data)
 
-            return True
+                return True
         except Exception as e:
             if not str(e).startswith("Error parsing message with type 'meshtastic.protobuf.Data'"):
                 print(e)
@@ -114,24 +133,41 @@ class Packet(object):
             ## https://meshtastic.org/docs/development/reference/encryption-technical/
             ## TODO: Random nonce changes between source and dest, why? Eg. src: ffb7fd08, dest: ffb7cd08.
             ## NOTE: random is uint32le
-            random = self.data[-4:]
-            aes_nonce = self.packet_id + random + self.src + b'\x00\x00\x00\x00'
+            random = bytes(self.data[-4:])
+            aes_nonce = struct.pack('<I', self.packet_id) + random + struct.pack('<Q', self.src)
 
             ## TODO: need to derive shared secret from sender public key and recipient private key
-            shared_secret = b64_to_hex(key)
-
-            cipher = Cipher(algorithms.AES(shared_secret), modes.CTR(aes_nonce), backend=default_backend())
-            decryptor = cipher.decryptor()
-            protobuf = decryptor.update(self.data[:-4]) + decryptor.finalize()
+            protobuf = self._decrypt_ctr(aes, ecb, aes_nonce, self.data[:-4])
 
             ## Try decode
-            data = mesh_pb2.Data()
-            data.ParseFromString(protobuf)
-            self.message = Message(self.get_source(), self.get_dest(), data)
+            if protobuf is not None:
+                data = mesh_pb2.Data()
+                data.ParseFromString(protobuf)
+                self.message = Message(self.get_source(), self.get_dest(), data)
 
-            return True
+                return True
         except Exception as e:
             if not str(e).startswith("Error parsing message with type 'meshtastic.protobuf.Data'"):
                 print(e)
         
-        raise Exception("Unable to decrypt!")
\ No newline at end of file
+        raise Exception("Unable to decrypt!")
+
+    def _decrypt_ctr(self, aes, ecb, aes_nonce, payload):
+        """AES-CTR decrypt payload, or None if the plaintext can't be a mesh_pb2.Data."""
+        ## The first CTR keystream block is AES(nonce): check the plaintext prefix
+        ## before paying for a full decrypt and protobuf parse
+        if ecb is not None:
+            keystream = ecb.update(aes_nonce)
+            head = bytes(c ^ k for c, k in zip(payload[:3], keystream))
+            if not plausible_data_prefix(head):
+                return None
+
+            decryptor = Cipher(aes, modes.CTR(aes_nonce), backend=default_backend()).decryptor()
+            return decryptor.update(payload) + decryptor.finalize()
+
+        ## No ECB context: decrypt the first block only, CTR carries on from there
+        decryptor = Cipher(aes, modes.CTR(aes_nonce), backend=default_backend()).decryptor()
+        head = decryptor.update(payload[:16])
+        if not plausible_data_prefix(head):
+            return None
+        return head + decryptor.update(payload[16:]) + decryptor.finalize()
@@ -1,104 +1,50 @@
-from util import hex_to_binary
+import struct
+
+# https://meshtastic.org/docs/overview/mesh-algo/
+# NOTE: Header fields are little endian on air. The node/packet IDs we display are the
+# uint32 values, ie. the byte-reversed hex of the wire bytes.
+
+# destination : 4 bytes
+# sender      : 4 bytes
+# packetID    : 4 bytes
+# flags       : 1 byte
+# channelHash : 1 byte
+# reserved    : 2 bytes
+# data        : 0-237 bytes
+HEADER = struct.Struct("<IIIBBH")
+HEADER_SIZE = HEADER.size
 
 class PacketData(object):
-    def __init__(self, raw_data):
-        self.raw = raw_data
-        self.hex = self.raw.hex()
-
-        # https://meshtastic.org/docs/overview/mesh-algo/
-        # NOTE: The data coming out of GnuRadio is MSB or big endian. We have to reverse byte order after this step.
-
-        # destination : 4 bytes 
-        # sender      : 4 bytes
-        # packetID    : 4 bytes
-        # flags       : 1 byte
-        # channelHash : 1 byte
-        # reserved    : 2 bytes
-        # data        : 0-237 bytes
-
-        self.hex_data = {
-            'dest' : self.hex[0:8],
-            'src' : self.hex[8:16],
-            'packet_id' : self.hex[16:24],
-            'flags' : self.hex[24:26],
-            'channel_hash' : self.hex[26:28],
-            'reserved' : self.hex[28:32],
-            'data' : self.hex[32:len(self.hex)]
-        }
-
-        try:
-            self.dest = hex_to_binary(self.hex_data["dest"])
-        except Exception as e:
-            print(f"Error getting message destination: {e}")
-
-        try:
-            self.src = hex_to_binary(self.hex_data["src"])
-        except Exception as e:
-            print(f"Error getting message source: {e}")
-
-        try:
-            self.packet_id = hex_to_binary(self.hex_data["packet_id"])
-        except Exception as e:
-            print(f"Error getting message packet_id: {e}")
+    """Radio header unpacked once into integers, payload kept as a zero-copy view."""
 
-        try:
-            self.flags = hex_to_binary(self.hex_data["flags"])
-        except Exception as e:
-            print(f"Error getting message flags: {e}")
+    __slots__ = ("raw", "dest", "src", "packet_id", "flags", "channel_hash", "reserved", "data")
 
-        try:
-            self.channel_hash = hex_to_binary(self.hex_data["channel_hash"])
-        except Exception as e:
-            print(f"Error getting message channel_hash: {e}")
+    def __init__(self, raw_data):
+        self.raw = raw_data
 
-        try:
-            self.reserved = hex_to_binary(self.hex_data["reserved"])
-        except Exception as e:
-            print(f"Error getting message reserved: {e}")
+        ## Raises struct.error for frames shorter than the header
+        view = memoryview(raw_data)
+        (self.dest, self.src, self.packet_id, self.flags,
+         self.channel_hash, self.reserved) = HEADER.unpack_from(view)
+        self.data = view[HEADER_SIZE:]
 
-        try:
-            self.data = hex_to_binary(self.hex_data["data"])
-        except Exception as e:
-            print(f"Error getting message data: {e}")
-    
     def get_dest(self):
-        if hasattr(self, "dest"):
-            return self.dest
-        else:
-            return None
+        return self.dest
 
     def get_source(self):
-        if hasattr(self, "src"):
-            return self.src
-        else:
-            return None
-        
+        return self.src
+
     def get_packet_id(self):
-        if hasattr(self, "packet_id"):
-            return self.packet_id
-        else:
-            return None
-        
+        return self.packet_id
+
     def get_flags(self):
-        if hasattr(self, "flags"):
-            return self.flags
-        else:
-            return None
-        
+        return self.flags
+
     def get_channel_hash(self):
-        if hasattr(self, "channel_hash"):
-            return self.channel_hash
-        else:
-            return None
-        
+        return self.channel_hash
+
     def get_reserved(self):
-        if hasattr(self, "reserved"):
-            return self.reserved
-        else:
-            return None
-        
+        return self.reserved
+
     def get_data(self):
-        if hasattr(self, "data"):
-            return self.data
-        else:
-            return None
+        return self.data
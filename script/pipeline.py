@@ -0,0 +1,231 @@
+"""Multi-process decode pipeline.
+
+The ZMQ receiver stamps every frame with its arrival time and a sequence
+number, then fans it out to a pool of decode worker processes (parse, decrypt,
+protobuf decode). Decoded records go to a single DB writer process, which
+re-orders them by sequence number before storing them, so packets are written
+in the order they arrived on each port.
+
+If a decode worker dies, the receiver routes its frames to the others and
+tells the writer which packets may have died with it, so the writer skips
+them instead of waiting for them forever.
+"""
+
+import collections
+import heapq
+import multiprocessing
+import queue
+import signal
+import time
+import traceback
+import zlib
+from datetime import datetime
+
+# Workers and writer inherit the loaded keys and settings from the receiver,
+# which only works with the fork start method.
+_mp = multiprocessing.get_context("fork")
+
+# Max frames queued per worker before the receiver blocks (ZMQ buffers the rest)
+QUEUE_SIZE = 1000
+
+# Seconds a missing sequence number may hold back later records before the
+# writer gives up on it, in case a worker died without the receiver noticing
+GAP_TIMEOUT = 30.0
+
+# Results queue message from the receiver: a worker died, (LOST, seqs routed to it)
+LOST = "lost"
+
+
+def _ignore_sigint():
+    # Ctrl-C goes to the whole process group; let the receiver drive shutdown
+    # so queued packets are drained instead of lost.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _decode_worker(decode, jobs, results, teardown):
+    _ignore_sigint()
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            if teardown:
+                teardown()
+            results.put(None)
+            return
+
+        seq, pkt, port, preset, timestamp = job
+        try:
+            results.put((seq, decode(pkt, port, preset, timestamp), None))
+        except Exception as e:
+            results.put((seq, None, f"{e}\n{traceback.format_exc()}"))
+
+
+def _store_record(store, record, error, debug):
+    if error:
+        print(f"[ERROR] Failed to process packet: {error.splitlines()[0]}")
+        if debug:
+            print(error)
+        return
+
+    try:
+        store(record)
+    except Exception as e:
+        print(f"[ERROR] Failed to store packet: {e}")
+        if debug:
+            traceback.print_exc()
+
+
+def _db_writer(store, results, workers, setup, teardown, idle, idle_timeout, debug):
+    _ignore_sigint()
+
+    if setup:
+        setup()
+
+    pending = []
+    next_seq = 0
+    finished = 0
+    # Sequence numbers that died with a worker, and (seq, since) of the one
+    # currently holding back later records
+    lost = set()
+    blocked = None
+
+    try:
+        while finished < workers:
+            timeout = idle_timeout if idle else None
+            if blocked is not None:
+                left = max(0.0, blocked[1] + GAP_TIMEOUT - time.monotonic())
+                timeout = left if timeout is None else min(timeout, left)
+
+            try:
+                item = results.get(timeout=timeout)
+            except queue.Empty:
+                if idle:
+                    idle()
+            else:
+                if item is None:
+                    finished += 1
+                    continue
+
+                if item[0] == LOST:
+                    # A dead worker counts as finished; its packets already here aren't lost
+                    finished += 1
+                    missing = set(seq for seq in item[1] if seq >= next_seq)
+                    missing.difference_update(seq for seq, _, _ in pending)
+                    print(f"[ERROR] Up to {len(missing)} packets died with a decode worker, skipping them")
+                    lost.update(missing)
+                elif item[0] < next_seq:
+                    # Given up on, then turned up after all: store it late rather than drop it
+                    _store_record(store, item[1], item[2], debug)
+                    continue
+                else:
+                    lost.discard(item[0])
+                    heapq.heappush(pending, item)
+
+            if blocked is not None and blocked[0] == next_seq and time.monotonic() - blocked[1] >= GAP_TIMEOUT:
+                print(f"[ERROR] Packet #{next_seq} was never decoded after {GAP_TIMEOUT:.0f}s, skipping")
+                lost.add(next_seq)
+
+            # Release records strictly in arrival order
+            while True:
+                if pending and pending[0][0] == next_seq:
+                    _, record, error = heapq.heappop(pending)
+                    _store_record(store, record, error, debug)
+                elif next_seq in lost:
+                    lost.discard(next_seq)
+                else:
+                    break
+                next_seq += 1
+
+            if not pending:
+                blocked = None
+            elif blocked is None or blocked[0] != next_seq:
+                blocked = (next_seq, time.monotonic())
+    finally:
+        if teardown:
+            teardown()
+
+
+class DecodePipeline(object):
+    def __init__(self, workers, decode, store, setup=None, teardown=None, worker_teardown=None,
+                 writer_idle=None, idle_timeout=1.0, debug=False):
+        if workers < 1:
+            raise ValueError("DecodePipeline needs at least one worker")
+
+        self.seq = 0
+        self.jobs = [_mp.Queue(QUEUE_SIZE) for _ in range(workers)]
+        self.results = _mp.Queue(QUEUE_SIZE * workers)
+
+        # Recent sequence numbers routed to each worker: enough to cover its queue,
+        # the one it's decoding and results it may not have flushed when it dies
+        self.sent = [collections.deque(maxlen=QUEUE_SIZE * (workers + 1) + 1) for _ in range(workers)]
+        self.dead = set()
+
+        self.workers = [
+            _mp.Process(target=_decode_worker, args=(decode, jobs, self.results, worker_teardown),
+                        name=f"decode-{i}", daemon=True)
+            for i, jobs in enumerate(self.jobs)
+        ]
+        self.writer = _mp.Process(target=_db_writer,
+                                  args=(store, self.results, workers, setup, teardown,
+                                        writer_idle, idle_timeout, debug),
+                                  name="db-writer", daemon=True)
+
+        self.writer.start()
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, pkt, port=None, preset=None):
+        """Queue a raw frame for decoding. Called from the receiver loop."""
+        # Route by source + packet id (header bytes 4-11) so rebroadcast copies
+        # land on the same worker and hit its decode cache
+        worker = self._live_worker(zlib.crc32(pkt[4:12]) % len(self.jobs))
+        job = (self.seq, pkt, port, preset, datetime.now())
+        while True:
+            try:
+                self.jobs[worker].put(job, timeout=1.0)
+                break
+            except queue.Full:
+                # A dead worker never makes room in its queue
+                worker = self._live_worker(worker)
+        self.sent[worker].append(self.seq)
+        self.seq += 1
+
+    def _live_worker(self, index):
+        """index, or the next worker still running if that one has died."""
+        for _ in range(len(self.workers)):
+            if self._alive(index):
+                return index
+            index = (index + 1) % len(self.workers)
+        raise RuntimeError("All decode workers have died")
+
+    def _alive(self, index):
+        """Whether worker index is running; the first time it isn't, tell the writer."""
+        if index in self.dead:
+            return False
+        if self.workers[index].is_alive():
+            return True
+        self._worker_died(index)
+        return False
+
+    def _worker_died(self, index):
+        worker = self.workers[index]
+        print(f"[ERROR] Decode worker {worker.name} died (exit code {worker.exitcode}), "
+              f"sending its packets to the other workers")
+        self.dead.add(index)
+        self.results.put((LOST, list(self.sent[index])))
+
+    def close(self):
+        """Stop accepting frames, drain the workers and wait for the writer to finish."""
+        for index, jobs in enumerate(self.jobs):
+            while self._alive(index):
+                try:
+                    jobs.put(None, timeout=1.0)
+                    break
+                except queue.Full:
+                    pass
+        for index, worker in enumerate(self.workers):
+            worker.join()
+            # Died while draining, before it got to its None
+            if worker.exitcode and index not in self.dead:
+                self._worker_died(index)
+        self.writer.join()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Retention for packets_raw and traffic.
+
+Rows older than their table's policy are rolled up into hourly aggregate tables
+and then deleted, at most BATCH_ROWS rows per transaction. Hourly aggregates older
+than their own policy are folded into daily ones the same way. The
+packets_raw_counts and traffic_counts views union live rows with both rollup
+levels, so totals over any window stay the same after a prune.
+
+The listener runs one batch at a time between group commits (see
+db.prune_if_due), so pruning never holds the write lock while ingest waits.
+This script does the same from the command line, e.g. to catch up a large
+database once before enabling retention on the listener:
+
+    python3 retention.py --keep-raw-days 7 --keep-traffic-days 90
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+
+HOUR_MS = 3600 * 1000
+DAY_MS = 24 * HOUR_MS
+
+# Rows rolled up and deleted per transaction; each deleted traffic/packets_raw
+# row also fires the search, node_summary and metrics counter triggers
+BATCH_ROWS = 2000
+
+# Rollup SQL. :start and :last bound one batch of source rows (inclusive), all
+# within one bucket; rollup keys
+# can't be NULL, so absent key_used/hop_limit are stored as 0/-1 and the
+# *_counts views turn them back into NULLs.
+_ROLLUPS = {
+    "traffic": """
+        INSERT INTO traffic_hourly (bucket, source_id, msg_type, via_mqtt, packets)
+        SELECT ts / 3600000 * 3600000, COALESCE(source_id, 0), COALESCE(msg_type, 0), COALESCE(via_mqtt, 0), COUNT(*)
+        FROM traffic WHERE ts >= :start AND ts <= :last
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (bucket, source_id, msg_type, via_mqtt) DO UPDATE SET
+            packets = packets + excluded.packets
+    """,
+    "packets_raw": """
+        INSERT INTO packets_raw_hourly (bucket, decrypted, key_used, hop_limit, via_mqtt,
+                                        packets, sized, size_sum, size_min, size_max)
+        SELECT ts / 3600000 * 3600000, decrypted, COALESCE(key_used, 0), COALESCE(hop_limit, -1),
+               COALESCE(via_mqtt, 0), COUNT(*),
+               SUM(CASE WHEN packet_size > 0 THEN 1 ELSE 0 END),
+               SUM(CASE WHEN packet_size > 0 THEN packet_size END),
+               MIN(CASE WHEN packet_size > 0 THEN packet_size END),
+               MAX(CASE WHEN packet_size > 0 THEN packet_size END)
+        FROM packets_raw WHERE ts >= :start AND ts <= :last
+        GROUP BY 1, 2, 3, 4, 5
+        ON CONFLICT (bucket, decrypted, key_used, hop_limit, via_mqtt) DO UPDATE SET
+            packets  = packets + excluded.packets,
+            sized    = sized + excluded.sized,
+            size_sum = COALESCE(size_sum + excluded.size_sum, size_sum, excluded.size_sum),
+            size_min = COALESCE(MIN(size_min, excluded.size_min), size_min, excluded.size_min),
+            size_max = COALESCE(MAX(size_max, excluded.size_max), size_max, excluded.size_max)
+    """,
+    "traffic_hourly": """
+        INSERT INTO traffic_daily (bucket, source_id, msg_type, via_mqtt, packets)
+        SELECT bucket / 86400000 * 86400000, source_id, msg_type, via_mqtt, SUM(packets)
+        FROM traffic_hourly WHERE bucket >= :start AND bucket <= :last
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (bucket, source_id, msg_type, via_mqtt) DO UPDATE SET
+            packets = packets + excluded.packets
+    """,
+    "packets_raw_hourly": """
+        INSERT INTO packets_raw_daily (bucket, decrypted, key_used, hop_limit, via_mqtt,
+                                       packets, sized, size_sum, size_min, size_max)
+        SELECT bucket / 86400000 * 86400000, decrypted, key_used, hop_limit, via_mqtt,
+               SUM(packets), SUM(sized), SUM(size_sum), MIN(size_min), MAX(size_max)
+        FROM packets_raw_hourly WHERE bucket >= :start AND bucket <= :last
+        GROUP BY 1, 2, 3, 4, 5
+        ON CONFLICT (bucket, decrypted, key_used, hop_limit, via_mqtt) DO UPDATE SET
+            packets  = packets + excluded.packets,
+            sized    = sized + excluded.sized,
+            size_sum = COALESCE(size_sum + excluded.size_sum, size_sum, excluded.size_sum),
+            size_min = COALESCE(MIN(size_min, excluded.size_min), size_min, excluded.size_min),
+            size_max = COALESCE(MAX(size_max, excluded.size_max), size_max, excluded.size_max)
+    """,
+}
+
+class Retention(object):
+    """Per-table retention policy, applied one batch at a time by step().
+
+    A keep_* of 0 keeps that table's rows forever."""
+
+    def __init__(self, raw_days=0, traffic_days=0, hourly_days=0, interval=60, batch_rows=BATCH_ROWS):
+        self.interval = interval
+        self.batch_rows = batch_rows
+        self.next_run = 0.0
+
+        ## (table, time column, bucket size, days to keep), pruned in this order
+        self.policies = [
+            ("packets_raw", "ts", HOUR_MS, raw_days),
+            ("traffic", "ts", HOUR_MS, traffic_days),
+            ("packets_raw_hourly", "bucket", DAY_MS, hourly_days),
+            ("traffic_hourly", "bucket", DAY_MS, hourly_days),
+        ]
+
+        self.stats = {"batches": 0, "rows": 0}
+
+    def enabled(self):
+        return any(days for _, _, _, days in self.policies)
+
+    def due(self):
+        return self.enabled() and time.monotonic() >= self.next_run
+
+    def step(self, conn):
+        """Roll up and delete the oldest batch_rows expired rows of one table, in its own transaction.
+
+        conn must have no open transaction. Returns the number of rows deleted; while
+        that's non-zero the next batch is due straight away, otherwise after interval."""
+        now_ms = int(time.time() * 1000)
+
+        for table, column, bucket_ms, days in self.policies:
+            if not days:
+                continue
+
+            # Only whole buckets, so a bucket is rolled up once
+            cutoff = (now_ms - days * DAY_MS) // bucket_ms * bucket_ms
+            oldest = conn.execute(f"SELECT MIN({column}) FROM {table}").fetchone()[0]
+            if oldest is None or oldest >= cutoff:
+                continue
+
+            start = oldest // bucket_ms * bucket_ms
+            end = min(start + bucket_ms, cutoff)
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # The batch ends at the time of its batch_rows-th oldest row, and
+                # takes every row at that time; rows at the same time are never split
+                last = conn.execute(
+                    f"SELECT MAX({column}) FROM (SELECT {column} FROM {table} "
+                    f"WHERE {column} >= ? AND {column} < ? ORDER BY {column} LIMIT ?)",
+                    (start, end, self.batch_rows),
+                ).fetchone()[0]
+                conn.execute(_ROLLUPS[table], {"start": start, "last": last})
+                deleted = conn.execute(f"DELETE FROM {table} WHERE {column} >= ? AND {column} <= ?",
+                                       (start, last)).rowcount
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+            self.stats["batches"] += 1
+            self.stats["rows"] += deleted
+            self.next_run = 0.0
+            return deleted
+
+        self.next_run = time.monotonic() + self.interval
+        return 0
+
+    def report(self):
+        print(f"[INFO] Retention: {self.stats['rows']} rows rolled up and deleted in {self.stats['batches']} batches")
+
+
+def main():
+    default_db = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "mesh.db"))
+
+    parser = argparse.ArgumentParser(description="Roll up and delete expired mesh.db rows")
+    parser.add_argument("--db", default=default_db, help=f"Path to mesh.db (default {default_db})")
+    parser.add_argument("--keep-raw-days", type=int, default=7, help="Days of packets_raw rows to keep (default 7)")
+    parser.add_argument("--keep-traffic-days", type=int, default=90, help="Days of traffic rows to keep (default 90)")
+    parser.add_argument("--keep-hourly-days", type=int, default=365,
+                        help="Days of hourly rollups to keep before folding them into daily ones (default 365)")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, timeout=5, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout=5000")
+
+    version = conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+    if version < 5:
+        print("[ERROR] Database schema is too old, start the listener once to migrate it")
+        return
+
+    retention = Retention(args.keep_raw_days, args.keep_traffic_days, args.keep_hourly_days)
+    while retention.step(conn):
+        pass
+
+    retention.report()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -304,13 +304,13 @@ print_header "Installing Python Dependencies"
 #     read -p "Reinstall/update Python packages? (y/n) " -n 1 -r
 #     echo ""
 #     if [[ $REPLY =~ ^[Yy]$ ]]; then
-#         pip3 install --user --break-system-packages --upgrade meshtastic protobuf cryptography flask
+#         pip3 install --user --break-system-packages --upgrade meshtastic protobuf cryptography flask gunicorn
 #         print_success "Python dependencies updated"
 #     else
 #         print_warning "Skipping Python package installation"
 #     fi
 # else
-    pip3 install --user --break-system-packages meshtastic protobuf cryptography flask
+    pip3 install --user --break-system-packages meshtastic protobuf cryptography flask gunicorn
     print_success "Python dependencies installed/updated"
 # fi
 
@@ -2,16 +2,26 @@
 """Meshtastic SDR Web UI — read-only dashboard for mesh.db."""
 
 import argparse
+import functools
+import gzip
+import hashlib
 import json
+import math
 import os
+import queue
+import re
 import sqlite3
 import sys
+import threading
+import time
+from datetime import datetime
 
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, Response, g, jsonify, render_template, request
 import traceback
+from collections import OrderedDict
 
 app = Flask(__name__)
-db_conn = None
+db_path = None
 
 
 # ── Error Handler ──────────────────────────────────────────────────────────────
@@ -25,15 +35,230 @@ def handle_exception(e):
     return f"<h1>500 Internal Server Error</h1><p>{e}</p>", 500
 
 
+# ── Database Connections ──────────────────────────────────────────────────────
+#
+# Every request checks a read-only connection out of a pool for its own thread,
+# so concurrent requests read the WAL database in parallel instead of taking
+# turns on one shared connection. Idle connections are reused newest first,
+# keeping their page caches warm. DB_PRAGMAS applies to each one; main() sets it
+# from the command line.
+
+DB_PRAGMAS = {
+    "mmap_size": 64 * 1024 * 1024,
+    "cache_size": -8 * 1024,  # KiB when negative
+    "temp_store": "MEMORY",
+    "query_only": "ON",
+}
+
+_idle_conns = queue.LifoQueue()
+# PRAGMA data_version is per connection, so the response cache asks one shared one
+_version_conn = None
+_version_lock = threading.Lock()
+
+
 def get_db(db_path):
-    """Open a read-only SQLite connection."""
+    """Open a read-only SQLite connection with DB_PRAGMAS applied."""
     uri = f"file:{db_path}?mode=ro"
     conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA busy_timeout = 3000")
+    for name, value in DB_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
     return conn
 
 
+def open_db(path):
+    """Serve path: drop pooled connections to any previous database and open the shared one."""
+    global db_path, _version_conn, _telemetry_metrics
+    _telemetry_metrics = (None, {})
+    while True:
+        try:
+            _idle_conns.get_nowait().close()
+        except queue.Empty:
+            break
+    db_path = path
+    with _version_lock:
+        if _version_conn is not None:
+            _version_conn.close()
+        _version_conn = get_db(path)
+
+
+def db():
+    """The current request's read connection, checked out of the pool on first use."""
+    if "db" not in g:
+        try:
+            g.db = _idle_conns.get_nowait()
+        except queue.Empty:
+            g.db = get_db(db_path)
+    return g.db
+
+
+@app.teardown_appcontext
+def _release_db(exc):
+    conn = g.pop("db", None)
+    if conn is not None:
+        _idle_conns.put(conn)
+
+
+# ── Response Cache ────────────────────────────────────────────────────────────
+#
+# JSON responses are cached per path and query string and tagged with the
+# connection's PRAGMA data_version, which changes whenever the listener commits.
+# Until it does, every client gets the same body, and a client that already has
+# it (If-None-Match with its strong ETag) gets 304 Not Modified. Entries also
+# expire after CACHE_MAX_SECONDS, because "last 24h" windows move without writes.
+
+CACHE_MAX_SECONDS = 10
+CACHE_ENTRIES = 256
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+# Concurrent misses on one key wait for a single computation instead of each
+# running the query; keys share a few striped locks
+_compute_locks = [threading.Lock() for _ in range(16)]
+
+
+def _data_version():
+    with _version_lock:
+        return _version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+
+def _cache_entry(key, version):
+    """(version, created, body, etag, gzipped body) cached for key, or None if missing or stale."""
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is None or entry[0] != version or time.monotonic() - entry[1] > CACHE_MAX_SECONDS:
+            return None
+        _cache.move_to_end(key)
+        return entry
+
+
+def _cache_put(key, entry):
+    """Store entry under key, dropping the least recently used entries past CACHE_ENTRIES."""
+    with _cache_lock:
+        _cache[key] = entry
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_ENTRIES:
+            _cache.popitem(last=False)
+
+
+def _cached(view):
+    """Serve a JSON view from the response cache, with ETag revalidation."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = (request.path, request.query_string)
+        version = _data_version()
+        entry = _cache_entry(key, version)
+        if entry is None:
+            with _compute_locks[hash(key) % len(_compute_locks)]:
+                # Another request may have filled it while this one waited
+                entry = _cache_entry(key, version)
+                if entry is None:
+                    response = app.make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    body = response.get_data()
+                    entry = (version, time.monotonic(), body, hashlib.sha1(body).hexdigest(), _gzip(body))
+                    _cache_put(key, entry)
+
+        if entry[4] is not None and _accepts_gzip():
+            response = Response(entry[4], mimetype="application/json")
+            response.headers["Content-Encoding"] = "gzip"
+            # Each encoding of the body is a different representation with its own ETag
+            response.set_etag(entry[3] + "-gzip")
+        else:
+            response = Response(entry[2], mimetype="application/json")
+            response.set_etag(entry[3])
+        response.vary.add("Accept-Encoding")
+        # Browsers revalidate on every request instead of using a stale copy
+        response.headers["Cache-Control"] = "no-cache"
+        return response.make_conditional(request)
+    return wrapper
+
+
+# ── Compression and Static Assets ─────────────────────────────────────────────
+#
+# Text responses are gzipped for clients that accept it; cached JSON bodies are
+# compressed once per cache entry, everything else as it's sent. Links to static
+# files carry a hash of the file's contents (?v=...), so a versioned URL never
+# changes meaning and browsers may keep it for a year; a new version of the file
+# gets a new URL.
+
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+GZIP_MIMETYPES = ("application/json", "text/html", "text/css", "text/javascript",
+                  "application/javascript", "image/svg+xml")
+STATIC_MAX_AGE = 365 * 86400
+
+_static_hashes = {}
+
+
+def _gzip(body):
+    """gzip of body, or None if it's too small to be worth compressing."""
+    if len(body) < GZIP_MIN_BYTES:
+        return None
+    # A fixed mtime makes the output, and its ETag, the same in every worker
+    return gzip.compress(body, GZIP_LEVEL, mtime=0)
+
+
+def _accepts_gzip():
+    return "gzip" in request.accept_encodings
+
+
+@app.after_request
+def _compress(response):
+    if (response.status_code != 200 or response.mimetype not in GZIP_MIMETYPES
+            or "Content-Encoding" in response.headers or not _accepts_gzip()):
+        return response
+    response.vary.add("Accept-Encoding")
+    # Static files are sent straight from disk unless their body is read here
+    response.direct_passthrough = False
+    body = _gzip(response.get_data())
+    if body is not None:
+        response.set_data(body)
+        response.headers["Content-Encoding"] = "gzip"
+        # Byte ranges would have to index the compressed body
+        response.headers.pop("Accept-Ranges", None)
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+    return response
+
+
+def _static_hash(filename):
+    """Short hash of a static file's contents, recomputed when the file changes."""
+    path = os.path.join(app.static_folder, filename)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _static_hashes.get(filename)
+    if cached is None or cached[0] != mtime:
+        with open(path, "rb") as f:
+            cached = (mtime, hashlib.sha1(f.read()).hexdigest()[:12])
+        _static_hashes[filename] = cached
+    return cached[1]
+
+
+@app.url_defaults
+def _static_version(endpoint, values):
+    """Add ?v=<content hash> to url_for('static', ...) links."""
+    if endpoint == "static" and "filename" in values:
+        version = _static_hash(values["filename"])
+        if version:
+            values["v"] = version
+
+
+@app.after_request
+def _static_cache(response):
+    """Let browsers keep static files requested by their current versioned URL."""
+    if request.endpoint == "static" and response.status_code in (200, 304):
+        version = request.args.get("v")
+        if version and version == _static_hash(request.view_args["filename"]):
+            response.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE}, immutable"
+    return response
+
+
 # ── Transport Filter Helper ────────────────────────────────────────────────────
 
 def _transport_clauses(table_alias="", param_name="transport"):
@@ -47,6 +272,111 @@ def _transport_clauses(table_alias="", param_name="transport"):
     return "", [], transport
 
 
+# ── Row Encoding ──────────────────────────────────────────────────────────────
+#
+# traffic and packets_raw store node/packet ids as uint32 INTEGERs, ts as epoch
+# milliseconds UTC, msg_type as an id into msg_types and key_used as 1 (public)
+# or 2 (private); see script/db.py. The API keeps returning the text forms.
+
+KEY_PUBLIC = 1
+KEY_PRIVATE = 2
+
+
+def _hex_sql(column):
+    """SQL rendering a uint32 id column as the 8-char hex string."""
+    return f"printf('%08x', {column})"
+
+
+def _node_name_sql(alias="n"):
+    """SQL rendering a nodes row's display name like the listener's resolve_name().
+
+    For rows whose traffic row may have been pruned, joined on
+    nodes {alias} ON {alias}.node_id = <hex id>; falls back to the hex id."""
+    return (
+        f"CASE WHEN {alias}.long_name != '' AND {alias}.short_name != '' "
+        f"THEN {alias}.long_name || ' (' || {alias}.short_name || ')' "
+        f"ELSE COALESCE(NULLIF({alias}.long_name, ''), NULLIF({alias}.short_name, ''), {alias}.node_id) END"
+    )
+
+
+def _time_sql(column):
+    """SQL rendering an epoch-ms column as a local time string."""
+    return f"strftime('%Y-%m-%d %H:%M:%f', {column} / 1000.0, 'unixepoch', 'localtime')"
+
+
+def _time_str(ms):
+    """Python equivalent of _time_sql() for a single epoch-ms value."""
+    return datetime.fromtimestamp(ms / 1000.0).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+
+def _key_used_sql(column):
+    return f"CASE {column} WHEN {KEY_PUBLIC} THEN 'public' WHEN {KEY_PRIVATE} THEN 'private' END"
+
+
+def _node_int(node_id):
+    """uint32 value of a hex node id from a request, or None if it isn't one."""
+    try:
+        return int(node_id, 16)
+    except (TypeError, ValueError):
+        return None
+
+
+def _msg_type_id(name):
+    """msg_types id for name, or None if that type has never been logged."""
+    row = db().execute("SELECT id FROM msg_types WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else None
+
+
+def _fts_query(text, columns=None):
+    """FTS5 query matching rows with a word starting with each word of text, or None.
+
+    Each word is quoted, so user input can't inject FTS5 operators."""
+    words = re.findall(r"\w+", text or "")
+    if not words:
+        return None
+    query = " ".join(f'"{word}"*' for word in words)
+    return f"{columns} : ({query})" if columns else query
+
+
+def _since_id():
+    """since_id cursor of the request: None if absent, 0 for "everything".
+
+    Cursors are traffic ids. Requests with one get {"cursor": ..., <rows>: [...]}
+    back instead of a bare list, holding only what changed after since_id; the
+    cursor to pass next time is the newest traffic id when the response was read."""
+    value = request.args.get("since_id", "").strip()
+    return max(int(value), 0) if value else None
+
+
+def _cursor():
+    return db().execute("SELECT COALESCE(MAX(id), 0) FROM traffic").fetchone()[0]
+
+
+def _touched_nodes(since_id, cursor):
+    """uint32 ids of the nodes sending or addressed by traffic in (since_id, cursor]."""
+    rows = db().execute(
+        "SELECT source_id FROM traffic WHERE id > ? AND id <= ? "
+        "UNION SELECT dest_id FROM traffic WHERE id > ? AND id <= ?",
+        (since_id, cursor, since_id, cursor),
+    ).fetchall()
+    return [r[0] for r in rows if r[0] is not None]
+
+
+def _since_ms(seconds):
+    """Epoch-ms cutoff for a window of the last `seconds`."""
+    return int((time.time() - seconds) * 1000)
+
+
+def _traffic_columns(alias="t"):
+    return (
+        f"{alias}.id, {_time_sql(alias + '.ts')} AS timestamp, "
+        f"{_hex_sql(alias + '.source_id')} AS source_id, {alias}.source_name, "
+        f"{_hex_sql(alias + '.dest_id')} AS dest_id, {alias}.dest_name, "
+        f"{_hex_sql(alias + '.packet_id')} AS packet_id, {alias}.channel_hash, {alias}.channel_name, "
+        f"{alias}.port_num, m.name AS msg_type, {alias}.data, {_key_used_sql(alias + '.key_used')} AS key_used"
+    )
+
+
 # ── Routes ────────────────────────────────────────────────────────────────────
 
 @app.route("/")
@@ -55,67 +385,95 @@ def index():
 
 
 @app.route("/api/nodes")
+@_cached
 def api_nodes():
-    rows = db_conn.execute(
-        "SELECT node_id, long_name, short_name, hw_model, role, "
-        "       first_seen, last_seen "
-        "FROM nodes ORDER BY last_seen DESC"
-    ).fetchall()
+    _, _, transport = _transport_clauses()
+    try:
+        since_id = _since_id()
+    except ValueError:
+        return jsonify({"error": "since_id must be an integer"}), 400
+    if since_id is None:
+        return jsonify(_node_entries(db(), transport))
+
+    # Nodes only change through traffic (node_summary triggers, nodeinfo, last_seen)
+    cursor = _cursor()
+    node_ids = None
+    if since_id:
+        node_ids = [f"{n:08x}" for n in _touched_nodes(since_id, cursor)]
+    nodes = _node_entries(db(), transport, node_ids) if node_ids != [] else []
+    return jsonify({"cursor": cursor, "nodes": nodes, "online_nodes": _online_count(db(), transport)})
+
+
+def _online_count(conn, transport):
+    """Nodes active in the last 2h, for the header and scaled interval calculation."""
+    activity_col = {"rf": "last_rf", "mqtt": "last_mqtt"}.get(transport, "last_ts")
+    return conn.execute(
+        f"SELECT COUNT(*) FROM node_summary WHERE {activity_col} >= ?",
+        (_since_ms(2 * 3600),),
+    ).fetchone()[0]
 
-    transport_clause, _, transport = _transport_clauses()
 
-    # Build optional WHERE for transport-filtered queries
-    tw = f"WHERE {transport_clause}" if transport_clause else ""
-    tw_and = f"AND {transport_clause}" if transport_clause else ""
+def _node_entries(conn, transport, node_ids=None):
+    """/api/nodes entries for transport ("", "rf" or "mqtt"), all nodes or just node_ids (hex)."""
+    where, params = "", []
+    if node_ids is not None:
+        where = f"WHERE node_id IN ({', '.join('?' * len(node_ids))}) "
+        params = list(node_ids)
 
-    # Enrich with last activity and last nodeinfo timestamps
-    activity_rows = db_conn.execute(
-        f"SELECT source_id, MAX(timestamp) AS last_activity "
-        f"FROM traffic {tw} "
-        f"GROUP BY source_id"
+    rows = conn.execute(
+        "SELECT node_id, long_name, short_name, hw_model, role, "
+        "       first_seen, last_seen "
+        f"FROM nodes {where}ORDER BY last_seen DESC",
+        params,
     ).fetchall()
-    activity_map = {r["source_id"]: r["last_activity"] for r in activity_rows}
 
-    # Last NODEINFO_APP per node
-    nodeinfo_rows = db_conn.execute(
-        f"SELECT source_id, MAX(timestamp) AS last_nodeinfo "
-        f"FROM traffic WHERE msg_type = 'NODEINFO_APP' {tw_and} "
-        f"GROUP BY source_id"
+    # Per-node activity comes from node_summary, which the listener keeps current on
+    # every insert, so this is one row per node regardless of traffic history
+    activity_col = {"rf": "last_rf", "mqtt": "last_mqtt"}.get(transport, "last_ts")
+    nodeinfo_col = {"rf": "last_nodeinfo_rf", "mqtt": "last_nodeinfo_mqtt"}.get(
+        transport, "NULLIF(MAX(COALESCE(last_nodeinfo_rf, 0), COALESCE(last_nodeinfo_mqtt, 0)), 0)")
+
+    int_where, int_params = "", []
+    if node_ids is not None:
+        int_params = [_node_int(n) for n in node_ids]
+        int_where = f"WHERE {{column}} IN ({', '.join('?' * len(int_params))})"
+
+    summary_rows = conn.execute(
+        f"SELECT {_hex_sql('node_id')} AS node_id, mqtt_count, direct_rf_count, rf_count, "
+        f"       {_time_sql(activity_col)} AS last_activity, "
+        f"       {_time_sql(nodeinfo_col)} AS last_nodeinfo, "
+        f"       {_time_sql('last_rf')} AS last_rf, {_time_sql('last_mqtt')} AS last_mqtt "
+        f"FROM node_summary {int_where.format(column='node_id')}",
+        int_params,
     ).fetchall()
-    nodeinfo_map = {r["source_id"]: r["last_nodeinfo"] for r in nodeinfo_rows}
-
-    # Count online nodes (active in last 2h) for scaled interval calculation
-    online_count = db_conn.execute(
-        f"SELECT COUNT(DISTINCT source_id) FROM traffic "
-        f"WHERE timestamp >= datetime('now', '-2 hours') {tw_and}"
-    ).fetchone()[0]
-
-    # Per-node transport aggregates
-    transport_rows = db_conn.execute(
-        "SELECT source_id, "
-        "  SUM(CASE WHEN via_mqtt = 1 THEN 1 ELSE 0 END) AS mqtt_count, "
-        "  SUM(CASE WHEN via_mqtt = 0 AND hop_start > 0 AND hop_start = hop_limit THEN 1 ELSE 0 END) AS direct_rf_count, "
-        "  SUM(CASE WHEN via_mqtt = 0 THEN 1 ELSE 0 END) AS rf_count, "
-        "  MAX(CASE WHEN via_mqtt = 0 THEN timestamp END) AS last_rf, "
-        "  MAX(CASE WHEN via_mqtt = 1 THEN timestamp END) AS last_mqtt "
-        "FROM traffic GROUP BY source_id"
+    summary_map = {r["node_id"]: dict(r) for r in summary_rows}
+
+    # Latest position per node, for the directory's map pins
+    position_rows = conn.execute(
+        f"SELECT {_hex_sql('r.id')} AS node_id, {_position_columns()} "
+        f"FROM node_positions r JOIN positions p ON p.id = r.position_id "
+        f"{int_where.format(column='r.id')}",
+        int_params,
     ).fetchall()
-    transport_map = {r["source_id"]: dict(r) for r in transport_rows}
+    position_map = {r["node_id"]: _position_entry(r) for r in position_rows}
+
+    online_count = _online_count(conn, transport)
 
     result = []
     for r in rows:
         node = dict(r)
-        node["last_activity"] = activity_map.get(r["node_id"])
-        node["last_nodeinfo"] = nodeinfo_map.get(r["node_id"])
+        td = summary_map.get(r["node_id"], {})
+        node["last_activity"] = td.get("last_activity")
+        node["last_nodeinfo"] = td.get("last_nodeinfo")
         node["online_nodes"] = online_count
 
         # Merge transport data
-        td = transport_map.get(r["node_id"], {})
         node["mqtt_count"] = td.get("mqtt_count", 0) or 0
         node["direct_rf_count"] = td.get("direct_rf_count", 0) or 0
         node["rf_count"] = td.get("rf_count", 0) or 0
         node["last_rf"] = td.get("last_rf")
         node["last_mqtt"] = td.get("last_mqtt")
+        node["position"] = position_map.get(r["node_id"])
 
         # Filter nodes by transport if requested
         if transport == "rf" and node["rf_count"] == 0:
@@ -125,113 +483,325 @@ def api_nodes():
 
         result.append(node)
 
-    return jsonify(result)
+    return result
 
 
 @app.route("/api/traffic")
+@_cached
 def api_traffic():
     limit = request.args.get("limit", "50")
     try:
         limit = min(int(limit), 500)
     except ValueError:
         limit = 50
+    try:
+        since_id = _since_id()
+    except ValueError:
+        return jsonify({"error": "since_id must be an integer"}), 400
 
     clauses = []
     params = []
 
     msg_type = request.args.get("msg_type")
     if msg_type:
-        clauses.append("msg_type = ?")
-        params.append(msg_type)
-
-    node = request.args.get("node")
-    if node:
-        like = f"%{node}%"
-        clauses.append(
-            "(source_id LIKE ? OR source_name LIKE ? "
-            "OR dest_id LIKE ? OR dest_name LIKE ?)"
-        )
-        params.extend([like, like, like, like])
-
-    transport_clause, _, _ = _transport_clauses()
+        clauses.append("t.msg_type = ?")
+        params.append(_msg_type_id(msg_type))
+
+    # Node filter: prefix match on source/dest ID and name words via traffic_fts
+    source = "traffic t"
+    order = "t.id"
+    match = _fts_query(request.args.get("node", ""), "{source dest}")
+    if match:
+        source = "traffic_fts JOIN traffic t ON t.id = traffic_fts.rowid"
+        order = "traffic_fts.rowid"
+        clauses.append("traffic_fts MATCH ?")
+        params.append(match)
+
+    transport_clause, _, _ = _transport_clauses("t")
     if transport_clause:
         clauses.append(transport_clause)
 
+    cursor = None
+    if since_id is not None:
+        cursor = _cursor()
+        clauses.append(f"{order} > ? AND {order} <= ?")
+        params += [since_id, cursor]
+
     where = ""
     if clauses:
         where = "WHERE " + " AND ".join(clauses)
 
     query = (
-        f"SELECT id, timestamp, source_id, source_name, dest_id, dest_name, "
-        f"       packet_id, channel_hash, channel_name, port_num, msg_type, data, key_used, "
-        f"       via_mqtt, hop_start, hop_limit "
-        f"FROM traffic {where} ORDER BY id DESC LIMIT ?"
+        f"SELECT {_traffic_columns()}, "
+        f"       t.via_mqtt, t.hop_start, t.hop_limit, t.preset "
+        f"FROM {source} LEFT JOIN msg_types m ON m.id = t.msg_type "
+        f"{where} ORDER BY {order} DESC LIMIT ?"
     )
     params.append(limit)
 
-    rows = db_conn.execute(query, params).fetchall()
-    return jsonify([dict(r) for r in rows])
+    rows = [dict(r) for r in db().execute(query, params).fetchall()]
+    if cursor is not None:
+        return jsonify({"cursor": cursor, "traffic": rows})
+    return jsonify(rows)
+
+
+# ── Positions ─────────────────────────────────────────────────────────────────
+#
+# positions holds every fix (see script/db.py); node_positions is an R*Tree of each
+# node's latest fix, queried by bounding box.
+
+# Below this map zoom /api/positions groups nodes into grid clusters
+CLUSTER_BELOW_ZOOM = 10
+# Grid cells per 256px map tile side, i.e. roughly 64px cells
+CLUSTER_CELLS_PER_TILE = 4
+
+_POSITION_DETAILS = ("precision_bits", "altitude", "sats_in_view", "ground_speed")
+
+
+def _position_columns(alias="p"):
+    return (
+        f"{alias}.latitude, {alias}.longitude, "
+        + "".join(f"{alias}.{field}, " for field in _POSITION_DETAILS)
+        + f"{_time_sql(alias + '.ts')} AS timestamp"
+    )
+
+
+def _position_entry(row):
+    """Position dict as the API returns it; detail fields only when reported."""
+    entry = {key: row[key] for key in ("latitude", "longitude", "timestamp")}
+    for field in _POSITION_DETAILS:
+        if row[field] is not None:
+            entry[field] = row[field]
+    return entry
+
+
+def _bbox_clause(bbox, alias="r"):
+    """(where, params) limiting node_positions to a west,south,east,north box.
+
+    Longitudes from a panned Leaflet map can run past +/-180; a box crossing the
+    antimeridian matches both sides."""
+    west, south, east, north = (float(v) for v in bbox.split(","))
+    clause = f"{alias}.max_lat >= ? AND {alias}.min_lat <= ?"
+    params = [south, north]
+    if east < west:
+        east += 360
+    if east - west >= 360:
+        return clause, params
+
+    shift = (west + 180) // 360 * 360
+    west, east = west - shift, east - shift
+    if east <= 180:
+        clause += f" AND {alias}.max_lon >= ? AND {alias}.min_lon <= ?"
+        params += [west, east]
+    else:
+        clause += f" AND ({alias}.max_lon >= ? OR {alias}.min_lon <= ?)"
+        params += [west, east - 360]
+    return clause, params
 
 
 @app.route("/api/positions")
+@_cached
 def api_positions():
-    query = """
-        SELECT t.source_id, t.source_name, t.data, t.timestamp
-        FROM traffic t
-        INNER JOIN (
-            SELECT source_id, MAX(id) AS max_id
-            FROM traffic
-            WHERE msg_type = 'POSITION_APP'
-            GROUP BY source_id
-        ) latest ON t.id = latest.max_id
-    """
-    rows = db_conn.execute(query).fetchall()
-
-    positions = []
-    for row in rows:
+    """Latest position of each node, optionally within bbox=west,south,east,north.
+
+    With zoom below CLUSTER_BELOW_ZOOM, nodes are grouped into grid cells sized to
+    the zoom level; a cell holding several nodes is returned as one entry with
+    "cluster": true, its node count, centre and bounds.
+
+    With since_id, "full" in the response says whether "positions" replaces the
+    previous set (since_id=0, or clusters after any node moved) or only holds the
+    nodes that reported a new fix since, wherever they are now."""
+    where, params = "", []
+    bbox = request.args.get("bbox", "").strip()
+    if bbox:
         try:
-            data = json.loads(row["data"]) if row["data"] else {}
-        except (json.JSONDecodeError, TypeError):
-            continue
+            clause, params = _bbox_clause(bbox)
+        except ValueError:
+            return jsonify({"error": "bbox must be west,south,east,north"}), 400
+        where = f"WHERE {clause}"
 
-        lat = data.get("latitude", 0)
-        lng = data.get("longitude", 0)
-        if lat == 0 and lng == 0:
-            continue
+    try:
+        zoom = int(request.args.get("zoom", CLUSTER_BELOW_ZOOM))
+        since_id = _since_id()
+    except ValueError:
+        return jsonify({"error": "zoom and since_id must be integers"}), 400
+
+    cursor = None
+    if since_id is not None:
+        cursor = _cursor()
+    if since_id:
+        # positions ids are the traffic ids of the fixes
+        moved = [r[0] for r in db().execute(
+            "SELECT DISTINCT node_id FROM positions WHERE id > ? AND id <= ?", (since_id, cursor))]
+        if not moved:
+            return jsonify({"cursor": cursor, "full": False, "positions": []})
+        if zoom >= CLUSTER_BELOW_ZOOM:
+            where = f"WHERE r.id IN ({', '.join('?' * len(moved))})"
+            params = moved
+
+    position_ids = None
+    clusters = []
+    if zoom < CLUSTER_BELOW_ZOOM:
+        cell = 360.0 / (2 ** max(zoom, 0)) / CLUSTER_CELLS_PER_TILE
+        cells = db().execute(
+            f"SELECT COUNT(*) AS count, MAX(r.position_id) AS position_id, "
+            f"       AVG(r.min_lat) AS latitude, AVG(r.min_lon) AS longitude, "
+            f"       MIN(r.min_lon) AS west, MIN(r.min_lat) AS south, "
+            f"       MAX(r.max_lon) AS east, MAX(r.max_lat) AS north "
+            f"FROM node_positions r {where} "
+            f"GROUP BY CAST((r.min_lat + 90) / ? AS INTEGER), CAST((r.min_lon + 180) / ? AS INTEGER)",
+            params + [cell, cell],
+        ).fetchall()
 
-        entry = {
-            "source_id": row["source_id"],
-            "source_name": row["source_name"],
-            "latitude": lat,
-            "longitude": lng,
-            "timestamp": row["timestamp"],
-        }
-        if "precision_bits" in data:
-            entry["precision_bits"] = data["precision_bits"]
-        if "altitude" in data:
-            entry["altitude"] = data["altitude"]
-        if "sats_in_view" in data:
-            entry["sats_in_view"] = data["sats_in_view"]
-        if "ground_speed" in data:
-            entry["ground_speed"] = data["ground_speed"]
-        positions.append(entry)
+        position_ids = [c["position_id"] for c in cells if c["count"] == 1]
+        for c in cells:
+            if c["count"] > 1:
+                clusters.append({
+                    "cluster": True,
+                    "count": c["count"],
+                    "latitude": round(c["latitude"], 5),
+                    "longitude": round(c["longitude"], 5),
+                    "bounds": [round(c[k], 5) for k in ("west", "south", "east", "north")],
+                })
+
+    if position_ids is None:
+        rows = db().execute(
+            f"SELECT {_hex_sql('p.node_id')} AS source_id, {_node_name_sql()} AS source_name, "
+            f"       {_position_columns()} "
+            f"FROM node_positions r JOIN positions p ON p.id = r.position_id "
+            f"LEFT JOIN nodes n ON n.node_id = {_hex_sql('p.node_id')} {where}",
+            params,
+        ).fetchall()
+    elif position_ids:
+        rows = db().execute(
+            f"SELECT {_hex_sql('p.node_id')} AS source_id, {_node_name_sql()} AS source_name, "
+            f"       {_position_columns()} "
+            f"FROM positions p LEFT JOIN nodes n ON n.node_id = {_hex_sql('p.node_id')} "
+            f"WHERE p.id IN ({', '.join('?' * len(position_ids))})",
+            position_ids,
+        ).fetchall()
+    else:
+        rows = []
+
+    positions = [dict(source_id=r["source_id"], source_name=r["source_name"], **_position_entry(r))
+                 for r in rows]
+    if cursor is not None:
+        full = not since_id or zoom < CLUSTER_BELOW_ZOOM
+        return jsonify({"cursor": cursor, "full": full, "positions": positions + clusters})
+    return jsonify(positions + clusters)
+
+
+def _simplify(points, tolerance):
+    """Douglas-Peucker: drop points closer than `tolerance` metres to the simplified line.
+
+    points are (latitude, longitude, ...) tuples. Distances use an equirectangular
+    projection around the track, which is plenty accurate at map-pixel tolerances."""
+    if tolerance <= 0 or len(points) < 3:
+        return points
+
+    cos_lat = math.cos(math.radians(points[0][0]))
+    xy = [(p[1] * 111320.0 * cos_lat, p[0] * 110540.0) for p in points]
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = xy[first], xy[last]
+        dx, dy = x2 - x1, y2 - y1
+        length = math.hypot(dx, dy)
+
+        farthest, distance = None, tolerance
+        for i in range(first + 1, last):
+            x, y = xy[i]
+            if length:
+                d = abs(dy * (x - x1) - dx * (y - y1)) / length
+            else:
+                d = math.hypot(x - x1, y - y1)
+            if d > distance:
+                farthest, distance = i, d
+
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+
+    return [p for p, k in zip(points, keep) if k]
+
+
+@app.route("/api/tracks")
+@_cached
+def api_tracks():
+    """Position history of one node, simplified for display at map zoom `zoom`.
+
+    since/until are epoch seconds (default: the last 24 hours). With zoom, points
+    closer than about one screen pixel at that zoom to the simplified line are
+    dropped; without it every fix is returned."""
+    node = _node_int(request.args.get("node", "").strip())
+    if node is None:
+        return jsonify({"error": "node is required"}), 400
+
+    now = time.time()
+    try:
+        until_ms = int(float(request.args.get("until", now)) * 1000)
+        since_ms = int(float(request.args.get("since", now - 86400)) * 1000)
+        zoom = request.args.get("zoom")
+        zoom = None if zoom is None else min(max(int(zoom), 0), 22)
+    except ValueError:
+        return jsonify({"error": "since, until and zoom must be numbers"}), 400
+
+    cursor = db().execute(
+        "SELECT latitude, longitude, ts FROM positions "
+        "WHERE node_id = ? AND ts >= ? AND ts < ? ORDER BY ts",
+        (node, since_ms, until_ms),
+    )
+    points = []
+    while True:
+        batch = cursor.fetchmany(1000)
+        if not batch:
+            break
+        points.extend(tuple(r) for r in batch)
+    total = len(points)
+
+    tolerance = 0.0
+    if zoom is not None and points:
+        # Ground size of one 256px-tile pixel at this zoom and latitude
+        tolerance = 156543.03 * math.cos(math.radians(points[0][0])) / (2 ** zoom)
+        points = _simplify(points, tolerance)
 
-    return jsonify(positions)
+    return jsonify({
+        "node": f"{node:08x}",
+        "since": _time_str(since_ms),
+        "until": _time_str(until_ms),
+        "tolerance_m": round(tolerance, 1),
+        "total_points": total,
+        "points": [{"latitude": lat, "longitude": lng, "timestamp": _time_str(ts)}
+                   for lat, lng, ts in points],
+    })
 
 
 @app.route("/api/watchlist")
+@_cached
 def api_watchlist():
     nodes_param = request.args.get("nodes", "").strip()
-    if not nodes_param:
-        return jsonify([])
-
     node_ids = [n.strip() for n in nodes_param.split(",") if n.strip()]
+    try:
+        since_id = _since_id()
+    except ValueError:
+        return jsonify({"error": "since_id must be an integer"}), 400
+
+    cursor = None
+    if since_id is not None:
+        cursor = _cursor()
+    if since_id:
+        touched = set(_touched_nodes(since_id, cursor))
+        node_ids = [n for n in node_ids if _node_int(n) in touched]
     if not node_ids:
-        return jsonify([])
+        return jsonify([] if cursor is None else {"cursor": cursor, "watchlist": []})
 
     # Fetch node info
     placeholders = ",".join("?" * len(node_ids))
-    node_rows = db_conn.execute(
+    node_rows = db().execute(
         f"SELECT node_id, long_name, short_name, hw_model, role, "
         f"       first_seen, last_seen "
         f"FROM nodes WHERE node_id IN ({placeholders})",
@@ -239,71 +809,120 @@ def api_watchlist():
     ).fetchall()
     node_map = {r["node_id"]: dict(r) for r in node_rows}
 
+    node_ints = [_node_int(nid) for nid in node_ids]
+    values = ", ".join(["(?)"] * len(node_ints))
+
+    # Last 5 traffic entries of every watched node in one statement. Each node's 5
+    # newest rows per message type as source, and as destination, come straight off
+    # idx_traffic_type_source_id and idx_traffic_dest_id; ROW_NUMBER() then keeps
+    # the newest 5 of those candidates per node.
+    traffic_rows = db().execute(
+        f"WITH watched(node_id) AS (VALUES {values}), "
+        f"candidates AS ("
+        f"  SELECT w.node_id, t.id FROM watched w, msg_types m JOIN traffic t ON t.id IN ("
+        f"    SELECT id FROM traffic WHERE msg_type = m.id AND source_id = w.node_id "
+        f"    ORDER BY id DESC LIMIT 5) "
+        f"  UNION "
+        f"  SELECT w.node_id, t.id FROM watched w JOIN traffic t ON t.id IN ("
+        f"    SELECT id FROM traffic WHERE dest_id = w.node_id ORDER BY id DESC LIMIT 5)"
+        f"), ranked AS ("
+        f"  SELECT node_id, id, ROW_NUMBER() OVER (PARTITION BY node_id ORDER BY id DESC) AS rn "
+        f"  FROM candidates"
+        f") "
+        f"SELECT r.node_id AS watched_id, {_traffic_columns()} "
+        f"FROM ranked r JOIN traffic t ON t.id = r.id LEFT JOIN msg_types m ON m.id = t.msg_type "
+        f"WHERE r.rn <= 5 ORDER BY r.node_id, r.rn",
+        node_ints,
+    ).fetchall()
+    traffic_map = {}
+    for r in traffic_rows:
+        row = dict(r)
+        traffic_map.setdefault(row.pop("watched_id"), []).append(row)
+
+    # Latest position of every watched node; positions outlives traffic retention
+    pos_rows = db().execute(
+        f"SELECT r.id AS node_id, p.latitude, p.longitude, {_time_sql('p.ts')} AS timestamp "
+        f"FROM node_positions r JOIN positions p ON p.id = r.position_id "
+        f"WHERE r.id IN ({placeholders})",
+        node_ints,
+    ).fetchall()
+    pos_map = {r["node_id"]: {key: r[key] for key in ("latitude", "longitude", "timestamp")}
+               for r in pos_rows}
+
     result = []
-    for nid in node_ids:
+    for nid, node_int in zip(node_ids, node_ints):
         node_info = node_map.get(nid, {"node_id": nid})
-
-        # Last 5 traffic entries involving this node
-        traffic_rows = db_conn.execute(
-            "SELECT id, timestamp, source_id, source_name, dest_id, dest_name, "
-            "       packet_id, channel_hash, channel_name, port_num, msg_type, data, key_used "
-            "FROM traffic "
-            "WHERE source_id = ? OR dest_id = ? "
-            "ORDER BY id DESC LIMIT 5",
-            (nid, nid),
-        ).fetchall()
-
-        # Latest position
-        pos_row = db_conn.execute(
-            "SELECT data, timestamp FROM traffic "
-            "WHERE source_id = ? AND msg_type = 'POSITION_APP' "
-            "ORDER BY id DESC LIMIT 1",
-            (nid,),
-        ).fetchone()
-
-        position = None
-        if pos_row:
-            try:
-                data = json.loads(pos_row["data"]) if pos_row["data"] else {}
-                lat = data.get("latitude", 0)
-                lng = data.get("longitude", 0)
-                if lat != 0 or lng != 0:
-                    position = {
-                        "latitude": lat,
-                        "longitude": lng,
-                        "timestamp": pos_row["timestamp"],
-                    }
-            except (json.JSONDecodeError, TypeError):
-                pass
-
         result.append({
             "node": node_info,
-            "traffic": [dict(r) for r in traffic_rows],
-            "position": position,
+            "traffic": traffic_map.get(node_int, []),
+            "position": pos_map.get(node_int),
         })
 
+    if cursor is not None:
+        return jsonify({"cursor": cursor, "watchlist": result})
     return jsonify(result)
 
 
+@app.route("/api/search")
+@_cached
+def api_search():
+    """Nodes and text messages matching q, best matches first.
+
+    Every word of q must match the start of a word (IDs count as one word), so
+    "ali" finds "Alice" and "1234" finds node 1234abcd."""
+    match = _fts_query(request.args.get("q", ""))
+    if not match:
+        return jsonify({"nodes": [], "messages": []})
+    try:
+        limit = min(int(request.args.get("limit", "20")), 100)
+    except ValueError:
+        limit = 20
+
+    nodes = db().execute(
+        "SELECT n.node_id, n.long_name, n.short_name, n.hw_model, n.last_seen "
+        "FROM nodes_fts JOIN nodes n ON n.node_id = nodes_fts.node_id "
+        "WHERE nodes_fts MATCH ? ORDER BY nodes_fts.rank LIMIT ?",
+        (match, limit),
+    ).fetchall()
+
+    messages = db().execute(
+        f"SELECT {_traffic_columns()} "
+        f"FROM traffic_fts JOIN traffic t ON t.id = traffic_fts.rowid "
+        f"LEFT JOIN msg_types m ON m.id = t.msg_type "
+        f"WHERE traffic_fts MATCH ? ORDER BY traffic_fts.rank, t.id DESC LIMIT ?",
+        (_fts_query(request.args.get("q", ""), "text"), limit),
+    ).fetchall()
+
+    return jsonify({
+        "nodes": [dict(r) for r in nodes],
+        "messages": [dict(r) for r in messages],
+    })
+
+
 @app.route("/api/stats")
+@_cached
 def api_stats():
     transport_clause, _, _ = _transport_clauses()
     tw = f"WHERE {transport_clause}" if transport_clause else ""
     tw_and = f"AND {transport_clause}" if transport_clause else ""
 
-    total_nodes = db_conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
-    total_packets = db_conn.execute(
-        f"SELECT COUNT(*) FROM traffic {tw}"
+    total_nodes = db().execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+    # traffic_counts adds rows pruned by retention back in from the rollups
+    total_packets = db().execute(
+        f"SELECT COALESCE(SUM(packets), 0) FROM traffic_counts {tw}"
     ).fetchone()[0]
 
-    packets_24h = db_conn.execute(
+    packets_24h = db().execute(
         f"SELECT COUNT(*) FROM traffic "
-        f"WHERE timestamp >= datetime('now', '-1 day') {tw_and}"
+        f"WHERE ts >= ? {tw_and}",
+        (_since_ms(86400),),
     ).fetchone()[0]
 
-    type_rows = db_conn.execute(
-        f"SELECT msg_type, COUNT(*) AS cnt FROM traffic "
-        f"{tw} GROUP BY msg_type ORDER BY cnt DESC"
+    type_rows = db().execute(
+        f"SELECT m.name AS msg_type, c.cnt FROM ("
+        f"  SELECT msg_type, SUM(packets) AS cnt FROM traffic_counts {tw} GROUP BY msg_type"
+        f") c JOIN msg_types m ON m.id = c.msg_type "
+        f"ORDER BY c.cnt DESC"
     ).fetchall()
     by_type = {r["msg_type"]: r["cnt"] for r in type_rows}
 
@@ -316,261 +935,413 @@ def api_stats():
 
 
 @app.route("/api/node_telemetry")
+@_cached
 def api_node_telemetry():
     node_id = request.args.get("node", "").strip()
     if not node_id:
         return jsonify(None)
 
-    # Fetch the latest telemetry entries by sub-type for this node
-    rows = db_conn.execute(
-        "SELECT data, timestamp FROM traffic "
-        "WHERE source_id = ? AND msg_type = 'TELEMETRY_APP' "
-        "ORDER BY id DESC LIMIT 20",
-        (node_id,),
-    ).fetchall()
-
     result = {"device": None, "environment": None, "power": None,
               "air_quality": None, "local_stats": None}
 
-    for row in rows:
-        try:
-            data = json.loads(row["data"]) if row["data"] else {}
-        except (json.JSONDecodeError, TypeError):
-            continue
+    # Latest reading of each sub-type, from the typed telemetry tables
+    for ttype in result:
+        row = db().execute(
+            f"SELECT *, {_time_sql('ts')} AS timestamp FROM telemetry_{ttype} "
+            f"WHERE node_id = ? ORDER BY ts DESC, traffic_id DESC LIMIT 1",
+            (_node_int(node_id),),
+        ).fetchone()
+        if row is not None:
+            result[ttype] = {"data": _telemetry_data(ttype, row), "timestamp": row["timestamp"]}
 
-        ttype = data.get("telemetry_type")
-        if ttype and ttype in result and result[ttype] is None:
-            result[ttype] = {"data": data, "timestamp": row["timestamp"]}
+    return jsonify(result)
 
-        # Stop early if we have all types
-        if all(v is not None for v in result.values()):
-            break
 
+def _telemetry_data(ttype, row):
+    """Rebuild the telemetry dict the listener decoded from a telemetry_<type> row."""
+    data = {"telemetry_type": ttype}
+    channels = {}
+    for column in row.keys():
+        value = row[column]
+        if value is None or column in ("traffic_id", "node_id", "ts", "timestamp"):
+            continue
+        if column == "device_time":
+            data["time"] = value
+        elif ttype == "power":
+            # ch<N>_voltage / ch<N>_current
+            ch, field = column[2:].split("_", 1)
+            channels.setdefault(int(ch), {"ch": int(ch)})[field] = value
+        else:
+            data[column] = value
+    if channels:
+        data["channels"] = [channels[ch] for ch in sorted(channels)]
+    return data
+
+
+# ── Telemetry Time Series ─────────────────────────────────────────────────────
+
+TELEMETRY_TYPES = ("device", "environment", "power", "air_quality", "local_stats")
+# (PRAGMA schema_version they were read at, {type: field names}); a migration
+# changes the schema version, open_db() resets it
+_telemetry_metrics = (None, {})
+
+
+def _telemetry_metric(metric):
+    """(table, column) for a metric name, or None if there is no such field.
+
+    A bare field name (battery_level) is looked up in TELEMETRY_TYPES order; fields
+    several types share can be qualified (environment.voltage)."""
+    global _telemetry_metrics
+    schema = db().execute("PRAGMA schema_version").fetchone()[0]
+    if _telemetry_metrics[0] != schema:
+        fields = {}
+        for ttype in TELEMETRY_TYPES:
+            columns = [r["name"] for r in db().execute(f"PRAGMA table_info(telemetry_{ttype})")]
+            fields[ttype] = [c for c in columns if c not in ("traffic_id", "node_id", "ts")]
+        _telemetry_metrics = (schema, fields)
+
+    ttype, _, field = metric.rpartition(".")
+    for candidate in ([ttype] if ttype else TELEMETRY_TYPES):
+        if field in _telemetry_metrics[1].get(candidate, ()):
+            return f"telemetry_{candidate}", field
+    return None
+
+
+def _lttb(rows, threshold):
+    """Largest-Triangle-Three-Buckets downsampling of (ts, value) rows to `threshold` points.
+
+    Keeps the first and last points, and from each bucket in between the point
+    forming the largest triangle with the previously kept point and the next
+    bucket's average, which preserves peaks and dips a plain average flattens."""
+    if threshold >= len(rows) or threshold < 3:
+        return rows
+
+    sampled = [rows[0]]
+    every = (len(rows) - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, len(rows))
+
+        next_bucket = rows[end:next_end] or rows[-1:]
+        avg_x = sum(r[0] for r in next_bucket) / len(next_bucket)
+        avg_y = sum(r[1] for r in next_bucket) / len(next_bucket)
+
+        ax, ay = rows[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (rows[j][1] - ay) - (ax - rows[j][0]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(rows[best])
+        a = best
+
+    sampled.append(rows[-1])
+    return sampled
+
+
+@app.route("/api/timeseries")
+@_cached
+def api_timeseries():
+    """One telemetry metric of a node over a window, reduced to about `points` points.
+
+    mode=minmax (default) returns count/min/avg/max per equal-width time bucket,
+    aggregated in SQL; mode=lttb returns that many actual readings picked by LTTB.
+    since/until are epoch seconds (default: the last 24 hours)."""
+    node = _node_int(request.args.get("node", "").strip())
+    metric = request.args.get("metric", "").strip()
+    target = _telemetry_metric(metric) if metric else None
+    if node is None or target is None:
+        return jsonify({"error": "node and a telemetry metric are required"}), 400
+    table, column = target
+
+    now = time.time()
+    try:
+        until_ms = int(float(request.args.get("until", now)) * 1000)
+        since_ms = int(float(request.args.get("since", now - 86400)) * 1000)
+        points = max(2, min(int(request.args.get("points", "200")), 1000))
+    except ValueError:
+        return jsonify({"error": "since, until and points must be numbers"}), 400
+    if until_ms <= since_ms:
+        return jsonify({"error": "until must be after since"}), 400
+
+    mode = request.args.get("mode", "minmax").strip().lower()
+    result = {
+        "node": f"{node:08x}",
+        "metric": f"{table[len('telemetry_'):]}.{column}",
+        "mode": mode,
+        "since": _time_str(since_ms),
+        "until": _time_str(until_ms),
+    }
+
+    if mode == "lttb":
+        rows = db().execute(
+            f"SELECT ts, {column} FROM {table} "
+            f"WHERE node_id = ? AND ts >= ? AND ts < ? AND {column} IS NOT NULL "
+            f"ORDER BY ts",
+            (node, since_ms, until_ms),
+        ).fetchall()
+        result["readings"] = len(rows)
+        result["points"] = [{"timestamp": _time_str(ts), "value": value}
+                            for ts, value in _lttb([tuple(r) for r in rows], points)]
+        return jsonify(result)
+
+    if mode != "minmax":
+        return jsonify({"error": "mode must be minmax or lttb"}), 400
+
+    # Equal-width buckets across the whole window, so gaps in the data stay gaps
+    width = -(-(until_ms - since_ms) // points)
+    rows = db().execute(
+        f"SELECT {_time_sql('b.start')} AS timestamp, b.count, b.min, b.avg, b.max FROM ("
+        f"  SELECT ? + (ts - ?) / ? * ? AS start, COUNT(*) AS count, "
+        f"         MIN({column}) AS min, AVG({column}) AS avg, MAX({column}) AS max "
+        f"  FROM {table} "
+        f"  WHERE node_id = ? AND ts >= ? AND ts < ? AND {column} IS NOT NULL "
+        f"  GROUP BY 1"
+        f") b ORDER BY b.start",
+        (since_ms, since_ms, width, width, node, since_ms, until_ms),
+    ).fetchall()
+    result["bucket_seconds"] = width / 1000.0
+    result["readings"] = sum(r["count"] for r in rows)
+    result["points"] = [dict(r, avg=round(r["avg"], 3)) for r in rows]
     return jsonify(result)
 
 
 def _safe_table_exists(table_name):
     """Check if a table exists in the database."""
-    row = db_conn.execute(
+    row = db().execute(
         "SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name=?",
         (table_name,),
     ).fetchone()
     return row[0] > 0
 
 
-@app.route("/api/metrics")
-def api_metrics():
-    result = {}
-    transport_clause, _, _ = _transport_clauses()
-
-    # ── Decryption tallies (from packets_raw if available) ────────────────
-    has_raw = _safe_table_exists("packets_raw")
-
-    if has_raw:
-        raw_tw = f"WHERE {transport_clause}" if transport_clause else ""
-        raw_tw_and = f"AND {transport_clause}" if transport_clause else ""
+# /api/metrics is computed for all three transport filters at once, from counters
+# the listener keeps on every packets_raw insert and delete (script/db.py,
+# migration 9), and shared between the filter variants until the data changes.
+# (via_mqtt value of its rows, packets_raw_rebroadcasts row) per ?transport=
+METRICS_TRANSPORTS = {"": (None, -1), "rf": (0, 0), "mqtt": (1, 1)}
+HOUR_MS = 3600 * 1000
+
+_shared_lock = threading.Lock()
+
+
+def _shared(key, compute):
+    """compute() cached under key like a response, for results several responses are built from."""
+    version = _data_version()
+    entry = _cache_entry(key, version)
+    if entry is None:
+        with _shared_lock:
+            entry = _cache_entry(key, version)
+            if entry is None:
+                entry = (version, time.monotonic(), compute(), None, None)
+                _cache_put(key, entry)
+    return entry[2]
+
+
+def _rf_totals(rows):
+    """rf_totals dict over (decrypted, key_used, packets) rows; None counts when there are none."""
+    def total(predicate):
+        return sum(r["packets"] for r in rows if predicate(r)) if rows else None
+    return {
+        "total": sum(r["packets"] for r in rows),
+        "decrypted": total(lambda r: r["decrypted"] == 1),
+        "undecrypted": total(lambda r: r["decrypted"] == 0),
+        "public": total(lambda r: r["key_used"] == KEY_PUBLIC),
+        "private": total(lambda r: r["key_used"] == KEY_PRIVATE),
+    }
+
+
+def _metrics():
+    """The /api/metrics response for each transport filter, keyed like METRICS_TRANSPORTS."""
+    # utilization_id is the node's latest device or local_stats reading with a utilization figure
+    util_rows = db().execute(
+        f"SELECT {_hex_sql('s.node_id')} AS source_id, {_node_name_sql()} AS source_name, "
+        f"       COALESCE(d.channel_utilization, l.channel_utilization) AS channel_utilization, "
+        f"       CASE WHEN d.traffic_id IS NOT NULL THEN d.air_util_tx ELSE l.air_util_tx END AS air_util_tx, "
+        f"       {_time_sql('COALESCE(d.ts, l.ts)')} AS timestamp "
+        f"FROM node_summary s "
+        f"LEFT JOIN telemetry_device d ON d.traffic_id = s.utilization_id "
+        f"LEFT JOIN telemetry_local_stats l ON l.traffic_id = s.utilization_id "
+        f"LEFT JOIN nodes n ON n.node_id = {_hex_sql('s.node_id')} "
+        f"WHERE COALESCE(d.channel_utilization, l.channel_utilization) IS NOT NULL"
+    ).fetchall()
+    channel_utilization = [dict(r) for r in util_rows]
+
+    if not _safe_table_exists("packets_raw"):
+        return {transport: {
+            "rf_totals": None, "rf_totals_24h": None, "hourly": [],
+            "channel_utilization": channel_utilization,
+            "hop_distribution": [], "packet_sizes": None, "duplicates": None, "via_mqtt": 0,
+        } for transport in METRICS_TRANSPORTS}
+
+    # All-time counts per rollup key, pruned rows included (key_used 0 and hop_limit -1 are unknown)
+    totals = db().execute(
+        "SELECT decrypted, key_used, hop_limit, via_mqtt, packets, sized, size_sum, size_min, size_max "
+        "FROM packets_raw_totals"
+    ).fetchall()
 
-        totals = db_conn.execute(
-            f"SELECT "
-            f"  COUNT(*) AS total, "
-            f"  SUM(CASE WHEN decrypted = 1 THEN 1 ELSE 0 END) AS decrypted, "
-            f"  SUM(CASE WHEN decrypted = 0 THEN 1 ELSE 0 END) AS undecrypted, "
-            f"  SUM(CASE WHEN key_used = 'public' THEN 1 ELSE 0 END) AS public_ct, "
-            f"  SUM(CASE WHEN key_used = 'private' THEN 1 ELSE 0 END) AS private_ct "
-            f"FROM packets_raw {raw_tw}"
-        ).fetchone()
-        result["rf_totals"] = {
-            "total": totals["total"],
-            "decrypted": totals["decrypted"],
-            "undecrypted": totals["undecrypted"],
-            "public": totals["public_ct"],
-            "private": totals["private_ct"],
-        }
+    # Last 24h per hour: whole hours from the live counters and rollups, and the
+    # rows of the partial first hour from packets_raw itself
+    since = _since_ms(86400)
+    first_hour = -(-since // HOUR_MS) * HOUR_MS
+    window = db().execute(
+        "SELECT bucket, decrypted, key_used, via_mqtt, SUM(packets) AS packets FROM ("
+        "  SELECT bucket, decrypted, key_used, via_mqtt, packets FROM packets_raw_live WHERE bucket >= :hour "
+        "  UNION ALL "
+        "  SELECT bucket, decrypted, key_used, via_mqtt, packets FROM packets_raw_hourly WHERE bucket >= :hour "
+        "  UNION ALL "
+        "  SELECT bucket, decrypted, key_used, via_mqtt, packets FROM packets_raw_daily WHERE bucket >= :hour "
+        "  UNION ALL "
+        "  SELECT ts / 3600000 * 3600000, decrypted, COALESCE(key_used, 0), COALESCE(via_mqtt, 0), 1 "
+        "  FROM packets_raw WHERE ts >= :since AND ts < :hour"
+        ") GROUP BY 1, 2, 3, 4 ORDER BY 1",
+        {"since": since, "hour": first_hour},
+    ).fetchall()
 
-        # 24h breakdown
-        totals_24h = db_conn.execute(
-            f"SELECT "
-            f"  COUNT(*) AS total, "
-            f"  SUM(CASE WHEN decrypted = 1 THEN 1 ELSE 0 END) AS decrypted, "
-            f"  SUM(CASE WHEN decrypted = 0 THEN 1 ELSE 0 END) AS undecrypted, "
-            f"  SUM(CASE WHEN key_used = 'public' THEN 1 ELSE 0 END) AS public_ct, "
-            f"  SUM(CASE WHEN key_used = 'private' THEN 1 ELSE 0 END) AS private_ct "
-            f"FROM packets_raw WHERE timestamp >= datetime('now', '-1 day') {raw_tw_and}"
-        ).fetchone()
-        result["rf_totals_24h"] = {
-            "total": totals_24h["total"],
-            "decrypted": totals_24h["decrypted"],
-            "undecrypted": totals_24h["undecrypted"],
-            "public": totals_24h["public_ct"],
-            "private": totals_24h["private_ct"],
-        }
+    rebroadcasts = {r["via_mqtt"]: r for r in db().execute("SELECT * FROM packets_raw_rebroadcasts")}
 
-        # Hourly packet counts (last 24h) for graphing
-        hourly = db_conn.execute(
-            f"SELECT strftime('%Y-%m-%dT%H:00:00', timestamp) AS hour, "
-            f"  COUNT(*) AS total, "
-            f"  SUM(CASE WHEN decrypted = 1 THEN 1 ELSE 0 END) AS decrypted, "
-            f"  SUM(CASE WHEN decrypted = 0 THEN 1 ELSE 0 END) AS undecrypted "
-            f"FROM packets_raw "
-            f"WHERE timestamp >= datetime('now', '-1 day') {raw_tw_and} "
-            f"GROUP BY hour ORDER BY hour"
-        ).fetchall()
-        result["hourly"] = [dict(r) for r in hourly]
-    else:
-        result["rf_totals"] = None
-        result["rf_totals_24h"] = None
-        result["hourly"] = []
-
-    # ── Channel utilization (from decoded telemetry) ──────────────────────
-    traffic_tw_and = f"AND {transport_clause}" if transport_clause else ""
-
-    util_rows = db_conn.execute(
-        f"SELECT t.source_id, t.source_name, t.data, t.timestamp "
-        f"FROM traffic t "
-        f"INNER JOIN ( "
-        f"  SELECT source_id, MAX(id) AS max_id "
-        f"  FROM traffic "
-        f"  WHERE msg_type = 'TELEMETRY_APP' "
-        f"    AND data LIKE '%channel_utilization%' "
-        f"  GROUP BY source_id "
-        f") latest ON t.id = latest.max_id"
-    ).fetchall()
+    results = {}
+    for transport, (via_mqtt, rebroadcast_key) in METRICS_TRANSPORTS.items():
+        rows = [r for r in totals if via_mqtt is None or r["via_mqtt"] == via_mqtt]
+        rows_24h = [r for r in window if via_mqtt is None or r["via_mqtt"] == via_mqtt]
 
-    channel_util = []
-    for row in util_rows:
-        try:
-            data = json.loads(row["data"]) if row["data"] else {}
-        except (json.JSONDecodeError, TypeError):
-            continue
-        cu = data.get("channel_utilization")
-        if cu is not None:
-            channel_util.append({
-                "source_id": row["source_id"],
-                "source_name": row["source_name"],
-                "channel_utilization": cu,
-                "air_util_tx": data.get("air_util_tx"),
-                "timestamp": row["timestamp"],
+        hourly = {}
+        for r in rows_24h:
+            hour = hourly.setdefault(r["bucket"], {
+                "hour": datetime.fromtimestamp(r["bucket"] / 1000.0).strftime("%Y-%m-%dT%H:00:00"),
+                "total": 0, "decrypted": 0, "undecrypted": 0,
             })
-    result["channel_utilization"] = channel_util
-
-    # ── Hop count distribution (from packets_raw) ──────────────────────────
-    if has_raw:
-        hop_rows = db_conn.execute(
-            f"SELECT hop_limit, COUNT(*) AS cnt FROM packets_raw "
-            f"WHERE hop_limit IS NOT NULL {raw_tw_and} "
-            f"GROUP BY hop_limit ORDER BY hop_limit"
-        ).fetchall()
-        result["hop_distribution"] = [dict(r) for r in hop_rows]
-
-        # Average packet size
-        size_row = db_conn.execute(
-            f"SELECT AVG(packet_size) AS avg_size, MIN(packet_size) AS min_size, "
-            f"       MAX(packet_size) AS max_size "
-            f"FROM packets_raw WHERE packet_size > 0 {raw_tw_and}"
-        ).fetchone()
-        result["packet_sizes"] = {
-            "avg": round(size_row["avg_size"], 1) if size_row["avg_size"] else 0,
-            "min": size_row["min_size"] or 0,
-            "max": size_row["max_size"] or 0,
+            hour["total"] += r["packets"]
+            hour["decrypted" if r["decrypted"] == 1 else "undecrypted"] += r["packets"]
+
+        hops = {}
+        for r in rows:
+            if r["hop_limit"] >= 0:
+                hops[r["hop_limit"]] = hops.get(r["hop_limit"], 0) + r["packets"]
+
+        sized = [r for r in rows if r["sized"] > 0]
+        size_sum = sum(r["size_sum"] for r in sized)
+        size_count = sum(r["sized"] for r in sized)
+
+        # Rebroadcasts need packet ids, so they only cover packets_raw rows retention hasn't pruned
+        dup = rebroadcasts.get(rebroadcast_key)
+
+        results[transport] = {
+            "rf_totals": _rf_totals(rows),
+            "rf_totals_24h": _rf_totals(rows_24h),
+            "hourly": list(hourly.values()),
+            "channel_utilization": channel_utilization,
+            "hop_distribution": [{"hop_limit": h, "cnt": n} for h, n in sorted(hops.items())],
+            "packet_sizes": {
+                "avg": round(size_sum * 1.0 / size_count, 1) if size_sum else 0,
+                "min": min(r["size_min"] for r in sized) if sized else 0,
+                "max": max(r["size_max"] for r in sized) if sized else 0,
+            },
+            "duplicates": {
+                "rebroadcast_packet_ids": dup["dup_ids"] if dup else 0,
+                "rebroadcast_total_copies": dup["dup_copies"] if dup else 0,
+                "unique_packet_ids": dup["unique_ids"] if dup else 0,
+                "total_packets": dup["packets"] if dup else 0,
+            },
+            "via_mqtt": sum(r["packets"] for r in rows if r["via_mqtt"] == 1),
         }
+    return results
 
-        # Duplicate packet detection (same packet_id seen multiple times)
-        # These are mesh rebroadcasts — the same original packet relayed by different nodes
-        dup_row = db_conn.execute(
-            f"SELECT COUNT(*) AS dup_ids, SUM(cnt) AS dup_total FROM ("
-            f"  SELECT packet_id, COUNT(*) AS cnt FROM packets_raw "
-            f"  WHERE packet_id IS NOT NULL {raw_tw_and} "
-            f"  GROUP BY packet_id HAVING COUNT(*) > 1"
-            f")"
-        ).fetchone()
-        unique_ids = db_conn.execute(
-            f"SELECT COUNT(DISTINCT packet_id) FROM packets_raw "
-            f"WHERE packet_id IS NOT NULL {raw_tw_and}"
-        ).fetchone()[0]
-        total_raw = db_conn.execute(
-            f"SELECT COUNT(*) FROM packets_raw {raw_tw}"
-        ).fetchone()[0]
-        result["duplicates"] = {
-            "rebroadcast_packet_ids": dup_row["dup_ids"] or 0,
-            "rebroadcast_total_copies": dup_row["dup_total"] or 0,
-            "unique_packet_ids": unique_ids or 0,
-            "total_packets": total_raw,
-        }
 
-        # Via MQTT count
-        mqtt_row = db_conn.execute(
-            f"SELECT SUM(CASE WHEN via_mqtt = 1 THEN 1 ELSE 0 END) AS mqtt_ct "
-            f"FROM packets_raw {raw_tw}"
-        ).fetchone()
-        result["via_mqtt"] = mqtt_row["mqtt_ct"] or 0
-    else:
-        result["hop_distribution"] = []
-        result["packet_sizes"] = None
-        result["duplicates"] = None
-        result["via_mqtt"] = 0
+@app.route("/api/metrics")
+@_cached
+def api_metrics():
+    _, _, transport = _transport_clauses()
+    metrics = _shared(("metrics",), _metrics)
+    return jsonify(metrics.get(transport, metrics[""]))
 
-    return jsonify(result)
+
+QUARTER_HOUR_MS = 15 * 60 * 1000
 
 
 @app.route("/api/metrics/activity")
+@_cached
 def api_metrics_activity():
     """Per-node activity patterns over the last 24 hours."""
     transport_clause, _, _ = _transport_clauses()
     tw_and = f"AND {transport_clause}" if transport_clause else ""
 
-    # Top 20 most active nodes in last 24h
-    rows = db_conn.execute(
-        f"SELECT source_id, source_name, COUNT(*) AS pkt_count, "
-        f"       COUNT(DISTINCT msg_type) AS type_count "
-        f"FROM traffic "
-        f"WHERE timestamp >= datetime('now', '-1 day') {tw_and} "
-        f"GROUP BY source_id "
-        f"ORDER BY pkt_count DESC LIMIT 20"
+    # Top 20 most active nodes in last 24h with their per-hour breakdown, in one
+    # statement. Every count comes off idx_traffic_source_ts: the ranking is one
+    # pass over the window, the sparklines are per-node range counts over 15-minute
+    # buckets, labelled with their local hour in Python (UTC offsets are multiples
+    # of 15 minutes). Distinct types are probed on idx_traffic_type_source_id from
+    # the window's first id, so no traffic row is read outside the top 20. The
+    # LIMIT on top keeps it materialized, so its subqueries run once per node.
+    now = _since_ms(0)
+    since = now - 86400 * 1000
+    # Lowest id in the window; "+id" keeps SQLite off a backwards rowid scan
+    first_id = db().execute("SELECT MIN(+id) FROM traffic WHERE ts >= ?", (since,)).fetchone()[0] or 0
+    rows = db().execute(
+        f"WITH RECURSIVE counts AS ("
+        f"  SELECT source_id, COUNT(*) AS pkt_count FROM traffic "
+        f"  WHERE ts >= :since {tw_and} "
+        f"  GROUP BY source_id ORDER BY pkt_count DESC, source_id LIMIT 20"
+        f"), top AS ("
+        f"  SELECT c.source_id, c.pkt_count, "
+        f"         (SELECT source_name FROM traffic "
+        f"          WHERE source_id = c.source_id AND ts >= :since {tw_and} "
+        f"          ORDER BY ts DESC LIMIT 1) AS source_name, "
+        f"         (SELECT COUNT(*) FROM msg_types m WHERE EXISTS ("
+        f"            SELECT 1 FROM traffic WHERE msg_type = m.id AND source_id = c.source_id "
+        f"            AND id >= :first_id AND ts >= :since {tw_and})) AS type_count "
+        f"  FROM counts c ORDER BY c.pkt_count DESC, c.source_id LIMIT 20"
+        f"), buckets(start) AS ("
+        f"  SELECT :since / {QUARTER_HOUR_MS} * {QUARTER_HOUR_MS} "
+        f"  UNION ALL SELECT start + {QUARTER_HOUR_MS} FROM buckets WHERE start + {QUARTER_HOUR_MS} <= :now"
+        f") "
+        f"SELECT top.source_id, top.source_name, top.pkt_count, top.type_count, b.start, "
+        f"       (SELECT COUNT(*) FROM traffic WHERE source_id = top.source_id "
+        f"        AND ts >= MAX(b.start, :since) AND ts < b.start + {QUARTER_HOUR_MS} {tw_and}) AS cnt "
+        f"FROM top, buckets b "
+        f"ORDER BY top.pkt_count DESC, top.source_id, b.start",
+        {"since": since, "now": now, "first_id": first_id},
     ).fetchall()
 
     nodes = []
+    hours = {}
     for r in rows:
-        # Per-hour breakdown for this node
-        hourly = db_conn.execute(
-            f"SELECT strftime('%H', timestamp) AS hour, COUNT(*) AS cnt "
-            f"FROM traffic "
-            f"WHERE source_id = ? AND timestamp >= datetime('now', '-1 day') {tw_and} "
-            f"GROUP BY hour ORDER BY hour",
-            (r["source_id"],),
-        ).fetchall()
-        hourly_map = {h["hour"]: h["cnt"] for h in hourly}
-
-        nodes.append({
-            "source_id": r["source_id"],
-            "source_name": r["source_name"],
-            "pkt_count": r["pkt_count"],
-            "type_count": r["type_count"],
-            "hourly": hourly_map,
-        })
-
-    # Position update frequency — average interval between POSITION_APP per node
-    pos_freq = db_conn.execute(
+        if not nodes or nodes[-1]["source_id"] != f"{r['source_id']:08x}":
+            nodes.append({
+                "source_id": f"{r['source_id']:08x}",
+                "source_name": r["source_name"],
+                "pkt_count": r["pkt_count"],
+                "type_count": r["type_count"],
+                "hourly": {},
+            })
+        if not r["cnt"]:
+            continue
+        if r["start"] not in hours:
+            hours[r["start"]] = datetime.fromtimestamp(r["start"] / 1000.0).strftime("%H")
+        hourly = nodes[-1]["hourly"]
+        hourly[hours[r["start"]]] = hourly.get(hours[r["start"]], 0) + r["cnt"]
+
+    # Position update frequency — average interval between POSITION_APP per node;
+    # the id bound lets idx_traffic_type_source_id skip rows older than the window
+    pos_freq = db().execute(
         f"SELECT source_id, source_name, COUNT(*) AS pos_count, "
-        f"       MIN(timestamp) AS first_pos, MAX(timestamp) AS last_pos "
+        f"       MIN(ts) AS first_pos, MAX(ts) AS last_pos "
         f"FROM traffic "
-        f"WHERE msg_type = 'POSITION_APP' AND timestamp >= datetime('now', '-1 day') {tw_and} "
+        f"WHERE msg_type = ? AND id >= ? AND ts >= ? {tw_and} "
         f"GROUP BY source_id HAVING pos_count >= 2 "
-        f"ORDER BY pos_count DESC LIMIT 20"
+        f"ORDER BY pos_count DESC LIMIT 20",
+        (_msg_type_id("POSITION_APP"), first_id, since),
     ).fetchall()
 
     pos_frequency = []
     for r in pos_freq:
-        try:
-            from datetime import datetime
-            first = datetime.fromisoformat(r["first_pos"])
-            last = datetime.fromisoformat(r["last_pos"])
-            span = (last - first).total_seconds()
-            avg_interval = span / (r["pos_count"] - 1) if r["pos_count"] > 1 else 0
-        except Exception:
-            avg_interval = 0
+        span = (r["last_pos"] - r["first_pos"]) / 1000.0
+        avg_interval = span / (r["pos_count"] - 1) if r["pos_count"] > 1 else 0
 
         pos_frequency.append({
-            "source_id": r["source_id"],
+            "source_id": f"{r['source_id']:08x}",
             "source_name": r["source_name"],
             "pos_count": r["pos_count"],
             "avg_interval_secs": round(avg_interval),
@@ -582,27 +1353,265 @@ def api_metrics_activity():
     })
 
 
+# ── Live Stream ───────────────────────────────────────────────────────────────
+#
+# /api/stream pushes what the listener has written since the last poll as
+# Server-Sent Events. One tailer thread per process follows traffic and
+# packets_raw by rowid with its own connection and builds each delta once per
+# transport filter, so the database work doesn't depend on how many browsers
+# are connected.
+
+STREAM_POLL_SECONDS = 0.5
+STREAM_HEARTBEAT_SECONDS = 15
+# A poll that finds more new traffic rows than this sends {"resync": true}
+# instead, and clients reload everything
+STREAM_MAX_ROWS = 200
+# Events a client may fall behind by before it is disconnected (it reconnects and resyncs)
+STREAM_QUEUE_SIZE = 50
+
+
+class _Tailer(object):
+    """Polls for new traffic and packets_raw rows and fans deltas out to subscribers."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # queue -> transport filter ("", "rf" or "mqtt")
+        self.subscribers = {}
+        self.thread = None
+
+    def subscribe(self, transport):
+        q = queue.Queue(STREAM_QUEUE_SIZE)
+        with self.lock:
+            self.subscribers[q] = transport
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="stream-tailer", daemon=True)
+                self.thread.start()
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.pop(q, None)
+
+    def run(self):
+        conn = get_db(self.path)
+        traffic_id = raw_id = data_version = None
+
+        while True:
+            time.sleep(STREAM_POLL_SECONDS)
+            with self.lock:
+                transports = set(self.subscribers.values())
+            if not transports:
+                # Nobody listening; pick the cursors up afresh for the next subscriber
+                traffic_id = raw_id = data_version = None
+                continue
+
+            try:
+                # data_version only changes when another connection commits
+                version = conn.execute("PRAGMA data_version").fetchone()[0]
+                if version == data_version:
+                    continue
+                data_version = version
+
+                last_traffic = conn.execute("SELECT COALESCE(MAX(id), 0) FROM traffic").fetchone()[0]
+                last_raw = conn.execute("SELECT COALESCE(MAX(id), 0) FROM packets_raw").fetchone()[0]
+                if traffic_id is None:
+                    traffic_id, raw_id = last_traffic, last_raw
+                    continue
+                if last_traffic == traffic_id and last_raw == raw_id:
+                    continue
+
+                events = self.deltas(conn, transports, traffic_id, last_traffic, raw_id, last_raw)
+                traffic_id, raw_id = last_traffic, last_raw
+            except sqlite3.Error as e:
+                print(f"[webui] Stream poll failed: {e}", file=sys.stderr)
+                continue
+
+            self.publish(events)
+
+    def deltas(self, conn, transports, traffic_from, traffic_to, raw_from, raw_to):
+        """SSE event text per transport for rows in (traffic_from, traffic_to] and (raw_from, raw_to]."""
+        if traffic_to - traffic_from > STREAM_MAX_ROWS:
+            event = f"id: {traffic_to}\ndata: {json.dumps({'resync': True})}\n\n"
+            return {transport: event for transport in transports}
+
+        rows = [dict(r) for r in conn.execute(
+            f"SELECT {_traffic_columns()}, "
+            f"       t.via_mqtt, t.hop_start, t.hop_limit, t.preset "
+            f"FROM traffic t LEFT JOIN msg_types m ON m.id = t.msg_type "
+            f"WHERE t.id > ? AND t.id <= ? ORDER BY t.id",
+            (traffic_from, traffic_to),
+        )]
+
+        raw_rows = conn.execute(
+            f"SELECT via_mqtt, COUNT(*) AS total, "
+            f"  SUM(CASE WHEN decrypted = 1 THEN 1 ELSE 0 END) AS decrypted, "
+            f"  SUM(CASE WHEN decrypted = 0 THEN 1 ELSE 0 END) AS undecrypted, "
+            f"  SUM(CASE WHEN key_used = {KEY_PUBLIC} THEN 1 ELSE 0 END) AS public, "
+            f"  SUM(CASE WHEN key_used = {KEY_PRIVATE} THEN 1 ELSE 0 END) AS private "
+            f"FROM packets_raw WHERE id > ? AND id <= ? GROUP BY via_mqtt",
+            (raw_from, raw_to),
+        ).fetchall()
+
+        total_nodes = conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+        node_ids = sorted({r[key] for r in rows for key in ("source_id", "dest_id") if r[key]})
+
+        events = {}
+        for transport in transports:
+            via_mqtt = {"rf": 0, "mqtt": 1}.get(transport)
+            traffic = [r for r in rows if via_mqtt is None or r["via_mqtt"] == via_mqtt]
+
+            by_type = {}
+            for r in traffic:
+                if r["msg_type"]:
+                    by_type[r["msg_type"]] = by_type.get(r["msg_type"], 0) + 1
+
+            rf = {"total": 0, "decrypted": 0, "undecrypted": 0, "public": 0, "private": 0, "via_mqtt": 0}
+            for r in raw_rows:
+                if via_mqtt is None or r["via_mqtt"] == via_mqtt:
+                    for key in ("total", "decrypted", "undecrypted", "public", "private"):
+                        rf[key] += r[key] or 0
+                    if r["via_mqtt"] == 1:
+                        rf["via_mqtt"] += r["total"]
+
+            delta = {
+                "traffic": traffic,
+                "nodes": _node_entries(conn, transport, node_ids) if node_ids else [],
+                "stats": {"total_nodes": total_nodes, "packets": len(traffic), "by_type": by_type},
+                "rf": rf,
+            }
+            events[transport] = f"id: {traffic_to}\ndata: {json.dumps(delta)}\n\n"
+        return events
+
+    def publish(self, events):
+        with self.lock:
+            for q, transport in list(self.subscribers.items()):
+                try:
+                    q.put_nowait(events[transport])
+                except KeyError:
+                    # Subscribed after this poll started; it resyncs on connect anyway
+                    pass
+                except queue.Full:
+                    # Too far behind: end its stream, the browser reconnects and resyncs
+                    del self.subscribers[q]
+                    with q.mutex:
+                        q.queue.clear()
+                    q.put_nowait(None)
+
+
+_tailer = None
+_tailer_lock = threading.Lock()
+
+
+@app.route("/api/stream")
+def api_stream():
+    """Server-Sent Events with the traffic, node and counter changes since the last event.
+
+    Each event is a JSON delta for the ?transport= filter: new traffic rows, the
+    /api/nodes entries of nodes they touched, and packet counter increments. The
+    first event is {"hello": true}; clients load a full snapshot then, and again
+    whenever they get {"resync": true} or have to reconnect."""
+    global _tailer
+    with _tailer_lock:
+        if _tailer is None:
+            _tailer = _Tailer(db_path)
+    _, _, transport = _transport_clauses()
+    if transport not in ("rf", "mqtt"):
+        transport = ""
+    q = _tailer.subscribe(transport)
+
+    def events():
+        try:
+            yield f"retry: 3000\ndata: {json.dumps({'hello': True})}\n\n"
+            while True:
+                try:
+                    event = q.get(timeout=STREAM_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    # Comment line, keeps proxies from timing the connection out
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    return
+                yield event
+        finally:
+            _tailer.unsubscribe(q)
+
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 # ── Main ──────────────────────────────────────────────────────────────────────
 
-def main():
-    global db_conn
+def _serve(args):
+    """Serve with gunicorn: args.workers processes, each answering args.threads requests at a time.
+
+    Workers don't share memory, so each keeps its own response cache and /api/stream
+    tailer. Every open /api/stream holds one of its worker's threads."""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("Error: --workers needs gunicorn (pip install gunicorn)", file=sys.stderr)
+        sys.exit(1)
+
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"0.0.0.0:{args.port}")
+            self.cfg.set("workers", args.workers)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("threads", args.threads)
+            self.cfg.set("keepalive", args.keep_alive)
+            self.cfg.set("timeout", args.timeout)
+            # Worker heartbeats go to a file; keep that off the SD card
+            if os.path.isdir("/dev/shm"):
+                self.cfg.set("worker_tmp_dir", "/dev/shm")
+
+        def load(self):
+            # Runs in each worker after the fork; SQLite connections must not cross one
+            open_db(args.db)
+            return app
 
+    Server().run()
+
+
+def main():
     default_db = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "mesh.db")
     default_db = os.path.normpath(default_db)
 
     parser = argparse.ArgumentParser(description="Meshtastic SDR Web Dashboard")
     parser.add_argument("--port", type=int, default=5000, help="HTTP port (default 5000)")
     parser.add_argument("--db", default=default_db, help=f"Path to mesh.db (default {default_db})")
+    parser.add_argument("--mmap-size", type=int, default=DB_PRAGMAS["mmap_size"] // (1024 * 1024),
+                        help="SQLite memory-mapped I/O per connection in MiB, 0 disables it (default %(default)s)")
+    parser.add_argument("--cache-size", type=int, default=-DB_PRAGMAS["cache_size"] // 1024,
+                        help="SQLite page cache per connection in MiB (default %(default)s)")
+    parser.add_argument("--temp-store", choices=("default", "file", "memory"), default=DB_PRAGMAS["temp_store"].lower(),
+                        help="Where SQLite keeps temporary sort and GROUP BY tables (default %(default)s)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Serve with this many gunicorn worker processes; 0 uses Flask's development server (default 0)")
+    parser.add_argument("--threads", type=int, default=32,
+                        help="Concurrent requests per worker, open /api/stream connections included (default %(default)s)")
+    parser.add_argument("--keep-alive", type=int, default=5,
+                        help="Seconds an idle HTTP connection is kept open, with --workers (default %(default)s)")
+    parser.add_argument("--timeout", type=int, default=30,
+                        help="Seconds before a stuck worker is restarted, with --workers (default %(default)s)")
     args = parser.parse_args()
 
     if not os.path.isfile(args.db):
         print(f"Error: database not found: {args.db}", file=sys.stderr)
         sys.exit(1)
 
-    db_conn = get_db(args.db)
+    DB_PRAGMAS["mmap_size"] = max(0, args.mmap_size) * 1024 * 1024
+    DB_PRAGMAS["cache_size"] = -max(1, args.cache_size) * 1024
+    DB_PRAGMAS["temp_store"] = args.temp_store.upper()
     print(f"[webui] Database: {args.db}")
+    if args.workers > 0:
+        print(f"[webui] Starting on http://localhost:{args.port} "
+              f"({args.workers} workers x {args.threads} threads)")
+        _serve(args)
+        return
+    open_db(args.db)
     print(f"[webui] Starting on http://localhost:{args.port}")
-    app.run(host="0.0.0.0", port=args.port, debug=False)
+    app.run(host="0.0.0.0", port=args.port, debug=False, threaded=True)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Latency benchmarks for the dashboard API against a synthetic database.
+
+The database is built once with the listener's schema (script/db.py
+migrations, triggers included) and reused by later runs. Node activity is
+skewed so a few nodes send most of the traffic, like a real mesh.
+
+Each endpoint is timed through Flask's test client with the response cache
+cleared, next to the SQL the endpoint ran before it was rewritten.
+
+Usage:
+    python3 benchmark.py [--db /tmp/mesh-bench.db] [--rows 2000000] [--nodes 500]
+                         [--watch 50] [--runs 5]
+
+Example:
+    python3 benchmark.py --rows 5000000 --watch 100
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+
+import app as webui
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "script"))
+import db  # noqa: E402
+
+BROADCAST = 0xffffffff
+
+# (msg_type, share of traffic)
+MSG_MIX = [("NODEINFO_APP", 0.10), ("POSITION_APP", 0.25), ("TELEMETRY_APP", 0.30),
+           ("ROUTING_APP", 0.25), ("TEXT_MESSAGE_APP", 0.10)]
+
+
+def build(path, rows, node_count, days):
+    """Create a synthetic mesh.db at path with `rows` traffic and packets_raw rows over `days`."""
+    print(f"Building {path}: {rows} rows, {node_count} nodes over {days} days ...")
+    start = time.perf_counter()
+    rng = random.Random(1)
+
+    # db.init_db() always opens ../mesh.db, so run the migrations on our own connection
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    db._conn = conn
+    db.migrate()
+
+    now_ms = int(time.time() * 1000)
+    first_ms = now_ms - days * 86400 * 1000
+    seen = time.strftime("%Y-%m-%d %H:%M:%S")
+
+    node_ids = rng.sample(range(0x10000000, 0xfffffff0), node_count)
+    names = {n: f"Node {i:03d}" for i, n in enumerate(node_ids)}
+    conn.executemany(
+        "INSERT INTO nodes (node_id, long_name, short_name, hw_model, role, first_seen, last_seen) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(f"{n:08x}", names[n], names[n][-3:], rng.randint(1, 60), 0, seen, seen) for n in node_ids],
+    )
+    conn.commit()
+
+    # Zipf-like activity: node i sends in proportion to 1 / (i + 1)
+    weights = [1.0 / (i + 1) for i in range(node_count)]
+    type_ids = {}
+    for name, _ in MSG_MIX:
+        conn.execute("INSERT OR IGNORE INTO msg_types (name) VALUES (?)", (name,))
+        type_ids[name] = conn.execute("SELECT id FROM msg_types WHERE name = ?", (name,)).fetchone()[0]
+    conn.commit()
+    types = [type_ids[name] for name, _ in MSG_MIX]
+    type_weights = [share for _, share in MSG_MIX]
+
+    batch = 50000
+    for offset in range(0, rows, batch):
+        count = min(batch, rows - offset)
+        sources = rng.choices(node_ids, weights, k=count)
+        msg_types = rng.choices(types, type_weights, k=count)
+        traffic, raw = [], []
+        for i in range(count):
+            ts = first_ms + (offset + i) * (now_ms - first_ms) // rows
+            src = sources[i]
+            dest = BROADCAST if rng.random() < 0.8 else rng.choice(node_ids)
+            msg_type = msg_types[i]
+            via_mqtt = 1 if rng.random() < 0.2 else 0
+            hop_start = 3
+            hop_limit = rng.randint(0, 3)
+            if msg_type == type_ids["POSITION_APP"]:
+                data = json.dumps({"latitude": 45.5 + rng.uniform(-0.5, 0.5),
+                                   "longitude": -122.6 + rng.uniform(-0.5, 0.5),
+                                   "altitude": rng.randint(0, 500)})
+            elif msg_type == type_ids["TELEMETRY_APP"]:
+                data = json.dumps({"telemetry_type": "device", "battery_level": rng.randint(1, 100),
+                                   "voltage": round(rng.uniform(3.3, 4.2), 3),
+                                   "channel_utilization": round(rng.uniform(0, 30), 2),
+                                   "air_util_tx": round(rng.uniform(0, 5), 2)})
+            elif msg_type == type_ids["TEXT_MESSAGE_APP"]:
+                data = f"message {offset + i}"
+            else:
+                data = None
+            packet_id = rng.getrandbits(32)
+            traffic.append((ts, src, names[src], dest, names.get(dest, "broadcast"), packet_id,
+                            msg_type, data, 1, via_mqtt, hop_start, hop_limit))
+            raw.append((ts, src, dest, packet_id, hop_limit, hop_start, via_mqtt,
+                        rng.randint(20, 240), 1 if rng.random() < 0.7 else 0, rng.choice((1, 2))))
+
+        conn.executemany(
+            "INSERT INTO traffic (ts, source_id, source_name, dest_id, dest_name, packet_id, "
+            "                     msg_type, data, key_used, via_mqtt, hop_start, hop_limit) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            traffic,
+        )
+        conn.executemany(
+            "INSERT INTO packets_raw (ts, source_id, dest_id, packet_id, hop_limit, hop_start, "
+            "                         via_mqtt, packet_size, decrypted, key_used) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            raw,
+        )
+        conn.commit()
+        print(f"  {offset + count} rows", end="\r", flush=True)
+
+    conn.execute("ANALYZE")
+    conn.close()
+    print(f"Built in {time.perf_counter() - start:.0f}s" + " " * 20)
+
+
+# The queries the endpoints ran before they were rewritten, kept for comparison
+
+def legacy_watchlist(conn, node_ids):
+    """Two queries per watched node: last 5 traffic rows and latest position."""
+    for node_id in node_ids:
+        node = int(node_id, 16)
+        conn.execute(
+            f"SELECT {webui._traffic_columns()} "
+            f"FROM traffic t LEFT JOIN msg_types m ON m.id = t.msg_type "
+            f"WHERE t.source_id = ? OR t.dest_id = ? "
+            f"ORDER BY t.id DESC LIMIT 5",
+            (node, node),
+        ).fetchall()
+        conn.execute(
+            "SELECT t.data, t.ts FROM node_summary s JOIN traffic t ON t.id = s.position_id "
+            "WHERE s.node_id = ?",
+            (node,),
+        ).fetchone()
+
+
+def legacy_activity(conn):
+    """Top 20 nodes of the last 24h, an hourly GROUP BY for each of them, then positions."""
+    since = webui._since_ms(86400)
+    rows = conn.execute(
+        "SELECT source_id, source_name, COUNT(*) AS pkt_count, COUNT(DISTINCT msg_type) AS type_count "
+        "FROM traffic WHERE ts >= ? GROUP BY source_id ORDER BY pkt_count DESC LIMIT 20",
+        (since,),
+    ).fetchall()
+    for r in rows:
+        conn.execute(
+            "SELECT strftime('%H', ts / 1000, 'unixepoch', 'localtime') AS hour, COUNT(*) AS cnt "
+            "FROM traffic WHERE source_id = ? AND ts >= ? GROUP BY hour ORDER BY hour",
+            (r["source_id"], since),
+        ).fetchall()
+    conn.execute(
+        "SELECT source_id, source_name, COUNT(*) AS pos_count, MIN(ts) AS first_pos, MAX(ts) AS last_pos "
+        "FROM traffic WHERE msg_type = ? AND ts >= ? "
+        "GROUP BY source_id HAVING pos_count >= 2 ORDER BY pos_count DESC LIMIT 20",
+        (conn.execute("SELECT id FROM msg_types WHERE name = 'POSITION_APP'").fetchone()[0], since),
+    ).fetchall()
+
+
+def legacy_metrics(conn):
+    """The separate passes /api/metrics made over packets_raw and packets_raw_counts."""
+    since = webui._since_ms(86400)
+    sums = ("COALESCE(SUM(packets), 0), SUM(CASE WHEN decrypted = 1 THEN packets ELSE 0 END), "
+            "SUM(CASE WHEN decrypted = 0 THEN packets ELSE 0 END), "
+            "SUM(CASE WHEN key_used = 1 THEN packets ELSE 0 END), SUM(CASE WHEN key_used = 2 THEN packets ELSE 0 END)")
+    for sql, params in [
+        (f"SELECT {sums} FROM packets_raw_counts", ()),
+        (f"SELECT {sums} FROM packets_raw_counts WHERE ts >= ?", (since,)),
+        ("SELECT ts / 3600000, SUM(packets) FROM packets_raw_counts WHERE ts >= ? GROUP BY ts / 3600000", (since,)),
+        ("SELECT hop_limit, SUM(packets) FROM packets_raw_counts WHERE hop_limit IS NOT NULL GROUP BY hop_limit", ()),
+        ("SELECT SUM(size_sum) * 1.0 / SUM(sized), MIN(size_min), MAX(size_max) FROM packets_raw_counts WHERE sized > 0", ()),
+        ("SELECT COUNT(*), SUM(cnt) FROM (SELECT packet_id, COUNT(*) AS cnt FROM packets_raw "
+         "WHERE packet_id IS NOT NULL GROUP BY packet_id HAVING COUNT(*) > 1)", ()),
+        ("SELECT COUNT(DISTINCT packet_id) FROM packets_raw WHERE packet_id IS NOT NULL", ()),
+        ("SELECT COUNT(*) FROM packets_raw", ()),
+        ("SELECT SUM(CASE WHEN via_mqtt = 1 THEN packets ELSE 0 END) FROM packets_raw_counts", ()),
+    ]:
+        conn.execute(sql, params).fetchall()
+
+
+def timed(fn, runs):
+    """Best of `runs` wall-clock times of fn(), in ms."""
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dashboard API latency benchmarks")
+    parser.add_argument("--db", default="/tmp/mesh-bench.db", help="Benchmark database, built if missing (default /tmp/mesh-bench.db)")
+    parser.add_argument("--rows", type=int, default=2000000, help="traffic/packets_raw rows when building (default 2000000)")
+    parser.add_argument("--nodes", type=int, default=500, help="Nodes when building (default 500)")
+    parser.add_argument("--days", type=int, default=7, help="Days of history when building (default 7)")
+    parser.add_argument("--watch", type=int, default=50, help="Watched nodes for /api/watchlist (default 50)")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per measurement, best is reported (default 5)")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.db):
+        build(args.db, args.rows, args.nodes, args.days)
+    else:
+        # The webui opens it read-only; catch a database built by an older
+        # version up with the listener's schema first
+        conn = sqlite3.connect(args.db)
+        db._conn = conn
+        db.migrate()
+        conn.close()
+
+    webui.open_db(args.db)
+    conn = webui.get_db(args.db)
+    total = conn.execute("SELECT COUNT(*) FROM traffic").fetchone()[0]
+
+    # Watch a spread of busy and quiet nodes
+    nodes = [r[0] for r in conn.execute("SELECT printf('%08x', node_id) FROM node_summary ORDER BY packets DESC")]
+    watched = nodes[::max(1, len(nodes) // args.watch)][:args.watch]
+
+    client = webui.app.test_client()
+
+    def endpoint(url):
+        def run():
+            webui._cache.clear()
+            response = client.get(url)
+            assert response.status_code == 200, (url, response.status_code)
+        return run
+
+    cases = [
+        (f"/api/watchlist ({len(watched)} nodes)",
+         lambda: legacy_watchlist(conn, watched),
+         endpoint("/api/watchlist?nodes=" + ",".join(watched))),
+        ("/api/metrics/activity",
+         lambda: legacy_activity(conn),
+         endpoint("/api/metrics/activity")),
+        ("/api/metrics",
+         lambda: legacy_metrics(conn),
+         endpoint("/api/metrics")),
+    ]
+
+    print(f"{args.db}: {total} traffic rows, best of {args.runs} runs (ms)")
+    print(f"{'endpoint':<34} {'before':>10} {'after':>10}")
+    for name, before, after in cases:
+        print(f"{name:<34} {timed(before, args.runs):>10.1f} {timed(after, args.runs):>10.1f}")
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Check that the dashboard's SQL uses the indexes created by script/db.py.
+
+Every API endpoint is requested once through Flask's test client. Each SQL
+statement it runs is captured and its EXPLAIN QUERY PLAN printed. A full scan
+of traffic or packets_raw (one that isn't covered by an index) is flagged.
+
+Usage:
+    python3 query_plans.py [--db ../mesh.db] [--strict]
+
+--strict exits non-zero when anything is flagged, for use after schema changes.
+"""
+
+import argparse
+import os
+import re
+import sys
+
+import app as webui
+
+BIG_TABLES = ("traffic", "packets_raw")
+
+# Scans that no index can avoid, as (regex on the statement, reason). They're
+# printed but don't fail --strict.
+EXPECTED_SCANS = [
+    (r"FROM (traffic|packets_raw)_counts(?! WHERE ts >=)\b", "all-time totals"),
+]
+
+ENDPOINTS = [
+    "/api/nodes",
+    "/api/nodes?transport=rf",
+    "/api/nodes?since_id=1",
+    "/api/traffic",
+    "/api/traffic?msg_type=TEXT_MESSAGE_APP",
+    "/api/traffic?node=abc&transport=mqtt",
+    "/api/traffic?since_id=1",
+    "/api/search?q=abc",
+    "/api/positions",
+    "/api/positions?zoom=4",
+    "/api/positions?bbox=-10,-10,10,10&zoom=12",
+    "/api/positions?since_id=1&zoom=12",
+    "/api/tracks?node={node}&zoom=12",
+    "/api/watchlist?nodes={node}",
+    "/api/watchlist?nodes={node}&since_id=1",
+    "/api/stats",
+    "/api/stats?transport=rf",
+    "/api/node_telemetry?node={node}",
+    "/api/timeseries?node={node}&metric=battery_level",
+    "/api/timeseries?node={node}&metric=voltage&mode=lttb",
+    "/api/metrics",
+    "/api/metrics/activity",
+]
+
+
+def capture_statements(conn, node):
+    """Run every endpoint and return the distinct SQL statements, in order."""
+    statements = []
+    conn.set_trace_callback(lambda sql: statements.append(sql) if sql.lstrip().upper().startswith(("SELECT", "WITH")) else None)
+
+    client = webui.app.test_client()
+    try:
+        for endpoint in ENDPOINTS:
+            response = client.get(endpoint.format(node=node))
+            if response.status_code != 200:
+                print(f"[WARN] {endpoint} returned {response.status_code}")
+    finally:
+        conn.set_trace_callback(None)
+
+    seen = set()
+    unique = []
+    for sql in statements:
+        sql = " ".join(sql.split())
+        # The same statement with different bound numbers only needs explaining once
+        key = re.sub(r"\b\d+\b", "?", sql)
+        # Skip SQLite's own statements (schema lookups, R*Tree internals)
+        if key not in seen and "sqlite_master" not in key and "'main'." not in key:
+            seen.add(key)
+            unique.append(sql)
+    return unique
+
+
+def full_scans(sql, plan):
+    """Plan lines that scan a large table (or an alias of one) without an index."""
+    names = set(BIG_TABLES)
+    names.update(re.findall(r"\b(?:%s)\s+(?:AS\s+)?(?!WHERE|ORDER|GROUP|INNER|LEFT|JOIN|ON)(\w+)" % "|".join(BIG_TABLES), sql))
+    return [detail for detail in plan
+            if detail.startswith("SCAN ") and detail.split()[1] in names and "INDEX" not in detail]
+
+
+def expected_scan(sql, plan):
+    # Newest-first with a LIMIT: walking the rowid backwards stops after LIMIT matches
+    if re.search(r"ORDER BY (\w+\.)?id DESC LIMIT \d+$", sql) and "USE TEMP B-TREE FOR ORDER BY" not in plan:
+        return "newest rows, walks the rowid backwards"
+    for pattern, reason in EXPECTED_SCANS:
+        if re.search(pattern, sql):
+            return reason
+    return None
+
+
+def main():
+    default_db = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "mesh.db"))
+
+    parser = argparse.ArgumentParser(description="Show query plans for the dashboard's SQL")
+    parser.add_argument("--db", default=default_db, help=f"Path to mesh.db (default {default_db})")
+    parser.add_argument("--strict", action="store_true", help="Exit 1 if any query fully scans a large table")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.db):
+        print(f"Error: database not found: {args.db}", file=sys.stderr)
+        sys.exit(1)
+
+    # The test client's requests run on this thread, so they all check this
+    # connection back out of the webui's pool
+    webui.open_db(args.db)
+    with webui.app.app_context():
+        conn = webui.db()
+
+    row = conn.execute("SELECT printf('%08x', source_id) FROM traffic ORDER BY id DESC LIMIT 1").fetchone()
+    node = row[0] if row else "00000000"
+
+    flagged = 0
+    for sql in capture_statements(conn, node):
+        plan = [r[3] for r in conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()]
+
+        status = "[OK]  "
+        if full_scans(sql, plan):
+            reason = expected_scan(sql, plan)
+            if reason:
+                status = f"[SCAN] ({reason})"
+            else:
+                status = "[WARN]"
+                flagged += 1
+
+        print(f"{status} {sql}")
+        for detail in plan:
+            print(f"         {detail}")
+
+    print(f"\n{flagged} queries with full table scans")
+    if args.strict and flagged:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
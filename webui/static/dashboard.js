@@ -174,7 +174,12 @@
     // ── State ────────────────────────────────────────────────────────────────
     var map = null;
     var markers = {};
+    var clusterMarkers = [];
     var mapInitialized = false;
+    var positionsTimer = null;
+    var pendingPopup = null;
+    // Track of one node drawn from /api/tracks: { nodeId, line }
+    var track = null;
     var knownMsgTypes = new Set();
     var debounceTimer = null;
     var currentTileLayer = null;
@@ -191,7 +196,7 @@
     var nodeFilterText = "";
     var nodeFilterTimer = null;
 
-    // Positions cache: { node_id: { latitude, longitude, timestamp } }
+    // Positions cache from /api/nodes: { node_id: { latitude, longitude, timestamp, ... } }
     var positionsMap = {};
 
     // Watch list (array of node_id strings)
@@ -200,6 +205,20 @@
     // Transport filter state
     var transportFilter = "";
 
+    // Live updates from /api/stream; polling is only the fallback
+    var stream = null;
+    var POLL_INTERVAL = 10000;
+    // Windowed aggregates (24h counts, charts, activity) can't be updated from
+    // deltas, so they are reloaded in full this often
+    var RESYNC_INTERVAL = 300000;
+    var TRAFFIC_ROWS = 50;
+    var lastStats = null;
+    var lastMetrics = null;
+    var watchListTimer = null;
+    // since_id cursors of the last traffic, nodes, positions and watchlist fetches
+    var cursors = {};
+    var watchListItems = [];
+
     // ── Init ─────────────────────────────────────────────────────────────────
     function init() {
         // Load watch list from localStorage
@@ -213,6 +232,13 @@
         map = L.map("map", { zoomControl: true }).setView([39.8, -98.5], 4);
         setMapTheme(savedTheme);
 
+        // Markers are fetched for the visible area only, so refetch after pans and zooms
+        map.on("moveend", function () {
+            if (!mapInitialized) return;
+            clearTimeout(positionsTimer);
+            positionsTimer = setTimeout(fetchPositions, 250);
+        });
+
         // Wire up star buttons inside map popups
         map.on("popupopen", function (e) {
             var btn = e.popup.getElement().querySelector(".popup-star");
@@ -226,6 +252,13 @@
                     this.className = (starred ? "star-btn starred" : "star-btn") + " popup-star";
                 });
             }
+            var trackBtn = e.popup.getElement().querySelector(".popup-track");
+            if (trackBtn) {
+                trackBtn.addEventListener("click", function (ev) {
+                    ev.preventDefault();
+                    toggleTrack(this.getAttribute("data-node"));
+                });
+            }
         });
 
         // Set theme dropdown to saved value
@@ -264,7 +297,8 @@
         transportSelect.addEventListener("change", function () {
             transportFilter = this.value;
             localStorage.setItem("meshTransportFilter", transportFilter);
-            refresh();
+            // The stream is per transport; its hello event reloads everything
+            if (stream) connectStream(); else refresh();
         });
 
         // Sidebar toggle
@@ -275,8 +309,14 @@
         // Initialize sort headers
         initSortHeaders();
 
-        refresh();
-        setInterval(refresh, 10000);
+        if (window.EventSource) {
+            connectStream();
+            setInterval(refresh, RESYNC_INTERVAL);
+        } else {
+            refresh();
+            setInterval(poll, POLL_INTERVAL);
+            setInterval(refresh, RESYNC_INTERVAL);
+        }
     }
 
     // ── Map Theme ────────────────────────────────────────────────────────────
@@ -368,6 +408,99 @@
             "Updated " + new Date().toLocaleTimeString();
     }
 
+    // Polling fallback: only what changed since the last cursors
+    function poll() {
+        fetchStats();
+        fetchNodes(true);
+        fetchTraffic(true);
+        fetchPositions(true);
+        fetchWatchList(true);
+        document.getElementById("last-update").textContent =
+            "Updated " + new Date().toLocaleTimeString();
+    }
+
+    // ── Live Stream ──────────────────────────────────────────────────────────
+    // /api/stream sends {"hello": true} on every (re)connect and {"resync": true}
+    // after a burst too large to send as a delta; both reload everything. Other
+    // events carry new traffic rows, updated node entries and counter increments.
+    function connectStream() {
+        if (stream) stream.close();
+        var url = "/api/stream";
+        if (transportFilter) url += "?transport=" + encodeURIComponent(transportFilter);
+        stream = new EventSource(url);
+        stream.onmessage = function (e) {
+            var delta = JSON.parse(e.data);
+            if (delta.hello || delta.resync) {
+                refresh();
+            } else {
+                applyDelta(delta);
+            }
+        };
+    }
+
+    function applyDelta(delta) {
+        // Traffic feed (the stream sends oldest first)
+        mergeTraffic(delta.traffic.filter(matchesTrafficFilters).reverse());
+
+        // Node directory and map
+        if (delta.nodes.length > 0) {
+            onlineNodeCount = delta.nodes[0].online_nodes;
+            updateOnlineCount();
+        }
+        if (mergeNodes(delta.nodes)) {
+            clearTimeout(positionsTimer);
+            positionsTimer = setTimeout(function () { fetchPositions(true); }, 1000);
+        }
+
+        // Stats counters
+        if (lastStats) {
+            lastStats.total_nodes = delta.stats.total_nodes;
+            lastStats.total_packets += delta.stats.packets;
+            lastStats.packets_24h += delta.stats.packets;
+            Object.keys(delta.stats.by_type).forEach(function (t) {
+                lastStats.by_type[t] = (lastStats.by_type[t] || 0) + delta.stats.by_type[t];
+            });
+            renderStats(lastStats);
+        }
+
+        // RF counters
+        if (lastMetrics && lastMetrics.rf_totals && delta.rf.total > 0) {
+            ["total", "decrypted", "undecrypted", "public", "private"].forEach(function (k) {
+                lastMetrics.rf_totals[k] += delta.rf[k];
+                lastMetrics.rf_totals_24h[k] += delta.rf[k];
+            });
+            lastMetrics.via_mqtt += delta.rf.via_mqtt;
+            renderRfMetrics(lastMetrics);
+            renderPacketDetails(lastMetrics);
+        }
+
+        // Watch list: reload only when a watched node was involved
+        var watched = delta.traffic.some(function (r) {
+            return watchList.indexOf(r.source_id) !== -1 || watchList.indexOf(r.dest_id) !== -1;
+        });
+        if (watched) {
+            clearTimeout(watchListTimer);
+            watchListTimer = setTimeout(function () { fetchWatchList(true); }, 1000);
+        }
+
+        document.getElementById("last-update").textContent =
+            "Updated " + new Date().toLocaleTimeString();
+    }
+
+    // Client-side version of /api/traffic's msg_type and node filters: every word
+    // of the node filter must start a word of the source/dest ID or name
+    function matchesTrafficFilters(r) {
+        var msgType = document.getElementById("filter-type").value;
+        if (msgType && r.msg_type !== msgType) return false;
+
+        var words = document.getElementById("filter-node").value.toLowerCase().match(/\w+/g);
+        if (!words) return true;
+        var haystack = [r.source_id, r.source_name, r.dest_id, r.dest_name].join(" ").toLowerCase().match(/\w+/g) || [];
+        return words.every(function (w) {
+            return haystack.some(function (h) { return h.indexOf(w) === 0; });
+        });
+    }
+
     // ── Fetch helpers ────────────────────────────────────────────────────────
     function fetchJSON(url, callback) {
         fetch(url)
@@ -381,34 +514,39 @@
         var url = "/api/stats";
         if (transportFilter) url += "?transport=" + encodeURIComponent(transportFilter);
         fetchJSON(url, function (data) {
-            document.getElementById("stat-nodes").textContent = data.total_nodes;
-            document.getElementById("stat-packets").textContent = data.total_packets.toLocaleString();
-            document.getElementById("stat-24h").textContent = data.packets_24h.toLocaleString();
+            lastStats = data;
+            renderStats(data);
+        });
+    }
 
-            var list = document.getElementById("by-type-list");
-            var types = data.by_type || {};
-            var keys = Object.keys(types);
+    function renderStats(data) {
+        document.getElementById("stat-nodes").textContent = data.total_nodes;
+        document.getElementById("stat-packets").textContent = data.total_packets.toLocaleString();
+        document.getElementById("stat-24h").textContent = data.packets_24h.toLocaleString();
 
-            if (keys.length === 0) {
-                list.innerHTML = '<li class="muted">No data yet</li>';
-                return;
-            }
+        var list = document.getElementById("by-type-list");
+        var types = data.by_type || {};
+        var keys = Object.keys(types).sort(function (a, b) { return types[b] - types[a]; });
 
-            list.innerHTML = keys.map(function (t) {
-                return '<li><span class="badge ' + badgeClass(t) + '">' +
-                    esc(t) + '</span><span>' + types[t].toLocaleString() + '</span></li>';
-            }).join("");
+        if (keys.length === 0) {
+            list.innerHTML = '<li class="muted">No data yet</li>';
+            return;
+        }
 
-            // Update filter dropdown with any new types
-            keys.forEach(function (t) {
-                if (!knownMsgTypes.has(t)) {
-                    knownMsgTypes.add(t);
-                    var opt = document.createElement("option");
-                    opt.value = t;
-                    opt.textContent = t;
-                    document.getElementById("filter-type").appendChild(opt);
-                }
-            });
+        list.innerHTML = keys.map(function (t) {
+            return '<li><span class="badge ' + badgeClass(t) + '">' +
+                esc(t) + '</span><span>' + types[t].toLocaleString() + '</span></li>';
+        }).join("");
+
+        // Update filter dropdown with any new types
+        keys.forEach(function (t) {
+            if (!knownMsgTypes.has(t)) {
+                knownMsgTypes.add(t);
+                var opt = document.createElement("option");
+                opt.value = t;
+                opt.textContent = t;
+                document.getElementById("filter-type").appendChild(opt);
+            }
         });
     }
 
@@ -504,45 +642,74 @@
     }
 
     // ── Nodes ────────────────────────────────────────────────────────────────
-    function fetchNodes() {
-        var url = "/api/nodes";
-        if (transportFilter) url += "?transport=" + encodeURIComponent(transportFilter);
-        fetchJSON(url, function (rows) {
-            // Capture online node count
-            if (rows.length > 0 && rows[0].online_nodes != null) {
-                onlineNodeCount = rows[0].online_nodes;
-            } else {
-                onlineNodeCount = 0;
-            }
+    // Everything, or with incremental only the nodes changed since the last fetch
+    function fetchNodes(incremental) {
+        incremental = incremental && cursors.nodes != null;
+        var url = "/api/nodes?since_id=" + (incremental ? cursors.nodes : 0);
+        if (transportFilter) url += "&transport=" + encodeURIComponent(transportFilter);
+        fetchJSON(url, function (data) {
+            cursors.nodes = data.cursor;
+            onlineNodeCount = data.online_nodes;
             updateOnlineCount();
 
-            nodesData = rows.map(function (n) {
-                var hw = n.hw_model != null ? (HW_MODELS[n.hw_model] || ("ID " + n.hw_model)) : "\u2014";
-                // A node is "never heard from" if it has no activity in the traffic table
-                // (it was only seen as a destination in someone else's packet)
-                var neverHeard = !n.last_activity;
-                return {
-                    node_id: n.node_id,
-                    long_name: n.long_name,
-                    short_name: n.short_name,
-                    cols: [n.node_id, n.long_name || n.short_name || n.node_id, hw, n.first_seen || "", n.last_seen || ""],
-                    hw: hw,
-                    first_seen: n.first_seen,
-                    last_seen: n.last_seen,
-                    last_activity: n.last_activity,
-                    last_nodeinfo: n.last_nodeinfo,
-                    never_heard: neverHeard,
-                    mqtt_count: n.mqtt_count || 0,
-                    direct_rf_count: n.direct_rf_count || 0,
-                    rf_count: n.rf_count || 0,
-                    last_rf: n.last_rf,
-                    last_mqtt: n.last_mqtt
-                };
+            if (incremental) {
+                mergeNodes(data.nodes);
+                return;
+            }
+
+            positionsMap = {};
+            data.nodes.forEach(function (n) {
+                if (n.position) positionsMap[n.node_id] = n.position;
             });
+
+            nodesData = data.nodes.map(nodeEntry);
             renderNodes();
         });
     }
 
+    // Replace or add /api/nodes entries; true if one got a new position inside the map view
+    function mergeNodes(entries) {
+        var movedInView = false;
+        entries.forEach(function (n) {
+            var old = positionsMap[n.node_id];
+            if (n.position) {
+                positionsMap[n.node_id] = n.position;
+                if ((!old || old.timestamp !== n.position.timestamp) && mapInitialized &&
+                        map.getBounds().contains([n.position.latitude, n.position.longitude])) {
+                    movedInView = true;
+                }
+            }
+            nodesData = nodesData.filter(function (d) { return d.node_id !== n.node_id; });
+            nodesData.unshift(nodeEntry(n));
+        });
+        if (entries.length > 0) renderNodes();
+        return movedInView;
+    }
+
+    // Directory row data for an /api/nodes entry
+    function nodeEntry(n) {
+        var hw = n.hw_model != null ? (HW_MODELS[n.hw_model] || ("ID " + n.hw_model)) : "\u2014";
+        // A node is "never heard from" if it has no activity in the traffic table
+        // (it was only seen as a destination in someone else's packet)
+        var neverHeard = !n.last_activity;
+        return {
+            node_id: n.node_id,
+            long_name: n.long_name,
+            short_name: n.short_name,
+            cols: [n.node_id, n.long_name || n.short_name || n.node_id, hw, n.first_seen || "", n.last_seen || ""],
+            hw: hw,
+            first_seen: n.first_seen,
+            last_seen: n.last_seen,
+            last_activity: n.last_activity,
+            last_nodeinfo: n.last_nodeinfo,
+            never_heard: neverHeard,
+            mqtt_count: n.mqtt_count || 0,
+            direct_rf_count: n.direct_rf_count || 0,
+            rf_count: n.rf_count || 0,
+            last_rf: n.last_rf,
+            last_mqtt: n.last_mqtt
+        };
+    }
 
     function renderNodes() {
         var tbody = document.querySelector("#nodes-table tbody");
@@ -670,29 +837,50 @@
     }
 
     // ── Traffic ──────────────────────────────────────────────────────────────
-    function fetchTraffic() {
-        var params = [];
+    // Everything, or with incremental only the rows added since the last fetch
+    function fetchTraffic(incremental) {
+        incremental = incremental && cursors.traffic != null;
+        var params = ["since_id=" + (incremental ? cursors.traffic : 0)];
         var msgType = document.getElementById("filter-type").value;
         var node = document.getElementById("filter-node").value.trim();
         if (msgType) params.push("msg_type=" + encodeURIComponent(msgType));
         if (node) params.push("node=" + encodeURIComponent(node));
         if (transportFilter) params.push("transport=" + encodeURIComponent(transportFilter));
 
-        var url = "/api/traffic" + (params.length ? "?" + params.join("&") : "");
-        fetchJSON(url, function (rows) {
-            trafficData = rows.map(function (r) {
-                var src = r.source_name || r.source_id || "";
-                var dst = r.dest_name || r.dest_id || "";
-                var dataStr = truncate(r.data || "", 60);
-                return {
-                    _raw: r,
-                    cols: [r.timestamp || "", src, dst, r.msg_type || "", r.channel_name || "", dataStr]
-                };
-            });
-            renderTraffic();
+        var url = "/api/traffic?" + params.join("&");
+        fetchJSON(url, function (data) {
+            cursors.traffic = data.cursor;
+            if (incremental) {
+                mergeTraffic(data.traffic);
+            } else {
+                trafficData = data.traffic.map(trafficEntry);
+                renderTraffic();
+            }
         });
     }
 
+    // Prepend rows (newest first), skipping any a concurrent full fetch already has
+    function mergeTraffic(rows) {
+        var known = {};
+        trafficData.forEach(function (item) { known[item._raw.id] = true; });
+        var added = rows.filter(function (r) { return !known[r.id]; }).map(trafficEntry);
+        if (added.length > 0) {
+            trafficData = added.concat(trafficData).slice(0, TRAFFIC_ROWS);
+            renderTraffic();
+        }
+    }
+
+    // Feed row data for an /api/traffic row
+    function trafficEntry(r) {
+        var src = r.source_name || r.source_id || "";
+        var dst = r.dest_name || r.dest_id || "";
+        var dataStr = truncate(r.data || "", 60);
+        return {
+            _raw: r,
+            cols: [r.timestamp || "", src, dst, r.msg_type || "", r.channel_name || "", dataStr]
+        };
+    }
+
     function renderTraffic() {
         var tbody = document.querySelector("#traffic-table tbody");
         var rows = trafficData;
@@ -791,157 +979,179 @@
         fetchWatchList();
     }
 
-    function fetchWatchList() {
+    // Every watched node, or with incremental only those with traffic since the last fetch
+    function fetchWatchList(incremental) {
         var container = document.getElementById("watchlist-container");
 
         if (watchList.length === 0) {
+            watchListItems = [];
             container.innerHTML = '<p class="muted watchlist-empty">Click the star icon on any node to add it here</p>';
             return;
         }
 
-        var url = "/api/watchlist?nodes=" + encodeURIComponent(watchList.join(","));
-        fetchJSON(url, function (items) {
-            if (!items || items.length === 0) {
-                container.innerHTML = '<p class="muted watchlist-empty">No data for watched nodes</p>';
+        incremental = incremental && cursors.watchlist != null;
+        var url = "/api/watchlist?nodes=" + encodeURIComponent(watchList.join(",")) +
+            "&since_id=" + (incremental ? cursors.watchlist : 0);
+        fetchJSON(url, function (data) {
+            cursors.watchlist = data.cursor;
+            if (!incremental) {
+                watchListItems = data.watchlist;
+            } else if (data.watchlist.length > 0) {
+                var changed = {};
+                data.watchlist.forEach(function (item) { changed[item.node.node_id] = item; });
+                watchListItems = watchListItems.map(function (item) {
+                    return changed[item.node.node_id] || item;
+                });
+            } else {
                 return;
             }
+            renderWatchList(watchListItems);
+        });
+    }
 
-            container.innerHTML = items.map(function (item) {
-                var node = item.node || {};
-                // Check if this watched node has never been heard from
-                var wlNeverHeard = false;
-                for (var wi = 0; wi < nodesData.length; wi++) {
-                    if (nodesData[wi].node_id === node.node_id) {
-                        wlNeverHeard = nodesData[wi].never_heard;
-                        break;
-                    }
+    function renderWatchList(items) {
+        var container = document.getElementById("watchlist-container");
+        if (!items || items.length === 0) {
+            container.innerHTML = '<p class="muted watchlist-empty">No data for watched nodes</p>';
+            return;
+        }
+
+        container.innerHTML = items.map(function (item) {
+            var node = item.node || {};
+            // Check if this watched node has never been heard from
+            var wlNeverHeard = false;
+            for (var wi = 0; wi < nodesData.length; wi++) {
+                if (nodesData[wi].node_id === node.node_id) {
+                    wlNeverHeard = nodesData[wi].never_heard;
+                    break;
                 }
-                var nameHtml = displayNodeName(node.long_name, node.short_name, node.node_id, wlNeverHeard);
-                var hw = node.hw_model != null ? (HW_MODELS[node.hw_model] || ("ID " + node.hw_model)) : "\u2014";
-                var lastSeen = node.last_seen ? fmtTime(node.last_seen) : "\u2014";
-
-                var posHtml = "";
-                if (item.position) {
-                    // Parse precision from the position data if available
-                    var wlPrec = null;
-                    // Check the cached positionsMap for extra fields
-                    var cachedPos = positionsMap[node.node_id];
-                    if (cachedPos && cachedPos.precision_bits != null) {
-                        wlPrec = cachedPos.precision_bits;
-                    }
-                    var precHtml = "";
-                    if (wlPrec != null) {
-                        precHtml = ' <span class="precision-badge">' + esc(precisionLabel(wlPrec)) + '</span>';
-                    }
-                    var altHtml = "";
-                    if (cachedPos && cachedPos.altitude != null) {
-                        altHtml = ' <span class="pos-detail">Alt: ' + cachedPos.altitude + 'm</span>';
-                    }
-                    var satsHtml = "";
-                    if (cachedPos && cachedPos.sats_in_view != null) {
-                        satsHtml = ' <span class="pos-detail">Sats: ' + cachedPos.sats_in_view + '</span>';
-                    }
-                    posHtml = '<div class="watchlist-card-position">' +
-                        '<a href="#" class="coord-link" data-lat="' + item.position.latitude + '" data-lng="' + item.position.longitude + '" data-node="' + esc(node.node_id || "") + '">' +
-                        item.position.latitude.toFixed(5) + ", " + item.position.longitude.toFixed(5) +
-                        '</a>' +
-                        " (" + fmtTime(item.position.timestamp) + ")" +
-                        precHtml + altHtml + satsHtml +
-                        '</div>';
+            }
+            var nameHtml = displayNodeName(node.long_name, node.short_name, node.node_id, wlNeverHeard);
+            var hw = node.hw_model != null ? (HW_MODELS[node.hw_model] || ("ID " + node.hw_model)) : "\u2014";
+            var lastSeen = node.last_seen ? fmtTime(node.last_seen) : "\u2014";
+
+            var posHtml = "";
+            if (item.position) {
+                // Parse precision from the position data if available
+                var wlPrec = null;
+                // Check the cached positionsMap for extra fields
+                var cachedPos = positionsMap[node.node_id];
+                if (cachedPos && cachedPos.precision_bits != null) {
+                    wlPrec = cachedPos.precision_bits;
+                }
+                var precHtml = "";
+                if (wlPrec != null) {
+                    precHtml = ' <span class="precision-badge">' + esc(precisionLabel(wlPrec)) + '</span>';
                 }
+                var altHtml = "";
+                if (cachedPos && cachedPos.altitude != null) {
+                    altHtml = ' <span class="pos-detail">Alt: ' + cachedPos.altitude + 'm</span>';
+                }
+                var satsHtml = "";
+                if (cachedPos && cachedPos.sats_in_view != null) {
+                    satsHtml = ' <span class="pos-detail">Sats: ' + cachedPos.sats_in_view + '</span>';
+                }
+                posHtml = '<div class="watchlist-card-position">' +
+                    '<a href="#" class="coord-link" data-lat="' + item.position.latitude + '" data-lng="' + item.position.longitude + '" data-node="' + esc(node.node_id || "") + '">' +
+                    item.position.latitude.toFixed(5) + ", " + item.position.longitude.toFixed(5) +
+                    '</a>' +
+                    " (" + fmtTime(item.position.timestamp) + ")" +
+                    precHtml + altHtml + satsHtml +
+                    '</div>';
+            }
 
-                var trafficHtml = "";
-                if (item.traffic && item.traffic.length > 0) {
-                    var entries = item.traffic.map(function (t) {
-                        var raw = t.data || "";
-                        var needsExpand = raw.length > 40;
-                        var preview = truncate(raw, 40);
-
-                        // For POSITION_APP, extract coords and add a map link
-                        var posLink = "";
-                        if (t.msg_type === "POSITION_APP" && raw) {
-                            try {
-                                var pd = JSON.parse(raw);
-                                var plat = pd.latitude || 0;
-                                var plng = pd.longitude || 0;
-                                if (plat !== 0 || plng !== 0) {
-                                    posLink = ' <a href="#" class="coord-link" data-lat="' + plat + '" data-lng="' + plng + '" data-node="' + esc(t.source_id || node.node_id || "") + '" title="Show on map">\u{1F4CD}</a>';
-                                }
-                            } catch (e) {}
-                        }
+            var trafficHtml = "";
+            if (item.traffic && item.traffic.length > 0) {
+                var entries = item.traffic.map(function (t) {
+                    var raw = t.data || "";
+                    var needsExpand = raw.length > 40;
+                    var preview = truncate(raw, 40);
+
+                    // For POSITION_APP, extract coords and add a map link
+                    var posLink = "";
+                    if (t.msg_type === "POSITION_APP" && raw) {
+                        try {
+                            var pd = JSON.parse(raw);
+                            var plat = pd.latitude || 0;
+                            var plng = pd.longitude || 0;
+                            if (plat !== 0 || plng !== 0) {
+                                posLink = ' <a href="#" class="coord-link" data-lat="' + plat + '" data-lng="' + plng + '" data-node="' + esc(t.source_id || node.node_id || "") + '" title="Show on map">\u{1F4CD}</a>';
+                            }
+                        } catch (e) {}
+                    }
 
-                        var dataHtml;
-                        if (needsExpand) {
-                            dataHtml = '<span class="watchlist-traffic-data expandable">' +
-                                '<span class="data-preview">' + esc(preview) + '</span>' +
-                                '<span class="data-full" style="display:none">' + esc(raw) + '</span>' +
-                                '</span>';
-                        } else {
-                            dataHtml = '<span class="watchlist-traffic-data">' + esc(raw) + '</span>';
-                        }
-                        var tLock = encryptionIcon(t.key_used);
-                        return '<div class="watchlist-traffic-entry">' +
-                            tLock +
-                            '<span class="watchlist-traffic-time">' + fmtTime(t.timestamp) + '</span>' +
-                            '<span class="badge ' + badgeClass(t.msg_type) + '">' + esc(t.msg_type) + '</span>' +
-                            dataHtml + posLink +
-                            '</div>';
-                    }).join("");
-
-                    trafficHtml = '<div class="watchlist-card-traffic">' +
-                        '<div class="watchlist-card-traffic-title">Recent Activity</div>' +
-                        entries +
+                    var dataHtml;
+                    if (needsExpand) {
+                        dataHtml = '<span class="watchlist-traffic-data expandable">' +
+                            '<span class="data-preview">' + esc(preview) + '</span>' +
+                            '<span class="data-full" style="display:none">' + esc(raw) + '</span>' +
+                            '</span>';
+                    } else {
+                        dataHtml = '<span class="watchlist-traffic-data">' + esc(raw) + '</span>';
+                    }
+                    var tLock = encryptionIcon(t.key_used);
+                    return '<div class="watchlist-traffic-entry">' +
+                        tLock +
+                        '<span class="watchlist-traffic-time">' + fmtTime(t.timestamp) + '</span>' +
+                        '<span class="badge ' + badgeClass(t.msg_type) + '">' + esc(t.msg_type) + '</span>' +
+                        dataHtml + posLink +
                         '</div>';
-                }
+                }).join("");
 
-                return '<div class="watchlist-card">' +
-                    '<div class="watchlist-card-header">' +
-                        '<div>' +
-                            '<div class="watchlist-card-name">' + nameHtml + '</div>' +
-                            '<div class="watchlist-card-id">' + esc(node.node_id || "") + '</div>' +
-                        '</div>' +
-                        '<button class="watchlist-remove-btn" data-node="' + esc(node.node_id || "") + '" title="Remove">\u2715</button>' +
-                    '</div>' +
-                    '<div class="watchlist-card-meta">' +
-                        '<span>' + esc(hw) + '</span>' +
-                        '<span>Last: ' + lastSeen + '</span>' +
-                    '</div>' +
-                    posHtml +
-                    trafficHtml +
+                trafficHtml = '<div class="watchlist-card-traffic">' +
+                    '<div class="watchlist-card-traffic-title">Recent Activity</div>' +
+                    entries +
                     '</div>';
-            }).join("");
+            }
 
-            // Attach remove handlers
-            container.querySelectorAll(".watchlist-remove-btn").forEach(function (btn) {
-                btn.addEventListener("click", function () {
-                    toggleWatch(this.getAttribute("data-node"));
-                });
-            });
+            return '<div class="watchlist-card">' +
+                '<div class="watchlist-card-header">' +
+                    '<div>' +
+                        '<div class="watchlist-card-name">' + nameHtml + '</div>' +
+                        '<div class="watchlist-card-id">' + esc(node.node_id || "") + '</div>' +
+                    '</div>' +
+                    '<button class="watchlist-remove-btn" data-node="' + esc(node.node_id || "") + '" title="Remove">\u2715</button>' +
+                '</div>' +
+                '<div class="watchlist-card-meta">' +
+                    '<span>' + esc(hw) + '</span>' +
+                    '<span>Last: ' + lastSeen + '</span>' +
+                '</div>' +
+                posHtml +
+                trafficHtml +
+                '</div>';
+        }).join("");
 
-            // Attach expand/collapse handlers on truncated data
-            container.querySelectorAll(".watchlist-traffic-data.expandable").forEach(function (el) {
-                el.addEventListener("click", function () {
-                    var preview = this.querySelector(".data-preview");
-                    var full = this.querySelector(".data-full");
-                    if (full.style.display === "none") {
-                        preview.style.display = "none";
-                        full.style.display = "";
-                    } else {
-                        preview.style.display = "";
-                        full.style.display = "none";
-                    }
-                });
+        // Attach remove handlers
+        container.querySelectorAll(".watchlist-remove-btn").forEach(function (btn) {
+            btn.addEventListener("click", function () {
+                toggleWatch(this.getAttribute("data-node"));
             });
+        });
 
-            // Attach coordinate link handlers
-            attachCoordLinks(container);
+        // Attach expand/collapse handlers on truncated data
+        container.querySelectorAll(".watchlist-traffic-data.expandable").forEach(function (el) {
+            el.addEventListener("click", function () {
+                var preview = this.querySelector(".data-preview");
+                var full = this.querySelector(".data-full");
+                if (full.style.display === "none") {
+                    preview.style.display = "none";
+                    full.style.display = "";
+                } else {
+                    preview.style.display = "";
+                    full.style.display = "none";
+                }
+            });
         });
+
+        // Attach coordinate link handlers
+        attachCoordLinks(container);
     }
 
     // ── Metrics ──────────────────────────────────────────────────────────────
     function fetchMetrics() {
         var tp = transportFilter ? "?transport=" + encodeURIComponent(transportFilter) : "";
         fetchJSON("/api/metrics" + tp, function (data) {
+            lastMetrics = data;
             renderRfMetrics(data);
             renderChannelUtil(data.channel_utilization || []);
             renderHourlyChart(data.hourly || []);
@@ -1158,13 +1368,13 @@
         if (telemetryCache[nodeId] === "loading") return;
         telemetryCache[nodeId] = "loading";
 
-        // Fetch telemetry and recent traffic in parallel
-        var telemDone = false, trafficDone = false;
-        var telemData = null, trafficItems = null;
+        // Fetch telemetry, battery history and recent traffic in parallel
+        var telemDone = false, trafficDone = false, historyDone = false;
+        var telemData = null, trafficItems = null, historyPoints = null;
 
         function tryRender() {
-            if (telemDone && trafficDone) {
-                telemetryCache[nodeId] = { telemetry: telemData, traffic: trafficItems };
+            if (telemDone && trafficDone && historyDone) {
+                telemetryCache[nodeId] = { telemetry: telemData, traffic: trafficItems, battery: historyPoints };
                 renderTelemetryRow(nodeId);
             }
         }
@@ -1180,6 +1390,15 @@
             trafficDone = true;
             tryRender();
         });
+
+        // Bucketed server-side: 84 points (2h each) whatever the reporting rate
+        var weekAgo = Math.floor(Date.now() / 1000) - 7 * 86400;
+        fetchJSON("/api/timeseries?node=" + encodeURIComponent(nodeId) +
+                  "&metric=battery_level&since=" + weekAgo + "&points=84", function (data) {
+            historyPoints = (data && data.points) ? data.points : [];
+            historyDone = true;
+            tryRender();
+        });
     }
 
     function toggleTelemetry(nodeId) {
@@ -1250,6 +1469,10 @@
             });
         }
 
+        if (cached.battery && cached.battery.length > 1) {
+            html += renderSparkline("Battery, last 7 days", cached.battery, "%");
+        }
+
         if (data.environment) {
             html += renderTelemetrySection("Environment", data.environment.data, data.environment.timestamp, {
                 temperature: { label: "Temp", unit: "\u00B0C" },
@@ -1376,6 +1599,30 @@
         }
     }
 
+    function renderSparkline(title, points, unit) {
+        // points: [{timestamp, min, avg, max}] from /api/timeseries (minmax mode)
+        var times = points.map(function (p) { return new Date(p.timestamp.replace(" ", "T")).getTime(); });
+        var t0 = times[0], t1 = times[times.length - 1];
+        var lo = Math.min.apply(null, points.map(function (p) { return p.min; }));
+        var hi = Math.max.apply(null, points.map(function (p) { return p.max; }));
+        var w = 300, h = 40;
+
+        function x(i) { return ((times[i] - t0) / ((t1 - t0) || 1) * w).toFixed(1); }
+        function y(v) { return (h - 2 - (v - lo) / ((hi - lo) || 1) * (h - 4)).toFixed(1); }
+
+        var line = points.map(function (p, i) { return x(i) + "," + y(p.avg); }).join(" ");
+        var band = points.map(function (p, i) { return x(i) + "," + y(p.max); })
+            .concat(points.map(function (p, i) { return x(i) + "," + y(p.min); }).reverse()).join(" ");
+
+        return '<div class="telemetry-section">' +
+            '<div class="telemetry-section-title">' + esc(title) +
+            ' <small class="muted">(' + lo + '\u2013' + hi + (unit ? " " + unit : "") + ')</small></div>' +
+            '<svg class="telemetry-sparkline" viewBox="0 0 ' + w + ' ' + h + '" preserveAspectRatio="none">' +
+            '<polygon class="sparkline-band" points="' + band + '"></polygon>' +
+            '<polyline class="sparkline-line" points="' + line + '"></polyline>' +
+            '</svg></div>';
+    }
+
     function renderTelemetrySection(title, data, timestamp, fieldDefs) {
         if (!data) return "";
         var items = "";
@@ -1415,31 +1662,48 @@
     }
 
     // ── Positions / Map ──────────────────────────────────────────────────────
-    function fetchPositions() {
-        fetchJSON("/api/positions", function (rows) {
-            if (rows.length === 0) return;
-
-            // Update positions cache
-            rows.forEach(function (p) {
-                positionsMap[p.source_id] = {
-                    latitude: p.latitude,
-                    longitude: p.longitude,
-                    timestamp: p.timestamp,
-                    precision_bits: p.precision_bits,
-                    altitude: p.altitude,
-                    sats_in_view: p.sats_in_view,
-                    ground_speed: p.ground_speed
-                };
+    // Markers for the visible area, or with incremental only nodes with a new fix since the last fetch
+    function fetchPositions(incremental) {
+        if (!mapInitialized) {
+            // Before the first fit, zoom 0 clusters give the extent of all nodes in a few entries
+            fetchJSON("/api/positions?zoom=0", function (rows) {
+                if (rows.length === 0) return;
+                var bounds = [];
+                rows.forEach(function (p) {
+                    if (p.cluster) {
+                        bounds.push([p.bounds[1], p.bounds[0]], [p.bounds[3], p.bounds[2]]);
+                    } else {
+                        bounds.push([p.latitude, p.longitude]);
+                    }
+                });
+                map.fitBounds(bounds, { padding: [30, 30], maxZoom: 14 });
+                mapInitialized = true;
+                fetchPositions();
             });
+            return;
+        }
 
-            // Re-render nodes to pick up pin icons
-            renderNodes();
+        incremental = incremental && cursors.positions != null;
+        var url = "/api/positions?bbox=" + map.getBounds().toBBoxString() + "&zoom=" + map.getZoom() +
+            "&since_id=" + (incremental ? cursors.positions : 0);
 
-            var bounds = [];
+        fetchJSON(url, function (data) {
+            cursors.positions = data.cursor;
+            var rows = data.positions;
+            // Not full: just the moved nodes, all other markers stay as they are
+            if (data.full) {
+                clusterMarkers.forEach(function (m) { map.removeLayer(m); });
+                clusterMarkers = [];
+            }
+            var seen = {};
 
             rows.forEach(function (p) {
+                if (p.cluster) {
+                    clusterMarkers.push(clusterMarker(p));
+                    return;
+                }
+                seen[p.source_id] = true;
                 var latlng = [p.latitude, p.longitude];
-                bounds.push(latlng);
 
                 var nameHtml;
                 if (p.source_name) {
@@ -1474,7 +1738,9 @@
                     esc(p.source_id) + "<br>" +
                     p.latitude.toFixed(5) + ", " + p.longitude.toFixed(5) + "<br>" +
                     detailHtml +
-                    '<small class="popup-pos-time">Position updated ' + fmtTime(p.timestamp) + '</small>';
+                    '<small class="popup-pos-time">Position updated ' + fmtTime(p.timestamp) + '</small>' +
+                    '<br><a href="#" class="popup-track" data-node="' + esc(p.source_id) + '">' +
+                    (track && track.nodeId === p.source_id ? "Hide track" : "Show 24h track") + '</a>';
 
                 // Determine marker color based on transport classification
                 var nodeData = null;
@@ -1508,18 +1774,67 @@
                 }
             });
 
-            if (!mapInitialized && bounds.length > 0) {
-                map.fitBounds(bounds, { padding: [30, 30], maxZoom: 14 });
-                mapInitialized = true;
+            // Drop nodes that left the view or were folded into a cluster
+            if (data.full) {
+                Object.keys(markers).forEach(function (id) {
+                    if (!seen[id]) {
+                        map.removeLayer(markers[id]);
+                        delete markers[id];
+                    }
+                });
+            }
+
+            if (pendingPopup && markers[pendingPopup]) {
+                markers[pendingPopup].openPopup();
+                pendingPopup = null;
             }
         });
     }
 
+    function toggleTrack(nodeId) {
+        var same = track && track.nodeId === nodeId;
+        if (track) {
+            map.removeLayer(track.line);
+            track = null;
+        }
+        if (same) return;
+
+        // Simplified server-side to about a pixel at the current zoom
+        fetchJSON("/api/tracks?node=" + encodeURIComponent(nodeId) + "&zoom=" + map.getZoom(), function (data) {
+            if (!data.points || data.points.length < 2) return;
+            var latlngs = data.points.map(function (p) { return [p.latitude, p.longitude]; });
+            track = {
+                nodeId: nodeId,
+                line: L.polyline(latlngs, { color: "#f0883e", weight: 3, opacity: 0.8 }).addTo(map)
+            };
+        });
+    }
+
+    function clusterMarker(c) {
+        var marker = L.circleMarker([c.latitude, c.longitude], {
+            radius: 8 + Math.min(12, 2 * Math.log2(c.count)),
+            color: "#58a6ff",
+            fillColor: "#58a6ff",
+            fillOpacity: 0.35,
+            weight: 1
+        }).addTo(map);
+        marker.bindTooltip(String(c.count), { permanent: true, direction: "center", className: "cluster-label" });
+        marker.on("click", function () {
+            // Zoom far enough in that the cluster splits up
+            map.fitBounds([[c.bounds[1], c.bounds[0]], [c.bounds[3], c.bounds[2]]],
+                          { padding: [30, 30], maxZoom: Math.max(map.getZoom() + 2, 10) });
+        });
+        return marker;
+    }
+
     // ── Pan to Node on Map ─────────────────────────────────────────────────
     function panToNode(lat, lng, nodeId) {
         map.setView([lat, lng], 15);
         if (nodeId && markers[nodeId]) {
             markers[nodeId].openPopup();
+        } else if (nodeId) {
+            // Not loaded yet: opened once the markers for the new view arrive
+            pendingPopup = nodeId;
         }
         // Scroll map panel into view on mobile/small screens
         document.getElementById("panel-map").scrollIntoView({ behavior: "smooth", block: "center" });